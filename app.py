@@ -1,20 +1,126 @@
 import sqlite3
 import json
+import base64
+import calendar
+import collections
+import contextlib
+import copy
+import cProfile
 import datetime
+import hashlib
+import itertools
 import os
 import re
+import threading
+import atexit
+import bisect
+import functools
+import time
+import zlib
 import requests
-from flask import Flask, request, jsonify, g
+from flask import Flask, Response, request, jsonify, g, has_app_context, stream_with_context
 from flask_cors import CORS
 
+try:
+    import orjson # Optional: several times faster JSON encoding for API responses
+except ImportError:
+    orjson = None
+try:
+    import brotli # Optional: enables "br" response compression
+except ImportError:
+    brotli = None
+
 app = Flask(__name__)
 CORS(app) # Enable CORS for all routes
 
-DATABASE = 'kairo_data.db' # Ensure this matches your file name
+DATABASE = os.environ.get('KAIRO_DATABASE', 'kairo_data.db') # Ensure this matches your file name (KAIRO_DATABASE overrides it)
 
 # Ollama API Configuration
-OLLAMA_URL = "http://localhost:11434/api/chat"
+OLLAMA_URL = os.environ.get('KAIRO_OLLAMA_URL', "http://localhost:11434/api/chat") # KAIRO_OLLAMA_URL points the app at another server
 OLLAMA_MODEL = "llama3.1:8b" # Make sure this model is pulled in your Ollama installation
+OLLAMA_CONNECT_TIMEOUT = 10 # Seconds to establish the connection to Ollama
+OLLAMA_TIMEOUT = 120 # Seconds to wait for a full response (or between streamed chunks)
+OLLAMA_MAX_CONCURRENCY = 2 # Concurrent inference requests sent to Ollama; the rest wait for a slot
+OLLAMA_MAX_QUEUE = 16 # Callers allowed to wait for a slot before new requests are shed with a "busy" reply
+OLLAMA_QUEUE_TIMEOUT = 30 # Seconds a caller waits for a slot before being shed
+OLLAMA_KEEP_ALIVE = "30m" # Keep the model (and its prompt cache) loaded between chat turns
+FAST_PATH_ENABLED = True # Parse common commands with deterministic rules before calling Ollama
+OLLAMA_STRUCTURED_OUTPUT = True # Send the action JSON schema as Ollama's "format" so decoding can only produce valid actions
+ACTION_REPAIR_ATTEMPTS = 1 # Re-prompts per invalid action fragment (only the fragment, never the conversation)
+ACTION_REPAIR_MAX_CHARS = 2000 # Longest unparseable model output quoted back in a repair prompt
+
+# Parsed Action Cache Configuration
+ACTION_CACHE_ENABLED = True
+ACTION_CACHE_SIZE = 1024 # Max cached parses (in memory and in the action_cache table)
+ACTION_CACHE_TTL_SECONDS = 24 * 60 * 60 # Keys include the date, so entries are at most useful for a day
+ACTION_CACHE_PRUNE_INTERVAL = 50 # Prune the action_cache table every N stores
+
+# List/Pagination Configuration
+MAX_PAGE_SIZE = 500 # Upper bound for the `limit` parameter on list routes
+RETRIEVE_ITEMS_LIMIT = 50 # Default number of items returned by the retrieve_items chat action
+BATCH_MAX_OPERATIONS = 500 # Max operations accepted by one /<items>/batch request
+CHANGE_LOG_RETENTION_DAYS = 30 # Clients that last synced before this get a full snapshot from /changes
+
+# Dashboard Cache Configuration
+DASHBOARD_CACHE_SIZE = 256 # Users whose dashboard counts are kept in memory
+DASHBOARD_CACHE_TTL_SECONDS = 60 # Overdue/upcoming counts change with the clock, so recompute at least this often
+
+# Conversation Memory Configuration
+HISTORY_TOKEN_BUDGET = 1500 # Approximate tokens of summary + recent turns replayed into the prompt
+HISTORY_MAX_MESSAGES = 20 # Most recent unsummarized rows read per chat turn
+HISTORY_SUMMARIZE_AFTER_MESSAGES = 24 # Roll older rows into the summary once this many are unsummarized...
+HISTORY_KEEP_RAW_MESSAGES = 12 # ...keeping this many newest rows verbatim
+HISTORY_SUMMARY_MAX_LINES = 40 # The summary keeps its newest lines (one per rolled-up row)
+HISTORY_SUMMARY_LINE_CHARS = 120
+HISTORY_ARCHIVE_AFTER_DAYS = 30 # Summarized rows older than this move to conversation_history_archive
+HISTORY_ARCHIVE_RETENTION_DAYS = 365 # Archived rows older than this are deleted (None keeps them forever)
+HISTORY_WRITE_BEHIND = True # Queue chat turns and write them in batches from a background thread
+HISTORY_FLUSH_BATCH_ROWS = 64 # Flush as soon as this many rows are queued...
+HISTORY_FLUSH_INTERVAL_SECONDS = 0.5 # ...or at least this often while any are
+HISTORY_QUEUE_MAX_ROWS = 4096 # Queued rows before a chat turn waits for room (backpressure)
+HISTORY_QUEUE_WAIT_SECONDS = 2 # How long it waits before flushing the queue itself
+
+# Background Job Configuration
+JOB_WORKERS = OLLAMA_MAX_CONCURRENCY # Worker threads running queued chat jobs; more would only wait for an Ollama slot
+JOB_MAX_ATTEMPTS = 3 # Jobs shed by a saturated Ollama are requeued up to this many times
+JOB_POLL_INTERVAL_SECONDS = 1.0 # Idle workers re-check the jobs table this often (enqueue also wakes them)
+JOB_RETENTION_HOURS = 24 # Finished jobs are deleted after this long
+JOB_HEARTBEAT_SECONDS = 10 # Each process refreshes heartbeat_at on the jobs it is running this often...
+JOB_ORPHANED_AFTER_SECONDS = 60 # ...so a 'running' job without a heartbeat for this long was left by a dead process
+
+# Agenda Configuration
+AGENDA_MAX_DAYS = 366 # Longest window /agenda expands
+AGENDA_MAX_OCCURRENCES_PER_ITEM = 1000 # Cap per recurring item and window (e.g. an hourly rule over a year)
+EVENT_DEFAULT_DURATION_MINUTES = 30 # Events without an end_datetime block this long for overlaps, free/busy and conflicts
+EVENT_INDEX_CACHE_SIZE = 256 # Users whose one-off event interval index is kept in memory
+CONFLICT_LOOKAHEAD_DAYS = 90 # How far ahead a recurring event's occurrences are checked for conflicts
+CONFLICT_MAX_REPORTED = 10 # Conflicts returned per checked event
+
+# Response Serialization Configuration
+JSON_STREAM_MIN_ITEMS = 500 # Top-level lists longer than this are streamed in chunks instead of built in one buffer
+COMPRESS_MIN_BYTES = 1024 # JSON bodies smaller than this are sent uncompressed
+COMPRESS_LEVEL = 6 # gzip level; brotli uses quality 5
+
+# Profiling Configuration
+PROFILE_ENABLED = os.environ.get('KAIRO_PROFILE') == '1' # Allow per-request cProfile dumps (?profile=1 or an X-Kairo-Profile: 1 header)
+PROFILE_DIR = os.environ.get('KAIRO_PROFILE_DIR', 'profiles') # Where the .prof files are written
+
+# SQLite Connection Pool Configuration
+DB_POOL_SIZE = 8 # Max idle connections kept open for reuse
+DB_BUSY_TIMEOUT_MS = 5000 # How long a writer waits for a lock before raising "database is locked"
+DB_CACHE_SIZE_KB = 20000 # Page cache per connection
+DB_MMAP_SIZE = 256 * 1024 * 1024 # Memory-mapped I/O window
+
+# Storage Sharding Configuration
+DB_SHARD_MODE = os.environ.get('KAIRO_DB_SHARD_MODE', 'none') # 'none' (everything in DATABASE), 'user' (a file per user_id) or 'hash' (DB_SHARD_COUNT files)
+DB_SHARD_COUNT = int(os.environ.get('KAIRO_DB_SHARD_COUNT', 16)) # Files in 'hash' mode; changing it means re-running split-database
+DB_SHARD_DIR = os.environ.get('KAIRO_DB_SHARD_DIR', 'kairo_shards') # Where shard files are created
+DB_SHARD_MAX_OPEN = 64 # Shards with open connections (least recently used ones are closed beyond this)
+DB_SHARD_POOL_SIZE = 2 # Idle connections kept per open shard
+
+# ID Generation Configuration
+ID_EPOCH_MS = 1704067200000 # 2024-01-01T00:00:00Z; ids carry milliseconds since then (good for ~69 years)
+ID_WORKER_ID = int(os.environ.get('KAIRO_WORKER_ID', -1)) # 0-1023 to pin this process's id space; -1 picks one at random
 
 # --- Custom Exception for API Errors ---
 class APIError(Exception):
@@ -24,92 +130,852 @@ class APIError(Exception):
         self.message = message
         self.status_code = status_code
 
+# --- Metrics ---
+# In-process counters and histograms, served in Prometheus text format on /metrics: per-route latency,
+# SQL statement timings (per statement kind and per request), Ollama latency and token counts, and
+# action JSON parse failures.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+SQL_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+def _format_metric_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + "}"
+
+class Metrics:
+    """Thread-safe registry of labelled counters and histograms, plus gauges read at scrape time."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._definitions = {} # name -> (type, help text, buckets)
+        self._counters = collections.defaultdict(float) # (name, labels) -> value
+        self._histograms = {} # (name, labels) -> [per-bucket counts (last is +Inf), sum, count]
+        self._gauge_collectors = []
+
+    def counter(self, name, help_text):
+        self._definitions[name] = ('counter', help_text, None)
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self._definitions[name] = ('histogram', help_text, buckets)
+
+    def gauges(self, collector):
+        """Registers a function returning [(name, help text, value)], called on every scrape."""
+        self._gauge_collectors.append(collector)
+        return collector
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] += amount
+
+    def observe(self, name, value, **labels):
+        buckets = self._definitions[name][2]
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            series = self._histograms.get(key)
+            if series is None:
+                series = self._histograms[key] = [[0] * (len(buckets) + 1), 0.0, 0]
+            series[0][bisect.bisect_left(buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, (list(series[0]), series[1], series[2])) for key, series in self._histograms.items())
+        lines = []
+        for name, (kind, help_text, buckets) in sorted(self._definitions.items()):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == 'counter':
+                lines.extend(f"{name}{_format_metric_labels(labels)} {value:g}"
+                             for (series_name, labels), value in counters if series_name == name)
+                continue
+            for (series_name, labels), (bucket_counts, total, count) in histograms:
+                if series_name != name:
+                    continue
+                cumulative = 0
+                for bound, bucket_count in zip([f"{bound:g}" for bound in buckets] + ["+Inf"], bucket_counts):
+                    cumulative += bucket_count
+                    lines.append(f"{name}_bucket{_format_metric_labels(labels + (('le', bound),))} {cumulative}")
+                lines.append(f"{name}_sum{_format_metric_labels(labels)} {total:.6f}")
+                lines.append(f"{name}_count{_format_metric_labels(labels)} {count}")
+        for collector in self._gauge_collectors:
+            for name, help_text, value in collector():
+                lines.extend([f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {value:g}"])
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+metrics.counter('kairo_http_requests_total', "HTTP requests by route, method and status.")
+metrics.histogram('kairo_http_request_duration_seconds', "Time to produce the response (streamed bodies excluded).")
+metrics.histogram('kairo_http_request_sql_statements', "SQL statements executed per request.", COUNT_BUCKETS)
+metrics.histogram('kairo_http_request_sql_seconds', "Time spent in SQLite per request.")
+metrics.histogram('kairo_sql_statement_duration_seconds', "SQLite execute/executemany/commit time by statement kind.", SQL_BUCKETS)
+metrics.histogram('kairo_ollama_slot_wait_seconds', "Time waiting for an inference slot.")
+metrics.histogram('kairo_ollama_request_duration_seconds', "Ollama /api/chat call time, by mode (chat or stream).")
+metrics.histogram('kairo_ollama_time_to_first_token_seconds',
+                  "Time to first token: measured for streams, Ollama's load + prompt eval time for non-streamed calls.")
+metrics.counter('kairo_ollama_prompt_tokens_total', "Prompt tokens evaluated by Ollama (prompt_eval_count).")
+metrics.counter('kairo_ollama_completion_tokens_total', "Tokens generated by Ollama (eval_count).")
+metrics.counter('kairo_action_parse_failures_total', "Model outputs that could not be parsed as an action JSON object.")
+metrics.counter('kairo_action_repairs_total',
+                "Action outputs fixed locally (trailing text, truncation, trailing commas) or by re-prompting one fragment.")
+metrics.counter('kairo_history_rows_flushed_total', "Conversation rows written by the write-behind history log.")
+metrics.histogram('kairo_history_flush_rows', "Rows written per write-behind flush.", COUNT_BUCKETS)
+
+@functools.lru_cache(maxsize=1024)
+def _sql_operation(sql):
+    words = sql.split(None, 1)
+    return words[0].upper() if words else "UNKNOWN"
+
+def record_sql_timing(sql, seconds):
+    """Records one statement in the SQL histogram and in the current request's (or job's) totals."""
+    metrics.observe('kairo_sql_statement_duration_seconds', seconds, operation=_sql_operation(sql))
+    if has_app_context():
+        g._sql_statements = g.get('_sql_statements', 0) + 1
+        g._sql_seconds = g.get('_sql_seconds', 0.0) + seconds
+
+def record_ollama_usage(mode, response_json):
+    """Records token counts (and, for non-streamed calls, Ollama's own time to first token) from a final response."""
+    metrics.inc('kairo_ollama_prompt_tokens_total', response_json.get("prompt_eval_count") or 0, mode=mode)
+    metrics.inc('kairo_ollama_completion_tokens_total', response_json.get("eval_count") or 0, mode=mode)
+    if mode == 'chat' and response_json.get("prompt_eval_duration") is not None:
+        first_token_ns = (response_json.get("load_duration") or 0) + response_json["prompt_eval_duration"]
+        metrics.observe('kairo_ollama_time_to_first_token_seconds', first_token_ns / 1e9, mode=mode)
+
 # --- Database Functions ---
+class InstrumentedConnection(sqlite3.Connection):
+    """sqlite3 connection that times execute, executemany and commit (rows fetched later are not included)."""
+    def execute(self, sql, parameters=()):
+        if self.atomic_depth and self.in_transaction and sql.lstrip()[:5].upper() == "BEGIN":
+            return self.cursor()
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            record_sql_timing(sql, time.perf_counter() - started)
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            record_sql_timing(sql, time.perf_counter() - started)
+
+    def commit(self):
+        if self.atomic_depth:
+            return # Deferred to the end of the atomic() block
+        started = time.perf_counter()
+        try:
+            return super().commit()
+        finally:
+            record_sql_timing("COMMIT", time.perf_counter() - started)
+
+    def rollback(self):
+        if self.atomic_depth:
+            self.atomic_rolled_back = True # Earlier writes in the block are gone; atomic() fails the whole block
+        return super().rollback()
+
+    atomic_depth = 0
+    atomic_rolled_back = False
+
+@contextlib.contextmanager
+def atomic(db):
+    """
+    Runs a block as one transaction even though the write helpers inside commit as they go: their
+    commits are deferred to the end of the block, and a BEGIN inside it joins the open transaction.
+    Everything is rolled back if the block raises or anything in it rolled back.
+    """
+    if db.atomic_depth:
+        db.atomic_depth += 1
+        try:
+            yield db
+        finally:
+            db.atomic_depth -= 1
+        return
+    db.commit()
+    db.execute("BEGIN IMMEDIATE")
+    db.atomic_depth, db.atomic_rolled_back = 1, False
+    try:
+        yield db
+    except BaseException:
+        db.atomic_depth = 0
+        db.rollback()
+        raise
+    db.atomic_depth = 0
+    if db.atomic_rolled_back:
+        db.rollback()
+        raise APIError("The changes could not be saved and were rolled back.", 500)
+    db.commit()
+
+class ConnectionPool:
+    """
+    Keeps tuned SQLite connections open between requests. A connection is checked out by one
+    worker thread for the duration of its app context and returned to the idle list afterwards.
+    """
+    def __init__(self, max_idle=DB_POOL_SIZE, path=None):
+        self.max_idle = max_idle
+        self.path = path # None means DATABASE
+        self._idle = []
+        self._closed = False
+        self._lock = threading.Lock()
+        self._stats = {"created": 0, "reused": 0, "closed": 0, "in_use": 0, "rolled_back": 0}
+
+    def _connect(self):
+        db = sqlite3.connect(self.path or DATABASE, timeout=DB_BUSY_TIMEOUT_MS / 1000, check_same_thread=False,
+                             factory=InstrumentedConnection)
+        db.row_factory = sqlite3.Row # This makes rows behave like dictionaries
+        # WAL lets readers proceed while a writer holds the lock; NORMAL is durable across app crashes in WAL mode
+        db.execute("PRAGMA journal_mode = WAL")
+        db.execute("PRAGMA synchronous = NORMAL")
+        db.execute(f"PRAGMA busy_timeout = {int(DB_BUSY_TIMEOUT_MS)}")
+        db.execute(f"PRAGMA cache_size = -{int(DB_CACHE_SIZE_KB)}")
+        db.execute(f"PRAGMA mmap_size = {int(DB_MMAP_SIZE)}")
+        db.execute("PRAGMA temp_store = MEMORY")
+        return db
+
+    def acquire(self):
+        with self._lock:
+            db = self._idle.pop() if self._idle else None
+            self._stats["in_use"] += 1
+            if db is not None:
+                self._stats["reused"] += 1
+                return db
+            self._stats["created"] += 1
+        try:
+            return self._connect()
+        except Exception:
+            with self._lock:
+                self._stats["in_use"] -= 1
+                self._stats["created"] -= 1
+            raise
+
+    def release(self, db):
+        if db.in_transaction:
+            # Never hand uncommitted work from a failed request to the next one
+            db.rollback()
+            with self._lock:
+                self._stats["rolled_back"] += 1
+        with self._lock:
+            self._stats["in_use"] -= 1
+            if len(self._idle) < self.max_idle and not self._closed:
+                self._idle.append(db)
+                return
+            self._stats["closed"] += 1
+        db.close()
+
+    def close_all(self, final=False):
+        """Closes the idle connections; with final=True, connections still checked out are closed on release."""
+        with self._lock:
+            self._closed = self._closed or final
+            idle, self._idle = self._idle, []
+            self._stats["closed"] += len(idle)
+        for db in idle:
+            db.close()
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self._stats, idle=len(self._idle), max_idle=self.max_idle)
+
+db_pool = ConnectionPool()
+atexit.register(db_pool.close_all)
+
 def get_db():
-    """Establishes a database connection or returns the existing one."""
+    """Checks a pooled database connection out for this app context or returns the existing one."""
     db = getattr(g, '_database', None)
     if db is None:
-        db = g._database = sqlite3.connect(DATABASE)
-        db.row_factory = sqlite3.Row # This makes rows behave like dictionaries
+        db = g._database = db_pool.acquire()
     return db
 
+# --- Storage Sharding ---
+# With DB_SHARD_MODE 'user' or 'hash', user data (SHARDED_TABLES) lives in per-user or per-hash-bucket
+# SQLite files under DB_SHARD_DIR, so writers for different users no longer wait on one file lock.
+# DATABASE keeps what is shared across users: the job queue, the parsed action cache and the schema
+# version of the main file. Each shard gets the full schema the first time this process opens it.
+# `flask --app app split-database` copies an existing single-file database into the shards.
+
+if DB_SHARD_MODE not in ('none', 'user', 'hash'):
+    raise ValueError(f"KAIRO_DB_SHARD_MODE must be 'none', 'user' or 'hash', not {DB_SHARD_MODE!r}")
+
+SHARDED_TABLES = ['tasks', 'events', 'courses', 'conversation_history', 'conversation_history_archive', 'processed_jobs',
+                  'conversation_memory', 'change_log', 'change_log_pruned']
+
+def shard_key_for_user(user_id):
+    """The shard a user's rows live in: a file-name-safe form of the id ('user' mode) or a hash bucket ('hash' mode)."""
+    digest = hashlib.sha1(str(user_id).encode('utf-8')).hexdigest()
+    if DB_SHARD_MODE == 'hash':
+        return f"shard_{int(digest[:8], 16) % DB_SHARD_COUNT:04d}"
+    # The digest suffix keeps ids that only differ in unsafe characters apart
+    return f"user_{re.sub(r'[^A-Za-z0-9_-]', '_', str(user_id))[:48]}_{digest[:8]}"
+
+class ShardRouter:
+    """
+    Connection pools for shard files, at most max_open of them open at once (least recently used
+    ones are closed). The schema is applied to a shard the first time this process opens it.
+    """
+    def __init__(self, max_open=DB_SHARD_MAX_OPEN):
+        self.max_open = max_open
+        self._pools = collections.OrderedDict() # shard key -> ConnectionPool, least recently used first
+        self._prepared = set()
+        self._lock = threading.Lock()
+        self._prepare_lock = threading.Lock()
+        self._stats = {"opened": 0, "evicted": 0, "schema_applied": 0}
+
+    def path(self, shard_key):
+        return os.path.join(DB_SHARD_DIR, f"{shard_key}.db")
+
+    def existing_keys(self):
+        """Shard keys with a file on disk."""
+        if not os.path.isdir(DB_SHARD_DIR):
+            return []
+        return sorted(name[:-3] for name in os.listdir(DB_SHARD_DIR) if name.endswith('.db'))
+
+    def acquire(self, shard_key):
+        """Checks out a connection to a shard; returns (pool, connection) for release()."""
+        evicted = None
+        with self._lock:
+            pool = self._pools.get(shard_key)
+            if pool is None:
+                os.makedirs(DB_SHARD_DIR, exist_ok=True)
+                pool = self._pools[shard_key] = ConnectionPool(DB_SHARD_POOL_SIZE, self.path(shard_key))
+                self._stats["opened"] += 1
+                if len(self._pools) > self.max_open:
+                    _, evicted = self._pools.popitem(last=False)
+                    self._stats["evicted"] += 1
+            else:
+                self._pools.move_to_end(shard_key)
+        if evicted is not None:
+            evicted.close_all(final=True)
+        db = pool.acquire()
+        if shard_key not in self._prepared:
+            try:
+                self._prepare(shard_key, db)
+            except Exception:
+                pool.release(db)
+                raise
+        return pool, db
+
+    def _prepare(self, shard_key, db):
+        with self._prepare_lock:
+            if shard_key in self._prepared:
+                return
+            create_schema(db)
+            prune_change_log(db)
+            prune_processed_jobs(db)
+            archive_conversation_history(db)
+            self._prepared.add(shard_key)
+            with self._lock:
+                self._stats["schema_applied"] += 1
+
+    def release(self, pool, db):
+        pool.release(db)
+
+    def close_all(self):
+        with self._lock:
+            pools, self._pools = list(self._pools.values()), collections.OrderedDict()
+        for pool in pools:
+            pool.close_all(final=True)
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self._stats, mode=DB_SHARD_MODE, open=len(self._pools), max_open=self.max_open,
+                        in_use=sum(pool.get_stats()["in_use"] for pool in self._pools.values()))
+
+shard_router = ShardRouter()
+atexit.register(shard_router.close_all)
+
+def get_user_db(user_id):
+    """
+    The connection holding user_id's tasks, events, courses and history: the main database, or the user's
+    shard when sharding is on. Checked out once per app context and shard, like get_db().
+    """
+    if DB_SHARD_MODE == 'none':
+        return get_db()
+    shard_key = shard_key_for_user(user_id)
+    shard_connections = g.setdefault('_shard_connections', {})
+    if shard_key not in shard_connections:
+        shard_connections[shard_key] = shard_router.acquire(shard_key)
+    return shard_connections[shard_key][1]
+
+@contextlib.contextmanager
+def shard_connection(shard_key):
+    """A shard connection outside the request cycle (maintenance commands)."""
+    pool, db = shard_router.acquire(shard_key)
+    try:
+        yield db
+    finally:
+        shard_router.release(pool, db)
+
 @app.teardown_appcontext
 def close_connection(exception):
-    """Closes the database connection at the end of the request."""
-    db = getattr(g, '_database', None)
+    """Returns the database connections (main and any shards) to their pools at the end of the request."""
+    db = g.pop('_database', None)
     if db is not None:
-        db.close()
+        db_pool.release(db)
+    for pool, shard_db in g.pop('_shard_connections', {}).values():
+        shard_router.release(pool, shard_db)
 
-def setup_database():
-    """Initializes the database schema for tasks, events, and courses."""
-    with app.app_context():
-        db = get_db()
-        cursor = db.cursor()
-
-        # Create tasks table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS tasks (
-                task_id TEXT PRIMARY KEY,
-                user_id TEXT NOT NULL,
-                title TEXT NOT NULL,
-                description TEXT,
-                due_datetime TEXT, -- ISO format:YYYY-MM-DDTHH:MM:SS
-                priority TEXT DEFAULT 'medium', -- e.g., low, medium, high
-                status TEXT DEFAULT 'pending', -- e.g., pending, in-progress, completed, cancelled
-                tags TEXT,        -- comma-separated tags
-                course_id TEXT,   -- Optional: Link to a course
-                parent_id TEXT,   -- Optional: For sub-tasks/dependencies
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                updated_at TEXT DEFAULT CURRENT_TIMESTAMP
-            );
-        ''')
+# --- Schema Migrations ---
+# Ordered list of (version, description, steps). Each step is either a SQL statement or a
+# callable taking the connection. Append new migrations with the next version number;
+# never edit a migration that has already shipped.
 
-        # Create events table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS events (
-                event_id TEXT PRIMARY KEY,
-                user_id TEXT NOT NULL,
-                title TEXT NOT NULL,
-                description TEXT,
-                start_datetime TEXT NOT NULL, -- ISO format
-                end_datetime TEXT,     -- ISO format
-                location TEXT,
-                attendees TEXT,        -- comma-separated emails
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                updated_at TEXT DEFAULT CURRENT_TIMESTAMP
-            );
-        ''')
+# Full-text search: FTS5 indexes over tasks, events and courses, kept in sync by triggers (see schema migrations 3 and 12).
+# They use the base tables as external content keyed by rowid, so the text is not stored twice.
+# After a VACUUM (which may renumber rowids) run `flask --app app rebuild-search-index`.
+# The index holds every user's text in a database file: user_id is an UNINDEXED column, so lookups filter
+# matches inside FTS5 but MATCH still reads every user's postings for a word. Per-user sharding
+# (KAIRO_DB_SHARD_MODE=user) is what keeps each index to one user's items.
 
-        # Create courses table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS courses (
-                course_id TEXT PRIMARY KEY,
-                user_id TEXT NOT NULL,
-                name TEXT NOT NULL,
-                description TEXT,
-                instructor TEXT,
-                schedule TEXT,      -- e.g., "Mon,Wed,Fri 09:00-10:00"
-                start_date TEXT,    -- YYYY-MM-DD
-                end_date TEXT,      -- YYYY-MM-DD
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                updated_at TEXT DEFAULT CURRENT_TIMESTAMP
-            );
-        ''')
+# kind -> (base table, fts table, id column, title column, indexed columns)
+SEARCH_TABLES = {
+    'tasks': ('tasks', 'tasks_fts', 'task_id', 'title', ['title', 'description']),
+    'events': ('events', 'events_fts', 'event_id', 'title', ['title', 'description', 'location']),
+    'courses': ('courses', 'courses_fts', 'course_id', 'name', ['name', 'description', 'instructor']),
+}
+search_index_state = {"available": False}
+
+def create_search_index(db, with_user_id=False):
+    """Migration step: creates the FTS5 tables and sync triggers and indexes existing rows."""
+    try:
+        db.execute("CREATE VIRTUAL TABLE IF NOT EXISTS temp.fts5_probe USING fts5(probe)")
+        db.execute("DROP TABLE temp.fts5_probe")
+    except sqlite3.OperationalError as e:
+        print(f"Warning: SQLite FTS5 is not available ({e}); keyword lookups will use LIKE scans.")
+        return
 
-        # Create conversation_history table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS conversation_history (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id TEXT NOT NULL,
-                sender TEXT NOT NULL, -- 'user' or 'kairo'
-                message TEXT NOT NULL,
-                timestamp TEXT DEFAULT CURRENT_TIMESTAMP,
-                parsed_action TEXT -- Store the JSON string of parsed action
-            );
+    for table, fts_table, _, _, columns in SEARCH_TABLES.values():
+        text_column_list = ", ".join(columns)
+        columns = (['user_id'] if with_user_id else []) + columns
+        column_list = ", ".join(columns)
+        new_values = ", ".join(f"new.{column}" for column in columns)
+        old_values = ", ".join(f"old.{column}" for column in columns)
+        declared_columns = "user_id UNINDEXED, " + text_column_list if with_user_id else text_column_list
+        db.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts_table} USING fts5({declared_columns}, content='{table}', "
+            f"content_rowid='rowid', tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+        )
+        db.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {fts_table}_after_insert AFTER INSERT ON {table} BEGIN
+                INSERT INTO {fts_table} (rowid, {column_list}) VALUES (new.rowid, {new_values});
+            END
         ''')
+        db.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {fts_table}_after_delete AFTER DELETE ON {table} BEGIN
+                INSERT INTO {fts_table} ({fts_table}, rowid, {column_list}) VALUES ('delete', old.rowid, {old_values});
+            END
+        ''')
+        db.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {fts_table}_after_update AFTER UPDATE OF {text_column_list} ON {table} BEGIN
+                INSERT INTO {fts_table} ({fts_table}, rowid, {column_list}) VALUES ('delete', old.rowid, {old_values});
+                INSERT INTO {fts_table} (rowid, {column_list}) VALUES (new.rowid, {new_values});
+            END
+        ''')
+        db.execute(f"INSERT INTO {fts_table} ({fts_table}) VALUES ('rebuild')")
+
+def add_user_id_to_search_index(db):
+    """Migration step: recreates the FTS5 tables with an UNINDEXED user_id column so lookups filter by user inside FTS5."""
+    for _, fts_table, _, _, _ in SEARCH_TABLES.values():
+        for trigger_event in ('insert', 'delete', 'update'):
+            db.execute(f"DROP TRIGGER IF EXISTS {fts_table}_after_{trigger_event}")
+        db.execute(f"DROP TABLE IF EXISTS {fts_table}")
+    create_search_index(db, with_user_id=True)
+
+def detect_search_index(db):
+    """Records whether the FTS5 tables exist so lookups know whether to use them."""
+    row = db.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = 'tasks_fts'").fetchone()
+    search_index_state["available"] = row[0] > 0
+
+# Change log: every insert/update/delete on tasks, events and courses appends a row (via triggers),
+# so the row's autoincrement version is a monotonically increasing per-user change version that
+# clients sync from with GET /changes?since=<version>.
+
+# kind -> (table, id column)
+ITEM_TABLES = {
+    'tasks': ('tasks', 'task_id'),
+    'events': ('events', 'event_id'),
+    'courses': ('courses', 'course_id'),
+}
 
+def create_change_log(db):
+    """Migration step: creates the change_log triggers and records existing rows as version 1..n upserts."""
+    for kind, (table, id_column) in ITEM_TABLES.items():
+        for trigger_event, row, operation in (("INSERT", "new", "upsert"), ("UPDATE", "new", "upsert"), ("DELETE", "old", "delete")):
+            db.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {table}_change_log_after_{trigger_event.lower()} AFTER {trigger_event} ON {table} BEGIN
+                    INSERT INTO change_log (user_id, item_type, item_id, operation)
+                    VALUES ({row}.user_id, '{kind}', {row}.{id_column}, '{operation}');
+                END
+            ''')
+        db.execute(
+            f"INSERT INTO change_log (user_id, item_type, item_id, operation) "
+            f"SELECT user_id, '{kind}', {id_column}, 'upsert' FROM {table} ORDER BY created_at"
+        )
+
+def prune_change_log(db):
+    """Drops change_log entries older than the retention window, remembering per user how far it was pruned."""
+    cutoff = (datetime.datetime.utcnow() - datetime.timedelta(days=CHANGE_LOG_RETENTION_DAYS)).strftime('%Y-%m-%d %H:%M:%S')
+    db.execute('''
+        INSERT OR REPLACE INTO change_log_pruned (user_id, pruned_through)
+        SELECT user_id, MAX(version) FROM change_log WHERE changed_at < ? GROUP BY user_id
+    ''', (cutoff,))
+    db.execute("DELETE FROM change_log WHERE changed_at < ?", (cutoff,))
+    db.commit()
+
+def archive_conversation_history(db):
+    """
+    Moves conversation_history rows older than HISTORY_ARCHIVE_AFTER_DAYS into conversation_history_archive
+    (only rows already folded into the user's summary), then drops archived rows past HISTORY_ARCHIVE_RETENTION_DAYS.
+    Returns the number of rows archived.
+    """
+    now = datetime.datetime.utcnow()
+    cutoff = (now - datetime.timedelta(days=HISTORY_ARCHIVE_AFTER_DAYS)).strftime('%Y-%m-%d %H:%M:%S')
+    archivable = '''
+        FROM conversation_history
+        WHERE timestamp < ?
+          AND id <= COALESCE((SELECT summarized_through_id FROM conversation_memory m WHERE m.user_id = conversation_history.user_id), 0)
+    '''
+    try:
+        db.execute("BEGIN IMMEDIATE")
+        cursor = db.execute(
+            f"INSERT OR IGNORE INTO conversation_history_archive (id, user_id, sender, message, timestamp, parsed_action) "
+            f"SELECT id, user_id, sender, message, timestamp, parsed_action {archivable}",
+            (cutoff,)
+        )
+        archived = cursor.rowcount
+        db.execute(f"DELETE FROM conversation_history WHERE id IN (SELECT id {archivable})", (cutoff,))
+        if HISTORY_ARCHIVE_RETENTION_DAYS is not None:
+            retention_cutoff = (now - datetime.timedelta(days=HISTORY_ARCHIVE_RETENTION_DAYS)).strftime('%Y-%m-%d %H:%M:%S')
+            db.execute("DELETE FROM conversation_history_archive WHERE timestamp < ?", (retention_cutoff,))
         db.commit()
-        print("Database initialized successfully.")
+    except sqlite3.Error:
+        db.rollback()
+        raise
+    return archived
+
+JOB_INTERRUPTED_ERROR = "Interrupted: the worker running this job stopped before it finished."
+
+def recover_interrupted_jobs(db, now=None):
+    """
+    Handles jobs left 'running' by a process that stopped heartbeating (crashed or killed): requeued while
+    attempts remain, otherwise failed as interrupted. Jobs of live workers, in any process, are left alone.
+    A requeued job whose action had already been applied is a no-op (see processed_jobs). The caller commits.
+    Returns (requeued, failed).
+    """
+    now = now or time.time()
+    orphaned = "status = 'running' AND COALESCE(heartbeat_at, started_at, 0) < ?"
+    stale_before = now - JOB_ORPHANED_AFTER_SECONDS
+    requeued = db.execute(
+        f"UPDATE jobs SET status = 'queued', started_at = NULL, claimed_by = NULL, heartbeat_at = NULL WHERE {orphaned} AND attempts < ?",
+        (stale_before, JOB_MAX_ATTEMPTS)
+    ).rowcount
+    failed = db.execute(
+        f"UPDATE jobs SET status = 'failed', error = ?, finished_at = ? WHERE {orphaned}", (JOB_INTERRUPTED_ERROR, now, stale_before)
+    ).rowcount
+    return requeued, failed
+
+def prune_finished_jobs(db):
+    """Deletes finished jobs past JOB_RETENTION_HOURS."""
+    db.execute("DELETE FROM jobs WHERE status IN ('succeeded', 'failed') AND finished_at < ?", (time.time() - JOB_RETENTION_HOURS * 3600,))
+    db.commit()
+
+def prune_processed_jobs(db):
+    """Deletes processed-job markers past JOB_RETENTION_HOURS (their jobs are gone by then)."""
+    db.execute("DELETE FROM processed_jobs WHERE processed_at < ?", (time.time() - JOB_RETENTION_HOURS * 3600,))
+    db.commit()
+
+# ISO datetime column -> integer shadow column with the same instant as Unix seconds (UTC). Range filters
+# and ordering use the integers; the ISO text is kept as written for the API. Naive strings are taken as
+# server-local time, which is how the app itself produces them.
+EPOCH_COLUMNS = {
+    'tasks': {'due_datetime': 'due_epoch'},
+    'events': {'start_datetime': 'start_epoch', 'end_datetime': 'end_epoch'},
+}
+
+def iso_to_epoch(value):
+    """Converts an ISO datetime or date (naive = local time, or with an offset) to Unix seconds; None if missing or invalid."""
+    if not value:
+        return None
+    try:
+        return int(datetime.datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp())
+    except (ValueError, TypeError, OverflowError, OSError):
+        return None
+
+def epoch_values(kind, fields):
+    """The shadow epoch values for whichever of a table's datetime columns appear in fields (already normalized)."""
+    return {epoch_column: iso_to_epoch(fields[column])
+            for column, epoch_column in EPOCH_COLUMNS.get(kind, {}).items() if column in fields}
+
+def backfill_epoch_columns(db):
+    """Migration step: fills the epoch shadow columns for existing rows."""
+    last_version = db.execute("SELECT COALESCE(MAX(version), 0) FROM change_log").fetchone()[0]
+    for table, columns in EPOCH_COLUMNS.items():
+        rows = db.execute(f"SELECT rowid, {', '.join(columns)} FROM {table}").fetchall()
+        db.executemany(
+            f"UPDATE {table} SET {', '.join(f'{epoch_column} = ?' for epoch_column in columns.values())} WHERE rowid = ?",
+            [[iso_to_epoch(row[position + 1]) for position in range(len(columns))] + [row[0]] for row in rows]
+        )
+    # The updates fired the change_log triggers, but nothing a client syncs has changed
+    db.execute("DELETE FROM change_log WHERE version > ?", (last_version,))
+
+SCHEMA_MIGRATIONS = [
+    (1, "Add per-user indexes for list, range and history queries", [
+        "CREATE INDEX IF NOT EXISTS idx_tasks_user_created ON tasks (user_id, created_at, task_id)",
+        "CREATE INDEX IF NOT EXISTS idx_tasks_user_status_created ON tasks (user_id, status, created_at, task_id)",
+        "CREATE INDEX IF NOT EXISTS idx_tasks_user_due ON tasks (user_id, due_datetime)",
+        "CREATE INDEX IF NOT EXISTS idx_events_user_created ON events (user_id, created_at, event_id)",
+        "CREATE INDEX IF NOT EXISTS idx_events_user_start ON events (user_id, start_datetime)",
+        "CREATE INDEX IF NOT EXISTS idx_courses_user_created ON courses (user_id, created_at, course_id)",
+        "CREATE INDEX IF NOT EXISTS idx_history_user_timestamp ON conversation_history (user_id, timestamp)",
+    ]),
+    (2, "Add action_cache table for persisted LLM parses", [
+        '''
+        CREATE TABLE IF NOT EXISTS action_cache (
+            cache_key TEXT PRIMARY KEY,
+            parsed_action TEXT NOT NULL, -- JSON string of the parsed action
+            created_at REAL NOT NULL     -- Unix timestamp
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_action_cache_created ON action_cache (created_at)",
+    ]),
+    (3, "Add FTS5 search index over task, event and course text", [
+        create_search_index,
+    ]),
+    (4, "Add change_log for incremental client sync", [
+        '''
+        CREATE TABLE IF NOT EXISTS change_log (
+            version INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT NOT NULL,
+            item_type TEXT NOT NULL, -- 'tasks', 'events' or 'courses'
+            item_id TEXT NOT NULL,
+            operation TEXT NOT NULL, -- 'upsert' or 'delete'
+            changed_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_change_log_user_version ON change_log (user_id, version)",
+        "CREATE INDEX IF NOT EXISTS idx_change_log_changed ON change_log (changed_at)",
+        '''
+        CREATE TABLE IF NOT EXISTS change_log_pruned (
+            user_id TEXT PRIMARY KEY,
+            pruned_through INTEGER NOT NULL -- Highest version deleted by prune_change_log
+        )
+        ''',
+        create_change_log,
+    ]),
+    (5, "Add indexes for dashboard aggregates", [
+        "CREATE INDEX IF NOT EXISTS idx_tasks_user_status_priority ON tasks (user_id, status, priority)",
+        "CREATE INDEX IF NOT EXISTS idx_tasks_user_updated ON tasks (user_id, updated_at)",
+        "CREATE INDEX IF NOT EXISTS idx_events_user_updated ON events (user_id, updated_at)",
+        "CREATE INDEX IF NOT EXISTS idx_courses_user_updated ON courses (user_id, updated_at)",
+    ]),
+    (6, "Add conversation memory summaries and history archive", [
+        "CREATE INDEX IF NOT EXISTS idx_history_user_id ON conversation_history (user_id, id)",
+        "CREATE INDEX IF NOT EXISTS idx_history_timestamp ON conversation_history (timestamp)",
+        '''
+        CREATE TABLE IF NOT EXISTS conversation_memory (
+            user_id TEXT PRIMARY KEY,
+            summary TEXT NOT NULL DEFAULT '', -- One line per rolled-up turn, oldest first
+            summarized_through_id INTEGER NOT NULL DEFAULT 0, -- Highest conversation_history.id folded into the summary
+            updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS conversation_history_archive (
+            id INTEGER PRIMARY KEY, -- Same id as the row had in conversation_history
+            user_id TEXT NOT NULL,
+            sender TEXT NOT NULL,
+            message TEXT NOT NULL,
+            timestamp TEXT,
+            parsed_action TEXT
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_history_archive_user_id ON conversation_history_archive (user_id, id)",
+        "CREATE INDEX IF NOT EXISTS idx_history_archive_timestamp ON conversation_history_archive (timestamp)",
+    ]),
+    (7, "Add jobs table for the background job queue", [
+        '''
+        CREATE TABLE IF NOT EXISTS jobs (
+            job_id TEXT PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            kind TEXT NOT NULL, -- e.g. 'chat'
+            payload TEXT NOT NULL, -- JSON arguments for the job handler
+            status TEXT NOT NULL, -- 'queued', 'running', 'succeeded' or 'failed'
+            result TEXT, -- JSON result once succeeded
+            error TEXT,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            created_at REAL NOT NULL, -- Unix timestamps
+            started_at REAL,
+            finished_at REAL
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_jobs_status_created ON jobs (status, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_jobs_status_finished ON jobs (status, finished_at)",
+    ]),
+    (8, "Add recurrence to tasks and events", [
+        "ALTER TABLE tasks ADD COLUMN recurrence TEXT", # RRULE-style, e.g. FREQ=WEEKLY;BYDAY=MO,WE
+        "ALTER TABLE events ADD COLUMN recurrence TEXT",
+        "CREATE INDEX IF NOT EXISTS idx_tasks_user_recurring ON tasks (user_id, due_datetime) WHERE recurrence IS NOT NULL",
+        "CREATE INDEX IF NOT EXISTS idx_events_user_recurring ON events (user_id, start_datetime) WHERE recurrence IS NOT NULL",
+    ]),
+    (9, "Add UTC epoch shadow columns for datetime range queries", [
+        "ALTER TABLE tasks ADD COLUMN due_epoch INTEGER",
+        "ALTER TABLE events ADD COLUMN start_epoch INTEGER",
+        "ALTER TABLE events ADD COLUMN end_epoch INTEGER",
+        backfill_epoch_columns,
+        # The ISO-text range indexes are replaced by integer ones
+        "DROP INDEX IF EXISTS idx_tasks_user_due",
+        "DROP INDEX IF EXISTS idx_events_user_start",
+        "DROP INDEX IF EXISTS idx_tasks_user_recurring",
+        "DROP INDEX IF EXISTS idx_events_user_recurring",
+        "CREATE INDEX IF NOT EXISTS idx_tasks_user_due_epoch ON tasks (user_id, due_epoch)",
+        "CREATE INDEX IF NOT EXISTS idx_events_user_start_epoch ON events (user_id, start_epoch)",
+        "CREATE INDEX IF NOT EXISTS idx_tasks_user_recurring_epoch ON tasks (user_id, due_epoch) WHERE recurrence IS NOT NULL",
+        "CREATE INDEX IF NOT EXISTS idx_events_user_recurring_epoch ON events (user_id, start_epoch) WHERE recurrence IS NOT NULL",
+    ]),
+    (10, "Add a span index so conflict checks can range-scan one-off events", [
+        # Finds a user's longest one-off event, which bounds how far back a start_epoch range has to reach
+        "CREATE INDEX IF NOT EXISTS idx_events_user_span ON events (user_id, end_epoch - start_epoch) WHERE recurrence IS NULL",
+    ]),
+    (11, "Add job heartbeats and processed-job markers", [
+        "ALTER TABLE jobs ADD COLUMN claimed_by TEXT", # Token of the process running the job
+        "ALTER TABLE jobs ADD COLUMN heartbeat_at REAL",
+        # Written in the same transaction as a job's action (in the user's database), so a replay is a no-op
+        '''
+        CREATE TABLE IF NOT EXISTS processed_jobs (
+            job_id TEXT PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            response TEXT NOT NULL, -- Kairo's reply before styling
+            parsed_action TEXT,
+            since_version INTEGER NOT NULL, -- Change version before the action, to rebuild the delta
+            processed_at REAL NOT NULL
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_processed_jobs_processed_at ON processed_jobs (processed_at)",
+    ]),
+    (12, "Add user_id to the FTS5 search index", [
+        add_user_id_to_search_index,
+    ]),
+]
+
+def get_schema_version(db):
+    """Returns the highest applied migration version, or 0 for a fresh database."""
+    return db.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+def run_migrations(db):
+    """Applies pending schema migrations in version order, each in its own transaction. Safe to run on every startup."""
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TEXT NOT NULL
+        );
+    ''')
+    db.commit()
+
+    current_version = get_schema_version(db)
+    for version, description, steps in sorted(SCHEMA_MIGRATIONS, key=lambda migration: migration[0]):
+        if version <= current_version:
+            continue
+        try:
+            db.execute("BEGIN")
+            for step in steps:
+                if callable(step):
+                    step(db)
+                else:
+                    db.execute(step)
+            db.execute(
+                "INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)",
+                (version, description, datetime.datetime.now().isoformat())
+            )
+            db.commit()
+        except Exception:
+            db.rollback()
+            print(f"Error: Schema migration {version} ({description}) failed; database left at version {current_version}.")
+            raise
+        current_version = version
+        print(f"Applied schema migration {version}: {description}")
+
+def create_schema(db):
+    """Creates the tables for tasks, events, courses and history and applies pending migrations (main database or a shard)."""
+    cursor = db.cursor()
+
+    # Create tasks table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS tasks (
+            task_id TEXT PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            title TEXT NOT NULL,
+            description TEXT,
+            due_datetime TEXT, -- ISO format:YYYY-MM-DDTHH:MM:SS
+            priority TEXT DEFAULT 'medium', -- e.g., low, medium, high
+            status TEXT DEFAULT 'pending', -- e.g., pending, in-progress, completed, cancelled
+            tags TEXT,        -- comma-separated tags
+            course_id TEXT,   -- Optional: Link to a course
+            parent_id TEXT,   -- Optional: For sub-tasks/dependencies
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+        );
+    ''')
+
+    # Create events table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS events (
+            event_id TEXT PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            title TEXT NOT NULL,
+            description TEXT,
+            start_datetime TEXT NOT NULL, -- ISO format
+            end_datetime TEXT,     -- ISO format
+            location TEXT,
+            attendees TEXT,        -- comma-separated emails
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+        );
+    ''')
+
+    # Create courses table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS courses (
+            course_id TEXT PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            name TEXT NOT NULL,
+            description TEXT,
+            instructor TEXT,
+            schedule TEXT,      -- e.g., "Mon,Wed,Fri 09:00-10:00"
+            start_date TEXT,    -- YYYY-MM-DD
+            end_date TEXT,      -- YYYY-MM-DD
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+        );
+    ''')
+
+    # Create conversation_history table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS conversation_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT NOT NULL,
+            sender TEXT NOT NULL, -- 'user' or 'kairo'
+            message TEXT NOT NULL,
+            timestamp TEXT DEFAULT CURRENT_TIMESTAMP,
+            parsed_action TEXT -- Store the JSON string of parsed action
+        );
+    ''')
+
+    db.commit()
+    run_migrations(db)
+
+def setup_database():
+    """Initializes the database schema for tasks, events, and courses."""
+    with app.app_context():
+        db = get_db()
+        create_schema(db)
+        detect_search_index(db)
+        prune_change_log(db)
+        prune_processed_jobs(db)
+        archive_conversation_history(db)
+        print(f"Database initialized successfully (schema version {get_schema_version(db)}).")
 
 # Run database initialization on app startup
 with app.app_context():
@@ -117,30 +983,90 @@ with app.app_context():
 
 # --- Helper Functions for Database Operations ---
 
+ID_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ" # Crockford base32, in ASCII order
+_ID_ALPHABET_PAIRS = [first + second for first in ID_ALPHABET for second in ID_ALPHABET] # 10 bits -> 2 characters
+
+class IdGenerator:
+    """
+    Snowflake-style ids: 41 bits of milliseconds since ID_EPOCH_MS, a 10-bit worker id and a 12-bit
+    per-millisecond counter, written as 13 Crockford base32 characters so string order is numeric order.
+    Ids from one process strictly increase, even across threads, bursts of more than 4096 in a millisecond
+    (which borrow the next millisecond) and a clock stepping backwards.
+    """
+    def __init__(self, worker_id=ID_WORKER_ID):
+        if worker_id < 0:
+            worker_id = int.from_bytes(os.urandom(2), 'big')
+        self.worker_id = worker_id & 0x3FF
+        self._lock = threading.Lock()
+        self._last_ms = 0
+        self._sequence = 0
+
+    def next_int(self):
+        now_ms = time.time_ns() // 1_000_000 - ID_EPOCH_MS
+        with self._lock:
+            if now_ms > self._last_ms:
+                self._last_ms, self._sequence = now_ms, 0
+            else:
+                self._sequence += 1
+                if self._sequence > 0xFFF:
+                    self._last_ms += 1
+                    self._sequence = 0
+            return (self._last_ms << 22) | (self.worker_id << 12) | self._sequence
+
+    def next_id(self):
+        value = self.next_int()
+        pairs = _ID_ALPHABET_PAIRS
+        return (ID_ALPHABET[value >> 60] + pairs[(value >> 50) & 0x3FF] + pairs[(value >> 40) & 0x3FF]
+                + pairs[(value >> 30) & 0x3FF] + pairs[(value >> 20) & 0x3FF] + pairs[(value >> 10) & 0x3FF]
+                + pairs[value & 0x3FF])
+
+id_generator = IdGenerator()
+
 def generate_unique_id(prefix):
-    """Generates a unique ID based on timestamp and a prefix."""
-    return f"{prefix}_{datetime.datetime.now().strftime('%Y%m%d%H%M%S%f')}"
+    """Generates a unique, time-sortable ID with a prefix, e.g. task_0A89KNRFB7800."""
+    return f"{prefix}_{id_generator.next_id()}"
+
+# Fallback for what datetime.fromisoformat rejects (all of these on Python < 3.11, lowercase "z", comma
+# fractions): YYYY-MM-DD, optionally followed by [T or space]HH:MM[:SS[.ffffff]] and a Z or ±HH[:]MM offset
+_ISO_DATETIME_PATTERN = re.compile(
+    r"(\d{4})-(\d{2})-(\d{2})(?:[T ](\d{2}):(\d{2})(?::(\d{2})(?:[.,](\d{1,6})\d*)?)?\s*(Z|[+-]\d{2}:?\d{2})?)?",
+    re.IGNORECASE
+)
 
 def get_iso_datetime(dt_str):
     """Converts a datetime string to ISO 8601 format, handling various inputs."""
-    if not dt_str:
+    if not dt_str or not isinstance(dt_str, str):
         return None
+    return _normalize_iso_datetime(dt_str)
+
+@functools.lru_cache(maxsize=16384) # The same datetimes recur across batch imports, updates and chat turns
+def _normalize_iso_datetime(dt_str):
     try:
-        # Try parsing as full ISO format first
-        dt_obj = datetime.datetime.fromisoformat(dt_str.replace('Z', '+00:00'))
-        return dt_obj.isoformat()
+        # fromisoformat is implemented in C and covers nearly everything the LLM and the renderer send
+        return datetime.datetime.fromisoformat(dt_str).isoformat()
     except ValueError:
-        try:
-            # Try parsing as YYYY-MM-DD HH:MM:SS
-            dt_obj = datetime.datetime.strptime(dt_str, '%Y-%m-%d %H:%M:%S')
-            return dt_obj.isoformat()
-        except ValueError:
-            try:
-                # Try parsing as YYYY-MM-DD (assume midnight)
-                dt_obj = datetime.datetime.strptime(dt_str, '%Y-%m-%d')
-                return dt_obj.isoformat()
-            except ValueError:
-                return None # Return None if format is unrecognized
+        pass
+    match = _ISO_DATETIME_PATTERN.fullmatch(dt_str.strip())
+    if match is None:
+        return None # Return None if format is unrecognized
+
+    year, month, day, hour, minute, second, fraction, offset = match.groups()
+    try:
+        tzinfo = None
+        if offset:
+            if offset.upper() == 'Z':
+                tzinfo = datetime.timezone.utc
+            else:
+                sign = -1 if offset[0] == '-' else 1
+                digits = offset[1:].replace(':', '')
+                tzinfo = datetime.timezone(sign * datetime.timedelta(hours=int(digits[:2]), minutes=int(digits[2:])))
+        dt_obj = datetime.datetime(
+            int(year), int(month), int(day), int(hour or 0), int(minute or 0), int(second or 0),
+            int((fraction or '0').ljust(6, '0')), tzinfo
+        )
+    except ValueError:
+        return None # e.g. month 13, February 30 or a +25:00 offset
+    return dt_obj.isoformat()
 
 def get_iso_date(date_str):
     """Converts a date string to ISO 8601 YYYY-MM-DD format."""
@@ -152,33 +1078,137 @@ def get_iso_date(date_str):
     except ValueError:
         return None
 
+# --- Filtering and Pagination Helpers ---
+
+def encode_cursor(created_at, item_id):
+    """Encodes the keyset position (created_at, id) of the last returned row as an opaque cursor."""
+    raw = json.dumps([created_at, item_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+def decode_cursor(cursor):
+    """Decodes a cursor produced by encode_cursor back into (created_at, id)."""
+    try:
+        created_at, item_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return created_at, item_id
+    except (ValueError, TypeError, UnicodeError):
+        raise APIError("Invalid pagination cursor.", 400)
+
+def parse_limit(limit):
+    """Validates a page size; None means no limit."""
+    if limit is None or limit == '':
+        return None
+    try:
+        limit = int(limit)
+    except (ValueError, TypeError):
+        raise APIError("limit must be an integer.", 400)
+    if limit < 1:
+        raise APIError("limit must be a positive integer.", 400)
+    return min(limit, MAX_PAGE_SIZE)
+
+def escape_like(value):
+    """Escapes LIKE wildcards so user keywords are matched literally."""
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def add_date_filters(where_clauses, params, column, date=None, date_range_start=None, date_range_end=None):
+    """Adds half-open range conditions on an epoch column for a single (local) day or an inclusive date range."""
+    if date:
+        date_range_start = date_range_end = date
+    start = get_iso_date(date_range_start)
+    end = get_iso_date(date_range_end)
+    if date_range_start and not start or date_range_end and not end:
+        raise APIError("Dates must be in YYYY-MM-DD format.", 400)
+    if start:
+        where_clauses.append(f"{column} >= ?")
+        params.append(iso_to_epoch(start))
+    if end:
+        # "< next day's midnight" includes every time on the end date
+        end_exclusive = (datetime.date.fromisoformat(end) + datetime.timedelta(days=1)).isoformat()
+        where_clauses.append(f"{column} < ?")
+        params.append(iso_to_epoch(end_exclusive))
+
+def add_keyword_filter(where_clauses, params, columns, keywords):
+    """Adds a case-insensitive substring match of keywords against any of the given columns."""
+    if not keywords:
+        return
+    pattern = f"%{escape_like(keywords)}%"
+    where_clauses.append("(" + " OR ".join(f"{column} LIKE ? ESCAPE '\\'" for column in columns) + ")")
+    params.extend([pattern] * len(columns))
+
+def fetch_page(table, id_column, user_id, where_clauses, params, limit=None, cursor=None):
+    """
+    Runs a filtered list query ordered newest first, using keyset pagination on (created_at, id).
+    Returns (items, next_cursor); next_cursor is None when there are no more rows.
+    """
+    clauses = ["user_id = ?"] + list(where_clauses)
+    values = [user_id] + list(params)
+
+    if cursor:
+        cursor_created_at, cursor_id = decode_cursor(cursor)
+        clauses.append(f"(created_at < ? OR (created_at = ? AND {id_column} < ?))")
+        values.extend([cursor_created_at, cursor_created_at, cursor_id])
+
+    sql = f"SELECT * FROM {table} WHERE {' AND '.join(clauses)} ORDER BY created_at DESC, {id_column} DESC"
+    if limit is not None:
+        # Fetch one extra row to find out whether another page exists
+        sql += " LIMIT ?"
+        values.append(limit + 1)
+
+    rows = [dict(row) for row in get_user_db(user_id).execute(sql, tuple(values)).fetchall()]
+
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]['created_at'], rows[-1][id_column])
+    return rows, next_cursor
+
+def get_list_filters_from_request(*filter_names):
+    """Collects the named filter query parameters plus limit/cursor for the GET list routes."""
+    filters = {name: request.args.get(name) for name in filter_names}
+    filters['limit'] = parse_limit(request.args.get('limit'))
+    filters['cursor'] = request.args.get('cursor')
+    return filters
+
 # Task CRUD operations
-def add_task_to_db(user_id, title, description=None, due_datetime=None, priority='medium', status='pending', tags=None, course_id=None, parent_id=None):
-    db = get_db()
+def add_task_to_db(user_id, title, description=None, due_datetime=None, priority='medium', status='pending', tags=None, course_id=None, parent_id=None, recurrence=None):
+    db = get_user_db(user_id)
     task_id = generate_unique_id("task")
     current_time = datetime.datetime.now().isoformat()
     due_datetime_iso = get_iso_datetime(due_datetime)
+    recurrence = normalize_recurrence(recurrence)
     
     db.execute(
-        "INSERT INTO tasks (task_id, user_id, title, description, due_datetime, priority, status, tags, course_id, parent_id, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
-        (task_id, user_id, title, description, due_datetime_iso, priority, status, tags, course_id, parent_id, current_time, current_time)
+        "INSERT INTO tasks (task_id, user_id, title, description, due_datetime, due_epoch, priority, status, tags, course_id, parent_id, recurrence, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (task_id, user_id, title, description, due_datetime_iso, iso_to_epoch(due_datetime_iso), priority, status, tags, course_id, parent_id, recurrence, current_time, current_time)
     )
     db.commit()
     return get_task_by_id(user_id, task_id) # Return the newly created task object
 
 def get_all_tasks_for_user(user_id):
-    db = get_db()
+    db = get_user_db(user_id)
     cursor = db.execute("SELECT * FROM tasks WHERE user_id = ? ORDER BY created_at DESC", (user_id,))
     return [dict(row) for row in cursor.fetchall()]
 
+def query_tasks_for_user(user_id, status=None, priority=None, date=None, date_range_start=None, date_range_end=None, keywords=None, limit=None, cursor=None):
+    """Returns (tasks, next_cursor) filtered in SQL; date filters apply to due_epoch."""
+    where_clauses, params = [], []
+    if status and status != 'all':
+        where_clauses.append("status = ?")
+        params.append(status)
+    if priority:
+        where_clauses.append("priority = ?")
+        params.append(priority)
+    add_date_filters(where_clauses, params, "due_epoch", date, date_range_start, date_range_end)
+    add_keyword_filter(where_clauses, params, ["title", "description"], keywords)
+    return fetch_page("tasks", "task_id", user_id, where_clauses, params, limit, cursor)
+
 def get_task_by_id(user_id, task_id):
-    db = get_db()
+    db = get_user_db(user_id)
     cursor = db.execute("SELECT * FROM tasks WHERE user_id = ? AND task_id = ?", (user_id, task_id))
     task = cursor.fetchone()
     return dict(task) if task else None
 
 def update_task_in_db(task_id, user_id, updates):
-    db = get_db()
+    db = get_user_db(user_id)
     set_clauses = []
     values = []
     
@@ -187,7 +1217,11 @@ def update_task_in_db(task_id, user_id, updates):
     for key, value in updates.items():
         if key == 'due_datetime':
             value = get_iso_datetime(value) # Ensure consistent date format
-        if key not in ['task_id', 'user_id', 'created_at']: # Prevent updating primary key or immutable fields
+            set_clauses.append("due_epoch = ?")
+            values.append(iso_to_epoch(value))
+        elif key == 'recurrence':
+            value = normalize_recurrence(value)
+        if key not in ['task_id', 'user_id', 'created_at', 'due_epoch']: # Prevent updating primary key, immutable or derived fields
             set_clauses.append(f"{key} = ?")
             values.append(value)
     
@@ -202,42 +1236,50 @@ def update_task_in_db(task_id, user_id, updates):
     return cursor.rowcount > 0
 
 def delete_task_from_db(task_id, user_id):
-    db = get_db()
+    db = get_user_db(user_id)
     cursor = db.execute("DELETE FROM tasks WHERE user_id = ? AND task_id = ?", (user_id, task_id))
     db.commit()
     return cursor.rowcount > 0
 
 # Event CRUD operations
-def add_event_to_db(user_id, title, start_datetime, description=None, end_datetime=None, location=None, attendees=None):
-    db = get_db()
+def add_event_to_db(user_id, title, start_datetime, description=None, end_datetime=None, location=None, attendees=None, recurrence=None):
+    db = get_user_db(user_id)
     event_id = generate_unique_id("event")
     current_time = datetime.datetime.now().isoformat()
     start_datetime_iso = get_iso_datetime(start_datetime)
     end_datetime_iso = get_iso_datetime(end_datetime)
+    recurrence = normalize_recurrence(recurrence)
 
     if not start_datetime_iso:
         raise APIError("Valid start_datetime is required for event.", 400)
 
     db.execute(
-        "INSERT INTO events (event_id, user_id, title, description, start_datetime, end_datetime, location, attendees, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
-        (event_id, user_id, title, description, start_datetime_iso, end_datetime_iso, location, attendees, current_time, current_time)
+        "INSERT INTO events (event_id, user_id, title, description, start_datetime, end_datetime, start_epoch, end_epoch, location, attendees, recurrence, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (event_id, user_id, title, description, start_datetime_iso, end_datetime_iso, iso_to_epoch(start_datetime_iso), iso_to_epoch(end_datetime_iso), location, attendees, recurrence, current_time, current_time)
     )
     db.commit()
     return get_event_by_id(user_id, event_id)
 
 def get_all_events_for_user(user_id):
-    db = get_db()
+    db = get_user_db(user_id)
     cursor = db.execute("SELECT * FROM events WHERE user_id = ? ORDER BY created_at DESC", (user_id,))
     return [dict(row) for row in cursor.fetchall()]
 
+def query_events_for_user(user_id, date=None, date_range_start=None, date_range_end=None, keywords=None, limit=None, cursor=None):
+    """Returns (events, next_cursor) filtered in SQL; date filters apply to start_epoch."""
+    where_clauses, params = [], []
+    add_date_filters(where_clauses, params, "start_epoch", date, date_range_start, date_range_end)
+    add_keyword_filter(where_clauses, params, ["title", "description", "location"], keywords)
+    return fetch_page("events", "event_id", user_id, where_clauses, params, limit, cursor)
+
 def get_event_by_id(user_id, event_id):
-    db = get_db()
+    db = get_user_db(user_id)
     cursor = db.execute("SELECT * FROM events WHERE user_id = ? AND event_id = ?", (user_id, event_id))
     event = cursor.fetchone()
     return dict(event) if event else None
 
 def update_event_in_db(event_id, user_id, updates):
-    db = get_db()
+    db = get_user_db(user_id)
     set_clauses = []
     values = []
     
@@ -246,7 +1288,11 @@ def update_event_in_db(event_id, user_id, updates):
     for key, value in updates.items():
         if key in ['start_datetime', 'end_datetime']:
             value = get_iso_datetime(value) # Ensure consistent date format
-        if key not in ['event_id', 'user_id', 'created_at']:
+            set_clauses.append(f"{EPOCH_COLUMNS['events'][key]} = ?")
+            values.append(iso_to_epoch(value))
+        elif key == 'recurrence':
+            value = normalize_recurrence(value)
+        if key not in ['event_id', 'user_id', 'created_at', 'start_epoch', 'end_epoch']:
             set_clauses.append(f"{key} = ?")
             values.append(value)
     
@@ -261,14 +1307,14 @@ def update_event_in_db(event_id, user_id, updates):
     return cursor.rowcount > 0
 
 def delete_event_from_db(event_id, user_id):
-    db = get_db()
+    db = get_user_db(user_id)
     cursor = db.execute("DELETE FROM events WHERE user_id = ? AND event_id = ?", (user_id, event_id))
     db.commit()
     return cursor.rowcount > 0
 
 # Course CRUD operations
 def add_course_to_db(user_id, name, description=None, instructor=None, schedule=None, start_date=None, end_date=None):
-    db = get_db()
+    db = get_user_db(user_id)
     course_id = generate_unique_id("course")
     current_time = datetime.datetime.now().isoformat()
     start_date_iso = get_iso_date(start_date)
@@ -282,18 +1328,25 @@ def add_course_to_db(user_id, name, description=None, instructor=None, schedule=
     return get_course_by_id(user_id, course_id)
 
 def get_all_courses_for_user(user_id):
-    db = get_db()
+    db = get_user_db(user_id)
     cursor = db.execute("SELECT * FROM courses WHERE user_id = ? ORDER BY created_at DESC", (user_id,))
     return [dict(row) for row in cursor.fetchall()]
 
+def query_courses_for_user(user_id, keywords=None, instructor=None, limit=None, cursor=None):
+    """Returns (courses, next_cursor) filtered in SQL by name/description keywords and instructor."""
+    where_clauses, params = [], []
+    add_keyword_filter(where_clauses, params, ["name", "description"], keywords)
+    add_keyword_filter(where_clauses, params, ["instructor"], instructor)
+    return fetch_page("courses", "course_id", user_id, where_clauses, params, limit, cursor)
+
 def get_course_by_id(user_id, course_id):
-    db = get_db()
+    db = get_user_db(user_id)
     cursor = db.execute("SELECT * FROM courses WHERE user_id = ? AND course_id = ?", (user_id, course_id))
     course = cursor.fetchone()
     return dict(course) if course else None
 
 def update_course_in_db(course_id, user_id, updates):
-    db = get_db()
+    db = get_user_db(user_id)
     set_clauses = []
     values = []
     
@@ -317,29 +1370,1570 @@ def update_course_in_db(course_id, user_id, updates):
     return cursor.rowcount > 0
 
 def delete_course_from_db(course_id, user_id):
-    db = get_db()
+    db = get_user_db(user_id)
     cursor = db.execute("DELETE FROM courses WHERE user_id = ? AND course_id = ?", (user_id, course_id))
     db.commit()
     return cursor.rowcount > 0
 
+# --- Batch Operations ---
+# Many creates/updates/deletes in one transaction (one fsync), grouping consecutive operations
+# with the same statement into a single executemany call.
+
+# kind -> writable columns; *_datetime columns go through get_iso_datetime, *_date through get_iso_date
+# and recurrence through parse_rrule
+ITEM_COLUMNS = {
+    'tasks': ['title', 'description', 'due_datetime', 'priority', 'status', 'tags', 'course_id', 'parent_id', 'recurrence'],
+    'events': ['title', 'description', 'start_datetime', 'end_datetime', 'location', 'attendees', 'recurrence'],
+    'courses': ['name', 'description', 'instructor', 'schedule', 'start_date', 'end_date'],
+}
+ITEM_REQUIRED_COLUMNS = {'tasks': ['title'], 'events': ['title', 'start_datetime'], 'courses': ['name']}
+ITEM_DEFAULTS = {'tasks': {'priority': 'medium', 'status': 'pending'}, 'events': {}, 'courses': {}}
+ID_PREFIXES = {'tasks': 'task', 'events': 'event', 'courses': 'course'}
+
+def normalize_item_value(column, value):
+    if column == 'recurrence':
+        if not value:
+            return None
+        parse_rrule(value) # Raises ValueError, reported per item
+        return value.strip()
+    if column.endswith('_datetime'):
+        return get_iso_datetime(value)
+    if column.endswith('_date'):
+        return get_iso_date(value)
+    return value
+
+def validate_batch_operation(kind, operation):
+    """Returns (op, item_id, fields) for one batch entry, or raises ValueError with a per-item message."""
+    if not isinstance(operation, dict):
+        raise ValueError("Each operation must be an object.")
+    op = operation.get('op')
+    id_column = ITEM_TABLES[kind][1]
+    item_id = operation.get('id') or operation.get(id_column)
+    fields = operation.get('item') or {}
+    if not isinstance(fields, dict):
+        raise ValueError("'item' must be an object.")
+    unknown_columns = [column for column in fields if column not in ITEM_COLUMNS[kind]]
+    if unknown_columns:
+        raise ValueError(f"Unknown field(s): {', '.join(unknown_columns)}.")
+
+    if op == 'create':
+        missing_columns = [column for column in ITEM_REQUIRED_COLUMNS[kind] if not fields.get(column)]
+        if missing_columns:
+            raise ValueError(f"Missing required field(s): {', '.join(missing_columns)}.")
+    elif op in ('update', 'delete'):
+        if not item_id:
+            raise ValueError(f"'{op}' requires 'id'.")
+        if op == 'update' and not fields:
+            raise ValueError("'update' requires at least one field in 'item'.")
+    else:
+        raise ValueError("'op' must be 'create', 'update' or 'delete'.")
+
+    normalized = {column: normalize_item_value(column, value) for column, value in fields.items()}
+    if kind == 'events' and 'start_datetime' in fields and not normalized['start_datetime']:
+        raise ValueError("Invalid start_datetime.")
+    return op, item_id, normalized
+
+def apply_batch(kind, user_id, operations):
+    """
+    Validates and runs a list of {"op": "create"|"update"|"delete", "id": ..., "item": {...}} operations
+    in one transaction. If any entry is invalid nothing is written. Returns (ok, results), with one
+    result per operation in input order. Created and updated events also get their "conflicts".
+    """
+    table, id_column = ITEM_TABLES[kind]
+    results = []
+    validated = []
+    for index, operation in enumerate(operations):
+        try:
+            validated.append(validate_batch_operation(kind, operation))
+            results.append({"index": index, "status": "valid"})
+        except ValueError as e:
+            validated.append(None)
+            results.append({"index": index, "status": "error", "error": str(e)})
+    if any(result["status"] == "error" for result in results):
+        for result in results:
+            if result["status"] == "valid":
+                result["status"] = "skipped"
+        return False, results
+
+    # Plan the statements in input order; existing ids are tracked so updates/deletes report not_found
+    referenced_ids = [item_id for op, item_id, _ in validated if op != 'create']
+    existing_ids = {item[id_column] for item in get_items_by_ids(kind, user_id, referenced_ids)}
+    current_time = datetime.datetime.now().isoformat()
+    statements = [] # [(sql, [params, ...])], consecutive identical statements merged
+    for result, (op, item_id, fields) in zip(results, validated):
+        if op == 'create':
+            item_id = generate_unique_id(ID_PREFIXES[kind])
+            values = {column: fields.get(column, ITEM_DEFAULTS[kind].get(column)) for column in ITEM_COLUMNS[kind]}
+            values.update(epoch_values(kind, values))
+            columns = [id_column, 'user_id'] + list(values) + ['created_at', 'updated_at']
+            sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+            params = [item_id, user_id] + list(values.values()) + [current_time, current_time]
+            result.update(status="created", id=item_id)
+        elif item_id not in existing_ids:
+            result.update(status="not_found", id=item_id)
+            continue
+        elif op == 'update':
+            fields = dict(fields, **epoch_values(kind, fields))
+            columns = sorted(fields)
+            sql = f"UPDATE {table} SET {', '.join(f'{column} = ?' for column in columns)}, updated_at = ? WHERE user_id = ? AND {id_column} = ?"
+            params = [fields[column] for column in columns] + [current_time, user_id, item_id]
+            result.update(status="updated", id=item_id)
+        else:
+            sql = f"DELETE FROM {table} WHERE user_id = ? AND {id_column} = ?"
+            params = [user_id, item_id]
+            existing_ids.discard(item_id)
+            result.update(status="deleted", id=item_id)
+        if statements and statements[-1][0] == sql:
+            statements[-1][1].append(params)
+        else:
+            statements.append((sql, [params]))
+
+    db = get_user_db(user_id)
+    try:
+        db.execute("BEGIN IMMEDIATE")
+        for sql, param_rows in statements:
+            db.executemany(sql, param_rows)
+        db.commit()
+    except sqlite3.Error as e:
+        db.rollback()
+        print(f"Error: Batch of {len(operations)} {kind} operations rolled back: {e}")
+        raise APIError(f"The batch could not be saved and was rolled back: {e}", 500)
+
+    # One SELECT for every created/updated item instead of one per row
+    written_ids = [result["id"] for result in results if result["status"] in ("created", "updated")]
+    items_by_id = {item[id_column]: item for item in get_items_by_ids(kind, user_id, written_ids)}
+    for result in results:
+        if result["status"] in ("created", "updated"):
+            result["item"] = items_by_id.get(result["id"])
+            if kind == 'events' and result["item"]:
+                result["conflicts"] = find_event_conflicts(user_id, result["item"])
+    return True, results
+
+# --- Full-Text Search ---
+
+def build_fts_query(keywords, column=None):
+    """
+    Turns free-text keywords into a safe FTS5 query: every word must match (as a prefix),
+    optionally restricted to one column. Returns None if there are no searchable words.
+    """
+    words = re.findall(r"\w+", keywords.lower())
+    if not words:
+        return None
+    terms = " AND ".join(f'"{word}"*' for word in words)
+    return f"{column} : ({terms})" if column else terms
+
+def search_items(kind, user_id, keywords, limit=20, title_only=False):
+    """Returns the user's items of one kind matching keywords, best match first (bm25, title weighted highest)."""
+    table, fts_table, _, title_column, columns = SEARCH_TABLES[kind]
+    db = get_user_db(user_id)
+
+    if not search_index_state["available"]:
+        # Fallback for SQLite builds without FTS5: substring match, newest first
+        where_clauses, params = [], []
+        add_keyword_filter(where_clauses, params, [title_column] if title_only else columns, keywords)
+        items, _ = fetch_page(table, SEARCH_TABLES[kind][2], user_id, where_clauses, params, limit)
+        return items
+
+    fts_query = build_fts_query(keywords, title_column if title_only else None)
+    if fts_query is None:
+        return []
+    weights = ", ".join(["0.0"] + ["10.0" if column == title_column else "1.0" for column in columns]) # user_id first
+    cursor = db.execute(
+        f"SELECT {table}.* FROM {fts_table} JOIN {table} ON {table}.rowid = {fts_table}.rowid "
+        f"WHERE {fts_table} MATCH ? AND {fts_table}.user_id = ? ORDER BY bm25({fts_table}, {weights}) LIMIT ?",
+        (fts_query, user_id, limit)
+    )
+    return [dict(row) for row in cursor.fetchall()]
+
+def find_items_by_keywords(kind, user_id, keywords):
+    """
+    Resolves title/name keywords from a chat action to candidate items. Uses the title index; if several
+    items match but exactly one title contains the keywords verbatim, that one wins. The index matches
+    word prefixes, so when it finds nothing the titles are scanned for the keywords as a substring
+    ("work" still finds "Homework"), as keyword lookups did before the index.
+    """
+    table, _, id_column, title_column, _ = SEARCH_TABLES[kind]
+    candidates = search_items(kind, user_id, keywords, limit=10, title_only=True)
+    if not candidates and search_index_state["available"]:
+        where_clauses, params = [], []
+        add_keyword_filter(where_clauses, params, [title_column], keywords)
+        candidates, _ = fetch_page(table, id_column, user_id, where_clauses, params, 10)
+    if len(candidates) > 1:
+        exact = [item for item in candidates if keywords.lower() in (item[title_column] or '').lower()]
+        if len(exact) == 1:
+            return exact
+    return candidates
+
+# --- Incremental Sync ---
+
+def get_change_version(user_id):
+    """Returns the user's current change version (0 if nothing has changed yet). Pruning never lowers it."""
+    row = get_user_db(user_id).execute('''
+        SELECT MAX(
+            COALESCE((SELECT MAX(version) FROM change_log WHERE user_id = ?), 0),
+            COALESCE((SELECT pruned_through FROM change_log_pruned WHERE user_id = ?), 0)
+        )
+    ''', (user_id, user_id)).fetchone()
+    return row[0]
+
+def get_items_by_ids(kind, user_id, item_ids):
+    """Fetches the user's items of one kind by id, in chunks that stay under SQLite's parameter limit."""
+    table, id_column = ITEM_TABLES[kind]
+    items = []
+    for start in range(0, len(item_ids), 500):
+        chunk = item_ids[start:start + 500]
+        cursor = get_user_db(user_id).execute(
+            f"SELECT * FROM {table} WHERE user_id = ? AND {id_column} IN ({', '.join('?' * len(chunk))})",
+            [user_id] + chunk
+        )
+        items.extend(dict(row) for row in cursor.fetchall())
+    return items
+
+def get_changes_since(user_id, since=0):
+    """
+    Returns the items changed after version `since` as
+    {"since", "version", "reset", "tasks", "events", "courses", "deleted": {kind: [ids]}}.
+    If the log has been pruned past `since`, returns a full snapshot with reset=True instead.
+    """
+    db = get_user_db(user_id)
+    version = get_change_version(user_id)
+    changes = {"since": since, "version": version, "reset": False, "deleted": {kind: [] for kind in ITEM_TABLES}}
+
+    pruned = db.execute("SELECT pruned_through FROM change_log_pruned WHERE user_id = ?", (user_id,)).fetchone()
+    if pruned and since < pruned['pruned_through']:
+        changes["reset"] = True
+        changes.update(tasks=get_all_tasks_for_user(user_id), events=get_all_events_for_user(user_id),
+                       courses=get_all_courses_for_user(user_id))
+        return changes
+
+    # Only the latest entry per item matters; SQLite returns `operation` from the row that has MAX(version)
+    cursor = db.execute('''
+        SELECT item_type, item_id, operation, MAX(version) FROM change_log
+        WHERE user_id = ? AND version > ? AND version <= ?
+        GROUP BY item_type, item_id
+    ''', (user_id, since, version))
+    upserted_ids = {kind: [] for kind in ITEM_TABLES}
+    for row in cursor.fetchall():
+        if row['operation'] == 'delete':
+            changes["deleted"][row['item_type']].append(row['item_id'])
+        else:
+            upserted_ids[row['item_type']].append(row['item_id'])
+
+    for kind, item_ids in upserted_ids.items():
+        changes[kind] = get_items_by_ids(kind, user_id, item_ids)
+        # An item deleted after `version` was read is reported as deleted rather than dropped silently
+        found_ids = {item[ITEM_TABLES[kind][1]] for item in changes[kind]}
+        changes["deleted"][kind].extend(item_id for item_id in item_ids if item_id not in found_ids)
+    return changes
+
+# --- Dashboard Aggregates ---
+# Counts for the dashboard computed with aggregate SQL instead of shipping every row to the client.
+# Results are cached per user and reused while the user's change version is unchanged, so any write
+# (REST, chat or batch) invalidates them; a short TTL covers counts that move with the clock.
+
+dashboard_cache = collections.OrderedDict() # user_id -> (change_version, computed_at, dashboard)
+dashboard_cache_lock = threading.Lock()
+
+def compute_dashboard(user_id, now=None):
+    db = get_user_db(user_id)
+    now = now or datetime.datetime.now()
+    now_iso = now.isoformat(timespec='seconds')
+    today = now.date().isoformat()
+    tomorrow = (now.date() + datetime.timedelta(days=1)).isoformat()
+    now_epoch, today_epoch, tomorrow_epoch = iso_to_epoch(now_iso), iso_to_epoch(today), iso_to_epoch(tomorrow)
+
+    by_status = {}
+    by_priority = {}
+    for row in db.execute(
+        "SELECT COALESCE(status, 'pending') AS status, priority, COUNT(*) AS count FROM tasks WHERE user_id = ? GROUP BY status, priority",
+        (user_id,)
+    ):
+        by_status[row['status']] = by_status.get(row['status'], 0) + row['count']
+        if row['status'] not in ('completed', 'cancelled'): # Priority breakdown covers open tasks only
+            priority = row['priority'] or 'medium'
+            by_priority[priority] = by_priority.get(priority, 0) + row['count']
+
+    open_task_due = db.execute('''
+        SELECT
+            COUNT(CASE WHEN due_epoch < ? THEN 1 END) AS overdue,
+            COUNT(CASE WHEN due_epoch >= ? AND due_epoch < ? THEN 1 END) AS due_today
+        FROM tasks
+        WHERE user_id = ? AND due_epoch IS NOT NULL AND due_epoch < ?
+          AND COALESCE(status, 'pending') NOT IN ('completed', 'cancelled')
+    ''', (now_epoch, today_epoch, tomorrow_epoch, user_id, tomorrow_epoch)).fetchone()
+
+    events = db.execute('''
+        SELECT
+            COUNT(*) AS total,
+            COUNT(CASE WHEN start_epoch > ? THEN 1 END) AS upcoming,
+            COUNT(CASE WHEN start_epoch >= ? AND start_epoch < ? THEN 1 END) AS today
+        FROM events WHERE user_id = ?
+    ''', (now_epoch, today_epoch, tomorrow_epoch, user_id)).fetchone()
+
+    courses = db.execute('''
+        SELECT
+            COUNT(*) AS total,
+            COUNT(CASE WHEN (start_date IS NULL OR start_date <= ?) AND (end_date IS NULL OR end_date >= ?) THEN 1 END) AS active
+        FROM courses WHERE user_id = ?
+    ''', (today, today, user_id)).fetchone()
+
+    recent_activity = [dict(row) for row in db.execute('''
+        SELECT * FROM (SELECT 'Task' AS type, title, updated_at AS date FROM tasks WHERE user_id = ? ORDER BY updated_at DESC LIMIT 5)
+        UNION ALL
+        SELECT * FROM (SELECT 'Event' AS type, title, updated_at AS date FROM events WHERE user_id = ? ORDER BY updated_at DESC LIMIT 5)
+        UNION ALL
+        SELECT * FROM (SELECT 'Course' AS type, name AS title, updated_at AS date FROM courses WHERE user_id = ? ORDER BY updated_at DESC LIMIT 5)
+        ORDER BY date DESC LIMIT 5
+    ''', (user_id, user_id, user_id))]
+
+    return {
+        "tasks": {
+            "total": sum(by_status.values()),
+            "pending": by_status.get('pending', 0),
+            "in_progress": by_status.get('in-progress', 0),
+            "completed": by_status.get('completed', 0),
+            "overdue": open_task_due['overdue'],
+            "due_today": open_task_due['due_today'],
+            "by_status": by_status,
+            "by_priority": by_priority,
+        },
+        "events": {"total": events['total'], "upcoming": events['upcoming'], "today": events['today']},
+        "courses": {"total": courses['total'], "active": courses['active']},
+        "recent_activity": recent_activity,
+        "generated_at": now_iso,
+    }
+
+def get_dashboard(user_id):
+    """Returns the cached dashboard for a user, recomputing it after any write or once it is DASHBOARD_CACHE_TTL_SECONDS old."""
+    version = get_change_version(user_id)
+    now = time.time()
+    with dashboard_cache_lock:
+        entry = dashboard_cache.get(user_id)
+        if entry and entry[0] == version and now - entry[1] < DASHBOARD_CACHE_TTL_SECONDS:
+            dashboard_cache.move_to_end(user_id)
+            return dict(entry[2], version=version, cached=True)
+
+    dashboard = compute_dashboard(user_id)
+    with dashboard_cache_lock:
+        dashboard_cache[user_id] = (version, now, dashboard)
+        dashboard_cache.move_to_end(user_id)
+        while len(dashboard_cache) > DASHBOARD_CACHE_SIZE:
+            dashboard_cache.popitem(last=False)
+    return dict(dashboard, version=version, cached=False)
+
+# --- Recurrence and Agenda ---
+# Events and tasks may carry an RRULE-style `recurrence` (FREQ, INTERVAL, BYDAY, BYMONTHDAY, COUNT, UNTIL)
+# anchored at their start/due datetime, and course `schedule` text like "Mon,Wed,Fri 09:00-10:00" is
+# parsed into a weekly rule. Occurrences are generated lazily for the requested window only and never stored.
+# As in RFC 5545, the start/due datetime is always the first occurrence (and counts towards COUNT), even
+# when it does not match BYDAY/BYMONTHDAY; course meetings are the exception, since a course's start_date
+# is not itself a class. Datetimes are naive local time, so a UTC ("Z") UNTIL is converted to local time.
+# One-off events are answered from a per-user interval index, which also backs free/busy. Conflict checks
+# run on the write path, right after the change that invalidates that index, so they use an indexed
+# start_epoch range instead of rebuilding it.
+
+RRULE_WEEKDAYS = ['MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU']
+RRULE_FREQUENCIES = ('DAILY', 'WEEKLY', 'MONTHLY', 'YEARLY')
+
+def parse_rrule(recurrence):
+    """
+    Parses "FREQ=WEEKLY;INTERVAL=2;BYDAY=MO,WE;UNTIL=20251220" (an "RRULE:" prefix is allowed) into a dict.
+    Raises ValueError for anything outside the supported subset.
+    """
+    text = recurrence.strip()
+    if text.upper().startswith('RRULE:'):
+        text = text[6:]
+    parts = {}
+    for part in filter(None, text.split(';')):
+        key, separator, value = part.partition('=')
+        if not separator or not value:
+            raise ValueError(f"Malformed recurrence part '{part}'.")
+        parts[key.strip().upper()] = value.strip().upper()
+
+    rule = {"freq": parts.pop('FREQ', None), "interval": 1, "byday": None, "bymonthday": None, "count": None, "until": None,
+            "include_dtstart": True}
+    if rule["freq"] not in RRULE_FREQUENCIES:
+        raise ValueError(f"FREQ must be one of {', '.join(RRULE_FREQUENCIES)}.")
+    try:
+        if 'INTERVAL' in parts:
+            rule["interval"] = int(parts.pop('INTERVAL'))
+        if 'COUNT' in parts:
+            rule["count"] = int(parts.pop('COUNT'))
+        if 'BYMONTHDAY' in parts:
+            rule["bymonthday"] = int(parts.pop('BYMONTHDAY'))
+    except ValueError:
+        raise ValueError("INTERVAL, COUNT and BYMONTHDAY must be integers.")
+    if rule["interval"] < 1 or (rule["count"] is not None and rule["count"] < 1):
+        raise ValueError("INTERVAL and COUNT must be positive.")
+    if rule["bymonthday"] is not None and not 1 <= rule["bymonthday"] <= 31:
+        raise ValueError("BYMONTHDAY must be between 1 and 31.")
+    if 'BYDAY' in parts:
+        days = parts.pop('BYDAY').split(',')
+        if not all(day in RRULE_WEEKDAYS for day in days):
+            raise ValueError(f"BYDAY must list days from {','.join(RRULE_WEEKDAYS)}.")
+        rule["byday"] = sorted({RRULE_WEEKDAYS.index(day) for day in days})
+    if 'UNTIL' in parts:
+        until = parts.pop('UNTIL')
+        is_utc = until.endswith('Z')
+        until = until.rstrip('Z')
+        for pattern in ('%Y%m%dT%H%M%S', '%Y%m%d', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d'):
+            try:
+                rule["until"] = datetime.datetime.strptime(until, pattern)
+                break
+            except ValueError:
+                continue
+        else:
+            raise ValueError("UNTIL must be YYYYMMDD or YYYYMMDDTHHMMSS.")
+        if len(until) <= 10:
+            rule["until"] = rule["until"].replace(hour=23, minute=59, second=59) # A date-only UNTIL includes that day
+        elif is_utc:
+            rule["until"] = rule["until"].replace(tzinfo=datetime.timezone.utc).astimezone().replace(tzinfo=None)
+    if parts:
+        raise ValueError(f"Unsupported recurrence field(s): {', '.join(sorted(parts))}.")
+    return rule
+
+def normalize_recurrence(recurrence):
+    """Validates a recurrence for storage; returns None for empty input and raises APIError(400) if invalid."""
+    if not recurrence:
+        return None
+    try:
+        parse_rrule(recurrence)
+    except ValueError as e:
+        raise APIError(f"Invalid recurrence: {e}", 400)
+    return recurrence.strip()
+
+def _add_months(year, month, months):
+    month_index = year * 12 + (month - 1) + months
+    return month_index // 12, month_index % 12 + 1
+
+def _rule_candidates(rule, dtstart, window_start):
+    """
+    Yields candidate occurrence datetimes in order (before COUNT/UNTIL are applied). Without COUNT,
+    whole periods before window_start are skipped arithmetically instead of being generated.
+    """
+    interval = rule["interval"]
+    skip = rule["count"] is None and window_start > dtstart
+    start_time = dtstart.time()
+
+    if rule["freq"] == 'DAILY':
+        period = 0
+        if skip:
+            period = (window_start - dtstart).days // interval
+        while True:
+            yield dtstart + datetime.timedelta(days=period * interval)
+            period += 1
+
+    elif rule["freq"] == 'WEEKLY':
+        weekdays = rule["byday"] or [dtstart.weekday()]
+        week_zero = dtstart.date() - datetime.timedelta(days=dtstart.weekday()) # Monday of dtstart's week
+        period = 0
+        if skip:
+            period = max(0, (window_start.date() - week_zero).days // (7 * interval))
+        while True:
+            week_start = week_zero + datetime.timedelta(weeks=period * interval)
+            for weekday in weekdays:
+                candidate = datetime.datetime.combine(week_start + datetime.timedelta(days=weekday), start_time)
+                if candidate >= dtstart:
+                    yield candidate
+            period += 1
+
+    elif rule["freq"] == 'MONTHLY':
+        day = rule["bymonthday"] or dtstart.day
+        period = 0
+        if skip:
+            months_between = (window_start.year - dtstart.year) * 12 + window_start.month - dtstart.month
+            period = max(0, months_between // interval)
+        while True:
+            year, month = _add_months(dtstart.year, dtstart.month, period * interval)
+            if day <= calendar.monthrange(year, month)[1]: # Months without that day are skipped, as in RFC 5545
+                candidate = datetime.datetime.combine(datetime.date(year, month, day), start_time)
+                if candidate >= dtstart:
+                    yield candidate
+            period += 1
+
+    else: # YEARLY
+        period = 0
+        if skip:
+            period = max(0, (window_start.year - dtstart.year) // interval)
+        while True:
+            year = dtstart.year + period * interval
+            if dtstart.month != 2 or dtstart.day != 29 or calendar.isleap(year):
+                yield dtstart.replace(year=year)
+            period += 1
+
+def iter_occurrences(recurrence, dtstart, window_start, window_end):
+    """
+    Lazily yields the start datetimes of a recurring item's occurrences in [window_start, window_end).
+    `recurrence` is an RRULE string or a dict from parse_rrule.
+    """
+    rule = parse_rrule(recurrence) if isinstance(recurrence, str) else recurrence
+    candidates = _rule_candidates(rule, dtstart, window_start)
+    if rule.get("include_dtstart", True):
+        candidates = itertools.chain([dtstart], (candidate for candidate in candidates if candidate != dtstart))
+    for index, occurrence in enumerate(candidates):
+        if rule["count"] is not None and index >= rule["count"]:
+            return
+        if rule["until"] is not None and occurrence > rule["until"]:
+            return
+        if occurrence >= window_end:
+            return
+        if occurrence >= window_start:
+            yield occurrence
+
+COURSE_DAY_NAMES = {
+    'mo': 0, 'mon': 0, 'monday': 0, 'm': 0,
+    'tu': 1, 'tue': 1, 'tues': 1, 'tuesday': 1, 't': 1,
+    'we': 2, 'wed': 2, 'wednesday': 2, 'w': 2,
+    'th': 3, 'thu': 3, 'thur': 3, 'thurs': 3, 'thursday': 3, 'r': 3,
+    'fr': 4, 'fri': 4, 'friday': 4, 'f': 4,
+    'sa': 5, 'sat': 5, 'saturday': 5,
+    'su': 6, 'sun': 6, 'sunday': 6,
+}
+_COURSE_SCHEDULE_PATTERN = re.compile(
+    r"^\s*(?P<days>[a-z,/&\s]+?)\s+(?P<start>\d{1,2}(?::\d{2})?\s*(?:am|pm)?)\s*(?:-|–|to)\s*(?P<end>\d{1,2}(?::\d{2})?\s*(?:am|pm)?)\s*$",
+    re.IGNORECASE
+)
+
+def _parse_schedule_days(text):
+    days = set()
+    for token in re.split(r"[\s,/&]+|\band\b", text.lower()):
+        if not token:
+            continue
+        if token in COURSE_DAY_NAMES:
+            days.add(COURSE_DAY_NAMES[token])
+            continue
+        # Compact forms such as "MWF" or "TTh"
+        for compact_day in re.findall(r"th|su|sa|[mtwrf]", token):
+            days.add(COURSE_DAY_NAMES[compact_day])
+        if not re.fullmatch(r"(?:th|su|sa|[mtwrf])+", token):
+            return None
+    return sorted(days) or None
+
+def _parse_schedule_time(text, meridiem_hint=None):
+    match = re.fullmatch(r"(\d{1,2})(?::(\d{2}))?\s*(am|pm)?", text.strip().lower())
+    hour, minute = int(match.group(1)), int(match.group(2) or 0)
+    meridiem = match.group(3) or meridiem_hint
+    if meridiem == 'pm' and hour < 12:
+        hour += 12
+    elif meridiem == 'am' and hour == 12:
+        hour = 0
+    if hour > 23 or minute > 59:
+        return None
+    return datetime.time(hour, minute)
+
+@functools.lru_cache(maxsize=1024)
+def parse_course_schedule(schedule):
+    """
+    Parses schedule text like "Mon,Wed,Fri 09:00-10:00", "MWF 9-10am" or "Tue/Thu 2:30pm-3:45pm"
+    into (weekdays, start_time, end_time), or returns None if it isn't in a recognized form.
+    """
+    if not schedule:
+        return None
+    match = _COURSE_SCHEDULE_PATTERN.match(schedule)
+    if not match:
+        return None
+    weekdays = _parse_schedule_days(match.group('days'))
+    end_meridiem = re.search(r"(am|pm)\s*$", match.group('end').lower())
+    start_time = _parse_schedule_time(match.group('start'), end_meridiem.group(1) if end_meridiem else None)
+    end_time = _parse_schedule_time(match.group('end'))
+    if not weekdays or start_time is None or end_time is None:
+        return None
+    if end_time <= start_time and end_meridiem and not re.search(r"(am|pm)", match.group('start').lower()):
+        start_time = _parse_schedule_time(match.group('start'), 'am') # "11-1pm" means 11 AM to 1 PM
+    return tuple(weekdays), start_time, end_time
+
+def epoch_to_datetime(epoch):
+    """The naive local datetime for an epoch shadow value, which is what the agenda engine compares; None if missing."""
+    return datetime.datetime.fromtimestamp(epoch) if epoch is not None else None
+
+def _agenda_entry(kind, item, start, end, recurring):
+    title_column = SEARCH_TABLES[kind][3]
+    id_column = ITEM_TABLES[kind][1]
+    return {
+        "type": kind[:-1],
+        "id": item[id_column],
+        "title": item[title_column],
+        "start": start.isoformat(),
+        "end": end.isoformat() if end else None,
+        "recurring": recurring,
+        "item": item,
+    }
+
+def event_span(start, end):
+    """The busy interval of an event; one without a (valid) end blocks EVENT_DEFAULT_DURATION_MINUTES."""
+    if end is None or end <= start:
+        end = start + datetime.timedelta(minutes=EVENT_DEFAULT_DURATION_MINUTES)
+    return start, end
+
+class IntervalIndex:
+    """
+    Static index over (start, end, payload) intervals: sorted by start, with an implicit segment tree of
+    subtree max ends on top. A query bisects to the intervals starting before its end and only descends
+    into subtrees whose max end is past its start, so it costs O(log n + k).
+    """
+    def __init__(self, intervals):
+        self.intervals = sorted(intervals, key=lambda interval: interval[0])
+        self.starts = [interval[0] for interval in self.intervals]
+        self.size = 1
+        while self.size < len(self.intervals):
+            self.size *= 2
+        self.max_end = [datetime.datetime.min] * (2 * self.size)
+        for position, interval in enumerate(self.intervals):
+            self.max_end[self.size + position] = interval[1]
+        for node in range(self.size - 1, 0, -1):
+            self.max_end[node] = max(self.max_end[2 * node], self.max_end[2 * node + 1])
+
+    def __len__(self):
+        return len(self.intervals)
+
+    def overlapping(self, start, end):
+        """Returns the intervals overlapping [start, end), ordered by start."""
+        limit = bisect.bisect_left(self.starts, end)
+        found = []
+        stack = [(1, 0, self.size)]
+        while stack:
+            node, low, high = stack.pop()
+            if low >= limit or self.max_end[node] <= start:
+                continue
+            if high - low == 1:
+                found.append(self.intervals[low])
+            else:
+                middle = (low + high) // 2
+                stack.append((2 * node + 1, middle, high))
+                stack.append((2 * node, low, middle))
+        return found
+
+event_index_cache = collections.OrderedDict() # user_id -> (change_version, IntervalIndex)
+event_index_cache_lock = threading.Lock()
+
+def build_event_index(user_id):
+    """Reads the user's one-off events once and indexes them by busy interval; payloads are the event rows."""
+    intervals = []
+    for row in get_user_db(user_id).execute("SELECT * FROM events WHERE user_id = ? AND recurrence IS NULL", (user_id,)):
+        event = dict(row)
+        start = epoch_to_datetime(event['start_epoch'])
+        if start is None:
+            continue
+        intervals.append((*event_span(start, epoch_to_datetime(event['end_epoch'])), event))
+    return IntervalIndex(intervals)
+
+def get_event_index(user_id):
+    """
+    Returns the user's cached event interval index, rebuilt after any write (the cache is keyed on the
+    change version like the dashboard). Payloads are shared between requests, so callers must not mutate them.
+    """
+    version = get_change_version(user_id)
+    with event_index_cache_lock:
+        entry = event_index_cache.get(user_id)
+        if entry and entry[0] == version:
+            event_index_cache.move_to_end(user_id)
+            return entry[1]
+
+    index = build_event_index(user_id)
+    with event_index_cache_lock:
+        event_index_cache[user_id] = (version, index)
+        event_index_cache.move_to_end(user_id)
+        while len(event_index_cache) > EVENT_INDEX_CACHE_SIZE:
+            event_index_cache.popitem(last=False)
+    return index
+
+def iter_one_off_events_in_window(user_id, window_start, window_end):
+    """
+    Yields the one-off events overlapping a window straight from SQLite: a start_epoch range that reaches
+    back by the user's longest event (found through idx_events_user_span), filtered by busy interval.
+    """
+    db = get_user_db(user_id)
+    longest = db.execute(
+        "SELECT end_epoch - start_epoch FROM events WHERE user_id = ? AND recurrence IS NULL "
+        "ORDER BY end_epoch - start_epoch DESC LIMIT 1", (user_id,)
+    ).fetchone()
+    lookback = max((longest[0] if longest else None) or 0, EVENT_DEFAULT_DURATION_MINUTES * 60)
+    rows = db.execute(
+        "SELECT * FROM events WHERE user_id = ? AND recurrence IS NULL AND start_epoch >= ? AND start_epoch < ?",
+        (user_id, int(window_start.timestamp()) - lookback, int(window_end.timestamp()))
+    )
+    for row in rows:
+        event = dict(row)
+        start, end = event_span(epoch_to_datetime(event['start_epoch']), epoch_to_datetime(event['end_epoch']))
+        if start < window_end and end > window_start:
+            yield event
+
+def _recurring_spans(rule, dtstart, duration, window_start, window_end):
+    """Yields (start, end) for occurrences overlapping the window, including ones that started just before it."""
+    occurrences = iter_occurrences(rule, dtstart, window_start - duration, window_end)
+    for occurrence in itertools.islice(occurrences, AGENDA_MAX_OCCURRENCES_PER_ITEM):
+        if occurrence + duration > window_start or occurrence >= window_start:
+            yield occurrence, occurrence + duration
+
+def iter_agenda_spans(user_id, kinds, window_start, window_end, use_event_index=True):
+    """
+    Yields (kind, item, start, end, recurring) for everything in the window. Events and course meetings
+    are matched by overlap (one-off events through the interval index, or an indexed range query when
+    use_event_index is False; recurring ones expanded on the fly); tasks are points matched by due
+    datetime. `end` is None for items that have no end.
+    """
+    db = get_user_db(user_id)
+    window_start_epoch, window_end_epoch = int(window_start.timestamp()), int(window_end.timestamp())
+
+    if 'events' in kinds:
+        if use_event_index:
+            one_off_events = (event for _, _, event in get_event_index(user_id).overlapping(window_start, window_end))
+        else:
+            one_off_events = iter_one_off_events_in_window(user_id, window_start, window_end)
+        for event in one_off_events:
+            yield ('events', event, epoch_to_datetime(event['start_epoch']),
+                   epoch_to_datetime(event['end_epoch']), False)
+
+    if 'tasks' in kinds:
+        one_off = db.execute(
+            "SELECT * FROM tasks WHERE user_id = ? AND recurrence IS NULL AND due_epoch >= ? AND due_epoch < ?",
+            (user_id, window_start_epoch, window_end_epoch)
+        )
+        for row in one_off:
+            task = dict(row)
+            yield 'tasks', task, epoch_to_datetime(task['due_epoch']), None, False
+
+    for kind, start_column in (('events', 'start_epoch'), ('tasks', 'due_epoch')):
+        if kind not in kinds:
+            continue
+        recurring = db.execute(
+            f"SELECT * FROM {kind} WHERE user_id = ? AND recurrence IS NOT NULL AND {start_column} < ?",
+            (user_id, window_end_epoch)
+        )
+        for row in recurring:
+            item = dict(row)
+            dtstart = epoch_to_datetime(item[start_column])
+            if dtstart is None:
+                continue
+            end = epoch_to_datetime(item.get('end_epoch'))
+            duration = event_span(dtstart, end)[1] - dtstart if kind == 'events' else datetime.timedelta(0)
+            try:
+                for start, _ in _recurring_spans(item['recurrence'], dtstart, duration, window_start, window_end):
+                    yield kind, item, start, (start + (end - dtstart) if end and end > dtstart else None), True
+            except ValueError as e:
+                print(f"Warning: Skipping {kind} {item[ITEM_TABLES[kind][1]]} with invalid recurrence: {e}")
+
+    if 'courses' in kinds:
+        courses = db.execute('''
+            SELECT * FROM courses WHERE user_id = ? AND schedule IS NOT NULL
+              AND (start_date IS NULL OR start_date < ?) AND (end_date IS NULL OR end_date >= ?)
+        ''', (user_id, window_end.isoformat(), window_start.date().isoformat()))
+        for row in courses:
+            item = dict(row)
+            parsed_schedule = parse_course_schedule(item['schedule'])
+            if parsed_schedule is None:
+                continue
+            weekdays, start_time, end_time = parsed_schedule
+            first_day = datetime.date.fromisoformat(item['start_date']) if item['start_date'] else window_start.date()
+            dtstart = datetime.datetime.combine(first_day, start_time)
+            duration = datetime.datetime.combine(first_day, end_time) - dtstart
+            rule = {"freq": 'WEEKLY', "interval": 1, "byday": list(weekdays), "bymonthday": None, "count": None,
+                    "until": datetime.datetime.combine(datetime.date.fromisoformat(item['end_date']), datetime.time.max) if item['end_date'] else None,
+                    "include_dtstart": False}
+            for start, end in _recurring_spans(rule, dtstart, duration, window_start, window_end):
+                yield 'courses', item, start, end, True
+
+def iter_agenda_entries(user_id, kinds, window_start, window_end):
+    """Yields agenda entries for iter_agenda_spans."""
+    for kind, item, start, end, recurring in iter_agenda_spans(user_id, kinds, window_start, window_end):
+        yield _agenda_entry(kind, item, start, end, recurring)
+
+def get_agenda(user_id, window_start, window_end, kinds=('events', 'tasks', 'courses')):
+    """Returns the agenda entries for a window sorted by start time."""
+    return sorted(iter_agenda_entries(user_id, kinds, window_start, window_end), key=lambda entry: entry["start"])
+
+def parse_agenda_window(start, end):
+    """
+    Parses the /agenda window. Accepts dates or datetimes; a date-only end includes that whole day.
+    Raises APIError(400) for missing, invalid, reversed or over-long windows.
+    """
+    window_start = epoch_to_datetime(iso_to_epoch(get_iso_datetime(start)))
+    window_end = epoch_to_datetime(iso_to_epoch(get_iso_datetime(end)))
+    if window_start is None or window_end is None:
+        raise APIError("start and end are required, as YYYY-MM-DD or YYYY-MM-DDTHH:MM:SS.", 400)
+    if len(end.strip()) <= 10:
+        window_end += datetime.timedelta(days=1)
+    if window_end <= window_start:
+        raise APIError("end must be after start.", 400)
+    if window_end - window_start > datetime.timedelta(days=AGENDA_MAX_DAYS):
+        raise APIError(f"The agenda window may span at most {AGENDA_MAX_DAYS} days.", 400)
+    return window_start, window_end
+
+def get_free_busy(user_id, window_start, window_end):
+    """Merges the events and course meetings overlapping a window into busy blocks; the gaps are free."""
+    blocks = []
+    for _, _, start, end, _ in iter_agenda_spans(user_id, ('events', 'courses'), window_start, window_end):
+        start, end = event_span(start, end)
+        blocks.append((max(start, window_start), min(end, window_end)))
+    blocks.sort()
+
+    busy = []
+    for start, end in blocks:
+        if busy and start <= busy[-1][1]:
+            busy[-1][1] = max(busy[-1][1], end)
+        else:
+            busy.append([start, end])
+    free = []
+    free_from = window_start
+    for start, end in busy:
+        if start > free_from:
+            free.append((free_from, start))
+        free_from = end
+    if free_from < window_end:
+        free.append((free_from, window_end))
+
+    def as_json(intervals):
+        return [{"start": start.isoformat(), "end": end.isoformat()} for start, end in intervals]
+    return {"start": window_start.isoformat(), "end": window_end.isoformat(), "busy": as_json(busy), "free": as_json(free)}
+
+def find_event_conflicts(user_id, event):
+    """
+    Returns agenda entries for the events and course meetings that overlap an event (a stored row or a
+    proposed one; its own event_id is excluded). For a recurring event, occurrences in the next
+    CONFLICT_LOOKAHEAD_DAYS are checked. At most CONFLICT_MAX_REPORTED conflicts are returned.
+    """
+    start = epoch_to_datetime(iso_to_epoch(get_iso_datetime(event.get('start_datetime'))))
+    if start is None:
+        return []
+    start, end = event_span(start, epoch_to_datetime(iso_to_epoch(get_iso_datetime(event.get('end_datetime')))))
+    duration = end - start
+    if event.get('recurrence'):
+        horizon_start = max(start, datetime.datetime.now().replace(microsecond=0))
+        horizon_end = horizon_start + datetime.timedelta(days=CONFLICT_LOOKAHEAD_DAYS)
+        occurrences = list(itertools.islice(iter_occurrences(event['recurrence'], start, horizon_start, horizon_end),
+                                            AGENDA_MAX_OCCURRENCES_PER_ITEM))
+    else:
+        occurrences = [start]
+    if not occurrences:
+        return []
+
+    # One pass over everything in the span of all occurrences, then an index lookup per occurrence
+    others = IntervalIndex(
+        (*event_span(other_start, other_end), (kind, item, other_start, other_end, recurring))
+        for kind, item, other_start, other_end, recurring
+        in iter_agenda_spans(user_id, ('events', 'courses'), occurrences[0], occurrences[-1] + duration, use_event_index=False)
+        if not (kind == 'events' and item['event_id'] == event.get('event_id'))
+    )
+    conflicts = []
+    for occurrence in occurrences:
+        for _, _, (kind, item, other_start, other_end, recurring) in others.overlapping(occurrence, occurrence + duration):
+            conflicts.append(_agenda_entry(kind, item, other_start, other_end, recurring))
+            if len(conflicts) >= CONFLICT_MAX_REPORTED:
+                return conflicts
+    return conflicts
+
+def describe_conflicts(conflicts, subject="it"):
+    """A short chat warning naming the first few conflicts, or "" if there are none."""
+    if not conflicts:
+        return ""
+    names = [f"'{entry['title']}' ({datetime.datetime.fromisoformat(entry['start']).strftime('%a %b %d, %H:%M')})"
+             for entry in conflicts[:3]]
+    more = f" and {len(conflicts) - 3} more" if len(conflicts) > 3 else ""
+    return f" Heads up: {subject} overlaps with {', '.join(names)}{more}."
+
+# --- Conversation Memory ---
+# The prompt gets a stored per-user summary of older turns plus as many recent turns (oldest first)
+# as fit in HISTORY_TOKEN_BUDGET. Once enough turns pile up past the summary, the older ones are
+# rolled up into it, so both the prompt and the rows read per chat stay bounded.
+
+def estimate_tokens(text):
+    """Rough token count (~4 characters per token) plus per-message overhead; good enough for budgeting."""
+    return len(text or '') // 4 + 4
+
+def get_conversation_memory(user_id):
+    """Returns (summary, summarized_through_id) for a user; ('', 0) if nothing has been rolled up yet."""
+    row = get_user_db(user_id).execute(
+        "SELECT summary, summarized_through_id FROM conversation_memory WHERE user_id = ?", (user_id,)
+    ).fetchone()
+    return (row['summary'], row['summarized_through_id']) if row else ('', 0)
+
+def get_recent_history_rows(user_id, limit, after_id=0):
+    """Newest-first history rows with id > after_id (i.e. not yet in the summary). Ordered by id, which is insertion order."""
+    db = get_user_db(user_id)
+    cursor = db.execute(
+        "SELECT id, sender, message, parsed_action FROM conversation_history WHERE user_id = ? AND id > ? ORDER BY id DESC LIMIT ?",
+        (user_id, after_id, limit)
+    )
+    return cursor.fetchall()
+
+def history_row_to_message(row):
+    # Kairo's turns are replayed as the JSON action it produced, so the model keeps answering in the same format
+    if row['sender'] == 'user':
+        return {"role": "user", "content": row['message']}
+    return {"role": "assistant", "content": row['parsed_action'] or row['message']}
+
+def read_conversation_state(user_id):
+    """The user's (summary, newest-first rows after it), including turns still queued in the history writer."""
+    def read_stored():
+        summary, summarized_through_id = get_conversation_memory(user_id)
+        return summary, get_recent_history_rows(user_id, HISTORY_MAX_MESSAGES, summarized_through_id)
+    (summary, rows), pending = history_writer.read_with_pending(user_id, read_stored)
+    if pending:
+        rows = (pending[::-1] + list(rows))[:HISTORY_MAX_MESSAGES] # Queued rows are always newer than stored ones
+    return summary, rows
+
+def build_conversation_context(user_id, token_budget=None):
+    """
+    Returns chat messages for the prompt, oldest first: the rolled-up summary (if any) as a system
+    message, then the most recent turns that fit in the token budget.
+    """
+    token_budget = HISTORY_TOKEN_BUDGET if token_budget is None else token_budget
+    summary, rows = read_conversation_state(user_id)
+
+    summary_message = None
+    if summary:
+        summary_message = {"role": "system", "content": f"Summary of earlier conversation (oldest first):\n{summary}"}
+        token_budget -= estimate_tokens(summary_message["content"])
+
+    recent_messages = []
+    for row in rows: # Newest first, so the budget keeps the latest turns
+        message = history_row_to_message(row)
+        token_budget -= estimate_tokens(message["content"])
+        if token_budget < 0:
+            break
+        recent_messages.append(message)
+    recent_messages.reverse()
+    if recent_messages and recent_messages[0]["role"] == "assistant":
+        recent_messages.pop(0) # Don't start the window halfway through a turn
+    return ([summary_message] if summary_message else []) + recent_messages
+
+def summarize_history_row(row):
+    """One summary line for a history row: Kairo's action with its target, or the start of the user's message."""
+    if row['sender'] == 'user':
+        text = " ".join(row['message'].split())
+        return f"User: {text[:HISTORY_SUMMARY_LINE_CHARS]}{'...' if len(text) > HISTORY_SUMMARY_LINE_CHARS else ''}"
+    try:
+        action = json.loads(row['parsed_action']) if row['parsed_action'] else None
+    except ValueError:
+        action = None
+    if not isinstance(action, dict) or not action.get('action') or action.get('action') == 'respond_conversation':
+        text = " ".join((row['message'] or '').split())
+        return f"Kairo: {text[:HISTORY_SUMMARY_LINE_CHARS]}"
+    target = next((action[key] for key in ('title', 'name', 'title_keywords', 'name_keywords', 'task_id', 'event_id', 'course_id', 'item_type')
+                   if action.get(key)), None)
+    return f"Kairo: {action['action']}" + (f" '{target}'" if target else "")
+
+def roll_up_conversation_history(user_id):
+    """
+    Folds all but the newest HISTORY_KEEP_RAW_MESSAGES unsummarized rows into the user's summary once more
+    than HISTORY_SUMMARIZE_AFTER_MESSAGES have accumulated. The summary keeps its newest HISTORY_SUMMARY_MAX_LINES lines.
+    """
+    db = get_user_db(user_id)
+    summary, summarized_through_id = get_conversation_memory(user_id)
+    pending = db.execute(
+        "SELECT COUNT(*) FROM conversation_history WHERE user_id = ? AND id > ?", (user_id, summarized_through_id)
+    ).fetchone()[0]
+    if pending <= HISTORY_SUMMARIZE_AFTER_MESSAGES:
+        return False
+
+    rows = db.execute(
+        "SELECT id, sender, message, parsed_action FROM conversation_history WHERE user_id = ? AND id > ? ORDER BY id LIMIT ?",
+        (user_id, summarized_through_id, pending - HISTORY_KEEP_RAW_MESSAGES)
+    ).fetchall()
+    lines = (summary.splitlines() if summary else []) + [summarize_history_row(row) for row in rows]
+    db.execute('''
+        INSERT INTO conversation_memory (user_id, summary, summarized_through_id, updated_at) VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT(user_id) DO UPDATE SET summary = excluded.summary, summarized_through_id = excluded.summarized_through_id,
+            updated_at = excluded.updated_at
+    ''', (user_id, "\n".join(lines[-HISTORY_SUMMARY_MAX_LINES:]), rows[-1]['id']))
+    db.commit()
+    return True
+
+# --- Conversation Log Write-Behind ---
+# Chat turns are queued in memory and written to conversation_history in batches by one background
+# thread (per shard, one transaction per flush), then rolled up as usual. Until a row is written it
+# stays in its user's pending tail, which read_conversation_state() adds to the stored rows, so the next
+# turn always sees the previous one. The queue is bounded: when it is full a chat turn waits briefly and
+# then flushes the queue itself. Whatever is still queued is written at shutdown.
+
+HISTORY_INSERT_SQL = "INSERT INTO conversation_history (user_id, sender, message, parsed_action, timestamp) VALUES (?, ?, ?, ?, ?)"
+
+class HistoryWriter:
+    def __init__(self, max_rows=HISTORY_QUEUE_MAX_ROWS):
+        self.max_rows = max_rows
+        self._queue = collections.deque() # Row dicts in arrival order
+        self._pending = {} # user_id -> row dicts not yet committed, oldest first
+        self._generation = 0 # Bumped when a flush starts writing and again when it has moved rows out of _pending
+        self._flushing = False # True from just before a flush commits until its rows have left _pending
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._flush_lock = threading.Lock() # One flush at a time, whichever thread runs it
+        self._thread = None
+        self._stopping = False
+        self.flushed = 0
+        self.failures = 0
+
+    def ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None and not self._stopping:
+                self._thread = threading.Thread(target=self._work, name="kairo-history-writer", daemon=True)
+                self._thread.start()
+
+    def enqueue(self, user_id, rows):
+        """Queues one turn's rows (dicts with sender, message, parsed_action). Waits, then flushes, if the queue is full."""
+        timestamp = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime()) # Same format and clock as CURRENT_TIMESTAMP
+        rows = [dict(row, user_id=user_id, timestamp=timestamp) for row in rows]
+        self.ensure_started()
+        while True:
+            with self._lock:
+                if not self._changed.wait_for(lambda: len(self._queue) + len(rows) <= self.max_rows or self._stopping,
+                                              timeout=HISTORY_QUEUE_WAIT_SECONDS):
+                    print("Warning: History write queue is full; flushing from the request thread.")
+                elif not self._stopping:
+                    self._queue.extend(rows)
+                    self._pending.setdefault(user_id, []).extend(rows)
+                    if len(self._queue) >= HISTORY_FLUSH_BATCH_ROWS:
+                        self._changed.notify_all()
+                    return
+            if self._stopping:
+                with app.app_context(): # Shutting down: nothing will flush after us
+                    self._write({user_id: rows})
+                return
+            if not self.flush():
+                raise APIError("Could not save the conversation right now; please try again shortly.", 503)
+
+    def read_with_pending(self, user_id, read):
+        """
+        Returns (read(), the user's queued rows) taken consistently. A flush that commits during read() could
+        make a row show up in both or in neither, so the snapshot waits out a running flush and the read is
+        retried if another one started meanwhile.
+        """
+        for _ in range(3):
+            with self._lock:
+                self._changed.wait_for(lambda: not self._flushing, timeout=HISTORY_QUEUE_WAIT_SECONDS)
+                generation = self._generation
+                pending = list(self._pending.get(user_id, ()))
+            result = read()
+            with self._lock:
+                if generation == self._generation:
+                    return result, pending
+        with self._flush_lock: # Flushing non-stop; read while holding flushes off
+            with self._lock:
+                pending = list(self._pending.get(user_id, ()))
+            return read(), pending
+
+    def flush(self):
+        """Writes everything queued so far, one transaction per database, and returns the number of rows written."""
+        with self._flush_lock:
+            with self._lock:
+                batch = list(self._queue)
+            if not batch:
+                return 0
+            rows_by_user = {}
+            for row in batch:
+                rows_by_user.setdefault(row['user_id'], []).append(row)
+            with self._lock:
+                self._flushing = True
+                self._generation += 1
+            written = set()
+            try:
+                with app.app_context():
+                    written = self._write(rows_by_user)
+            finally:
+                with self._lock:
+                    self._queue = collections.deque(row for row in self._queue if id(row) not in written)
+                    for user_id in rows_by_user:
+                        remaining = [row for row in self._pending.get(user_id, ()) if id(row) not in written]
+                        if remaining:
+                            self._pending[user_id] = remaining
+                        else:
+                            self._pending.pop(user_id, None)
+                    self._flushing = False
+                    self._generation += 1
+                    self._changed.notify_all()
+            self.flushed += len(written)
+            metrics.inc('kairo_history_rows_flushed_total', len(written))
+            metrics.observe('kairo_history_flush_rows', len(written))
+            with app.app_context():
+                for user_id in rows_by_user:
+                    try:
+                        roll_up_conversation_history(user_id)
+                    except sqlite3.Error as e:
+                        print(f"Warning: Could not roll up history for {user_id}: {e}")
+            return len(written)
+
+    def _write(self, rows_by_user):
+        """Inserts the rows, committing once per database; returns the ids of the rows that were committed."""
+        rows_by_db = {}
+        for user_id, rows in rows_by_user.items():
+            db = get_user_db(user_id)
+            rows_by_db.setdefault(id(db), (db, []))[1].extend(rows)
+        written = set()
+        for db, rows in rows_by_db.values():
+            try:
+                db.executemany(HISTORY_INSERT_SQL, [
+                    (row['user_id'], row['sender'], row['message'], row['parsed_action'], row['timestamp']) for row in rows
+                ])
+                db.commit()
+            except sqlite3.Error as e:
+                db.rollback()
+                self.failures += 1
+                print(f"Error: Could not write {len(rows)} conversation rows (will retry): {e}")
+                continue
+            written.update(id(row) for row in rows)
+        return written
+
+    def _work(self):
+        while True:
+            with self._lock:
+                self._changed.wait_for(lambda: len(self._queue) >= HISTORY_FLUSH_BATCH_ROWS or self._stopping,
+                                       timeout=HISTORY_FLUSH_INTERVAL_SECONDS)
+                if self._stopping:
+                    return
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error: History writer flush failed: {e}")
+                time.sleep(HISTORY_FLUSH_INTERVAL_SECONDS)
+
+    def stop(self):
+        """Stops the thread and writes whatever is still queued."""
+        with self._lock:
+            self._stopping = True
+            self._changed.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout=HISTORY_FLUSH_INTERVAL_SECONDS + 5)
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"Error: Could not flush the history queue at shutdown: {e}")
+
+    def get_stats(self):
+        with self._lock:
+            return {"queued": len(self._queue), "users_pending": len(self._pending), "flushed": self.flushed,
+                    "failed_flushes": self.failures, "max_rows": self.max_rows}
+
+history_writer = HistoryWriter()
+atexit.register(history_writer.stop) # Registered after the connection pools, so it runs before they close
+
+# --- Fast-Path Intent Parser ---
+# Deterministic rules for high-frequency commands. They emit the same action JSON the LLM would,
+# so process_ai_action does not care which path produced it. Anything not matched falls back to Ollama.
+
+WEEKDAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+_WEEKDAY_PATTERN = "|".join(WEEKDAYS)
+_DATE_PATTERN = (
+    rf"today|tonight|tomorrow|day after tomorrow|(?:next|this|on)\s+(?:{_WEEKDAY_PATTERN})|{_WEEKDAY_PATTERN}"
+    r"|in\s+\d{1,3}\s+days?|\d{4}-\d{2}-\d{2}"
+)
+_TIME_PATTERN = r"\d{1,2}(?::\d{2})?\s*(?:am|pm|a\.m\.|p\.m\.)|\d{1,2}:\d{2}|noon|midnight"
+_DATE = rf"(?P<date>{_DATE_PATTERN})"
+_TIME = rf"(?P<time>{_TIME_PATTERN})"
+_STATUS_WORDS = {
+    'completed': 'completed', 'complete': 'completed', 'done': 'completed', 'finished': 'completed',
+    'pending': 'pending', 'in-progress': 'in-progress', 'in progress': 'in-progress',
+    'cancelled': 'cancelled', 'canceled': 'cancelled',
+}
+_ITEM_TYPE_WORDS = {
+    'tasks': 'tasks', 'todos': 'tasks', 'to-dos': 'tasks',
+    'events': 'events', 'meetings': 'events', 'appointments': 'events',
+    'courses': 'courses', 'classes': 'courses',
+    'items': 'all', 'everything': 'all',
+}
+_ID_PATTERN = re.compile(r"^(task|event|course)_\S+$")
+_LEADING_ARTICLES = re.compile(r"^(?:(?:the|a|an|my)\s+)+", re.IGNORECASE)
+# Targets that describe an item rather than name it ("with Bob", "about taxes", "it"); the LLM resolves those
+_INDIRECT_TARGET = re.compile(
+    r"^(?:with|about|regarding|for|from|on|at|in|to|of|it|that|this|these|those|them|all|every|everything|each|both)\b",
+    re.IGNORECASE
+)
+_CONJUNCTION = re.compile(r"\b(?:and|or|plus|then|but)\b|[,;&+]", re.IGNORECASE) # More than one item
+
+def resolve_relative_date(text, today):
+    """Resolves phrases like 'today', 'tomorrow', 'next friday' or 'in 3 days' to a date."""
+    text = " ".join(text.lower().split())
+    if text in ('today', 'tonight'):
+        return today
+    if text == 'tomorrow':
+        return today + datetime.timedelta(days=1)
+    if text == 'day after tomorrow':
+        return today + datetime.timedelta(days=2)
+    match = re.fullmatch(r"in (\d{1,3}) days?", text)
+    if match:
+        return today + datetime.timedelta(days=int(match.group(1)))
+    match = re.fullmatch(rf"(?:(next|this|on) )?({_WEEKDAY_PATTERN})", text)
+    if match:
+        days_ahead = (WEEKDAYS.index(match.group(2)) - today.weekday()) % 7
+        if days_ahead == 0 and match.group(1) == 'next':
+            days_ahead = 7 # "next friday" said on a Friday means a week from today
+        return today + datetime.timedelta(days=days_ahead)
+    try:
+        return datetime.date.fromisoformat(text)
+    except ValueError:
+        return None
+
+def resolve_time(text):
+    """Resolves '5 pm', '5:30pm', '17:00', 'noon' or 'midnight' to (hour, minute)."""
+    text = text.lower().replace('.', '').replace(' ', '')
+    if text == 'noon':
+        return 12, 0
+    if text == 'midnight':
+        return 0, 0
+    match = re.fullmatch(r"(\d{1,2})(?::(\d{2}))?(am|pm)?", text)
+    if not match:
+        return None
+    hour, minute, meridiem = int(match.group(1)), int(match.group(2) or 0), match.group(3)
+    if meridiem:
+        if not 1 <= hour <= 12:
+            return None
+        hour = hour % 12 + (12 if meridiem == 'pm' else 0)
+    if hour > 23 or minute > 59:
+        return None
+    return hour, minute
+
+def _format_datetime(date_text, time_text, today, default_time=None):
+    """Combines matched date/time phrases into YYYY-MM-DDTHH:MM:SS, or None if they don't resolve."""
+    date = resolve_relative_date(date_text, today) if date_text else today
+    if date is None:
+        return None
+    if time_text:
+        resolved_time = resolve_time(time_text)
+        if resolved_time is None:
+            return None
+        return f"{date.isoformat()}T{resolved_time[0]:02d}:{resolved_time[1]:02d}:00"
+    if default_time:
+        return f"{date.isoformat()}T{default_time}"
+    return None
+
+def _capitalize(text):
+    text = text.strip().strip('"\'')
+    return text[:1].upper() + text[1:]
+
+def _strip_articles(text):
+    return _LEADING_ARTICLES.sub('', text.strip())
+
+def _target_fields(target, id_key, keywords_key):
+    """
+    Maps a matched target to either an explicit ID or title/name keywords. Returns None (fall back to the
+    LLM) when the target is not a direct title or names several items; quoted titles are taken as they are.
+    """
+    target = target.strip()
+    quoted = re.fullmatch(r"([\"'])(.+)\1", target)
+    if quoted:
+        return {keywords_key: quoted.group(2).strip()}
+    if _ID_PATTERN.match(target):
+        return {id_key: target}
+    target = _strip_articles(target)
+    if not target or _INDIRECT_TARGET.match(target) or _CONJUNCTION.search(target):
+        return None
+    return {keywords_key: target}
+
+def _targeted_action(action, match, id_key, keywords_key, **fields):
+    """An update/delete action aimed at the matched target, or None if the target is ambiguous."""
+    target_fields = _target_fields(match.group('target'), id_key, keywords_key)
+    if target_fields is None:
+        return None
+    return {"action": action, **target_fields, **fields}
+
+def _build_retrieve(match, today):
+    item_type = _ITEM_TYPE_WORDS[match.group('type').lower()]
+    parsed_action = {"action": "retrieve_items", "item_type": item_type}
+    qualifier = (match.groupdict().get('qualifier') or '').lower()
+    if qualifier:
+        if item_type != 'tasks':
+            return None
+        if qualifier in ('high', 'medium', 'low'):
+            parsed_action['priority'] = qualifier
+        else:
+            parsed_action['status'] = _STATUS_WORDS[qualifier]
+    if match.groupdict().get('date'):
+        date = resolve_relative_date(match.group('date'), today)
+        if date is None:
+            return None
+        parsed_action['date'] = date.isoformat()
+    return parsed_action
+
+def _build_mark_task(match, today):
+    return _targeted_action("update_task", match, 'task_id', 'title_keywords',
+                            status=_STATUS_WORDS[match.group('status').lower()])
+
+def _build_complete_task(match, today):
+    return _targeted_action("update_task", match, 'task_id', 'title_keywords', status="completed")
+
+def _build_task_priority(match, today):
+    return _targeted_action("update_task", match, 'task_id', 'title_keywords', priority=match.group('priority').lower())
+
+def _build_reschedule_task(match, today):
+    due_datetime = _format_datetime(match.group('date'), match.group('time'), today, default_time="23:59:59")
+    if due_datetime is None:
+        return None
+    return _targeted_action("update_task", match, 'task_id', 'title_keywords', due_datetime=due_datetime)
+
+def _build_reschedule_event(match, today):
+    start_datetime = _format_datetime(match.group('date'), match.group('time'), today)
+    if start_datetime is None:
+        return None
+    return _targeted_action("update_event", match, 'event_id', 'title_keywords', start_datetime=start_datetime)
+
+def _build_course_instructor(match, today):
+    return _targeted_action("update_course", match, 'course_id', 'name_keywords',
+                            instructor=_capitalize(match.group('instructor')))
+
+def _build_delete(match, today):
+    kind = {'task': 'task', 'event': 'event', 'meeting': 'event', 'appointment': 'event',
+            'course': 'course', 'class': 'course'}[match.group('kind').lower()]
+    id_key = f"{kind}_id"
+    keywords_key = 'name_keywords' if kind == 'course' else 'title_keywords'
+    return _targeted_action(f"delete_{kind}", match, id_key, keywords_key)
+
+def _build_delete_by_id(match, today):
+    item_id = match.group('id')
+    kind = item_id.split('_', 1)[0].lower()
+    return {"action": f"delete_{kind}", f"{kind}_id": item_id}
+
+def _build_create_task(match, today):
+    title = match.group('title')
+    # A trailing "at 5" without am/pm is ambiguous; let the LLM handle it
+    if re.search(r"\bat\s+\d", title):
+        return None
+    due_datetime = None
+    if match.group('date') or match.group('time'):
+        due_datetime = _format_datetime(match.group('date'), match.group('time'), today, default_time="23:59:59")
+        if due_datetime is None:
+            return None
+    return {"action": "create_task", "title": _capitalize(_strip_articles(title)), "description": None, "due_datetime": due_datetime,
+            "priority": (match.groupdict().get('priority') or 'medium').lower(), "status": "pending", "tags": None,
+            "course_id": None, "parent_id": None}
+
+def _build_create_event(match, today):
+    start_datetime = _format_datetime(match.group('date'), match.group('time'), today)
+    if start_datetime is None:
+        return None
+    end_datetime = None
+    if match.group('end'):
+        end_datetime = _format_datetime(match.group('date'), match.group('end'), today)
+        if end_datetime is None or end_datetime <= start_datetime:
+            return None
+    return {"action": "create_event", "title": _capitalize(_strip_articles(match.group('title'))), "start_datetime": start_datetime,
+            "end_datetime": end_datetime, "description": None, "location": None, "attendees": None}
+
+def _build_create_course(match, today):
+    return {"action": "create_course", "name": _capitalize(_strip_articles(match.group('name'))), "description": None,
+            "instructor": None, "schedule": None, "start_date": None, "end_date": None}
+
+_TYPE_WORDS = "|".join(re.escape(word) for word in _ITEM_TYPE_WORDS)
+_QUALIFIER = r"(?P<qualifier>pending|completed|in-progress|in progress|cancelled|high|medium|low)(?:\s+priority)?"
+_STATUS = r"(?P<status>completed|complete|done|finished|pending|in-progress|in progress|cancelled|canceled)"
+
+# (pattern, builder) pairs, tried in order against the normalized message
+FAST_PATH_RULES = [(re.compile(pattern, re.IGNORECASE), builder) for pattern, builder in [
+    (rf"(?:please\s+)?(?:list|show|display|get|view)(?:\s+me)?(?:\s+all)?(?:\s+(?:of\s+)?my)?(?:\s+{_QUALIFIER})?"
+     rf"\s+(?P<type>{_TYPE_WORDS})(?:\s+(?:for|on|due)\s+{_DATE})?", _build_retrieve),
+    (rf"what\s+(?:{_QUALIFIER}\s+)?(?P<type>{_TYPE_WORDS})\s+do\s+i\s+have(?:\s+(?:for\s+|on\s+|due\s+)?{_DATE})?",
+     _build_retrieve),
+    (rf"mark\s+(?:the\s+)?(?:task\s+)?(?P<target>.+?)\s+as\s+{_STATUS}", _build_mark_task),
+    (r"(?:complete|finish)\s+(?:the\s+)?task\s+(?P<target>.+)", _build_complete_task),
+    (r"(?:set|change)\s+(?:the\s+)?priority\s+of\s+(?:the\s+)?(?:task\s+)?(?P<target>.+?)\s+to\s+(?P<priority>high|medium|low)",
+     _build_task_priority),
+    (rf"(?:move|change|reschedule)\s+(?:the\s+)?(?:due\s+date\s+of\s+)?(?:the\s+)?task\s+(?P<target>.+?)\s+to\s+{_DATE}"
+     rf"(?:\s+at\s+{_TIME})?", _build_reschedule_task),
+    (rf"(?:move|reschedule)\s+(?:the\s+)?(?:event|meeting|appointment)\s+(?P<target>.+?)\s+to\s+{_DATE}\s+at\s+{_TIME}",
+     _build_reschedule_event),
+    (r"(?:change|set)\s+(?:the\s+)?instructor\s+(?:of|for)\s+(?:the\s+)?(?:course\s+)?(?P<target>.+?)\s+to\s+(?P<instructor>.+)",
+     _build_course_instructor),
+    (r"(?:delete|remove)\s+(?P<id>(?:task|event|course)_\S+)", _build_delete_by_id),
+    (r"(?:delete|remove|cancel)\s+(?:the\s+|my\s+)?(?P<kind>task|event|meeting|appointment|course|class)\s+"
+     r"(?:called\s+|named\s+)?(?P<target>.+)", _build_delete),
+    (rf"(?:create|add|new)\s+(?:a\s+|an\s+)?(?:(?P<priority>high|medium|low)[\s-]priority\s+)?task(?:\s*:\s*|\s+to\s+|\s+)"
+     rf"(?P<title>.+?)(?:\s+(?:(?:due|by|on|for)\s+)?{_DATE})?(?:\s+at\s+{_TIME})?", _build_create_task),
+    (rf"remind\s+me\s+to\s+(?P<title>.+?)(?:\s+(?:(?:by|on)\s+)?{_DATE})?(?:\s+at\s+{_TIME})?", _build_create_task),
+    (rf"(?:schedule|add|create|book)\s+(?:a\s+|an\s+)?(?:event|meeting|appointment)(?:\s*:\s*|\s+)(?P<title>.+?)"
+     rf"\s+(?:on\s+|for\s+)?{_DATE}\s+(?:at|from)\s+{_TIME}(?:\s*(?:-|to|until)\s*(?P<end>{_TIME_PATTERN}))?",
+     _build_create_event),
+    (rf"(?:schedule|add|create|book)\s+(?:a\s+|an\s+|my\s+)?(?P<title>.+?\s+(?:meeting|appointment))"
+     rf"\s+(?:on\s+|for\s+)?{_DATE}\s+(?:at|from)\s+{_TIME}(?:\s*(?:-|to|until)\s*(?P<end>{_TIME_PATTERN}))?",
+     _build_create_event),
+    (r"(?:add|create)\s+(?:a\s+|my\s+)?(?:new\s+)?course\s*(?::\s*|\s+(?:called\s+|named\s+)?)(?P<name>[^,]+?)",
+     _build_create_course),
+]]
+
+fast_path_stats = {"hits": 0, "misses": 0}
+fast_path_stats_lock = threading.Lock()
+
+def fast_parse_action(user_message, today=None):
+    """
+    Tries the deterministic rules before the LLM. Returns an action dict in the LLM's schema,
+    or None when the message should go to Ollama. Records the hit rate in fast_path_stats.
+    """
+    parsed_action = None
+    if FAST_PATH_ENABLED:
+        today = today or datetime.date.today()
+        normalized = " ".join(user_message.split()).rstrip(".!?").strip()
+        for pattern, builder in FAST_PATH_RULES:
+            match = pattern.fullmatch(normalized)
+            if match:
+                parsed_action = builder(match, today)
+                if parsed_action is not None:
+                    break
+
+    with fast_path_stats_lock:
+        fast_path_stats["hits" if parsed_action else "misses"] += 1
+    if parsed_action:
+        print(f"Fast-path parsed action: {parsed_action}")
+    return parsed_action
+
+def get_fast_path_stats():
+    with fast_path_stats_lock:
+        total = fast_path_stats["hits"] + fast_path_stats["misses"]
+        return dict(fast_path_stats, total=total, hit_rate=fast_path_stats["hits"] / total if total else 0.0)
+
 # --- Ollama AI Integration ---
 
-def get_ollama_response(messages_history):
+class OllamaBusyError(APIError):
+    """Raised when inference is saturated and the request is shed instead of queued."""
+    def __init__(self, message="Kairo is busy with other requests right now. Please try again in a moment."):
+        super().__init__(message, 503)
+
+class _InFlightCall:
+    """A non-streaming request that identical concurrent callers wait on instead of re-sending."""
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class OllamaClient:
+    """
+    Shared client for Ollama's /api/chat. Reuses keep-alive connections through one requests.Session,
+    caps concurrent inference with a semaphore, sheds load once too many callers are waiting,
+    and coalesces identical in-flight non-streaming requests into a single call.
+    """
+    def __init__(self, url=None, max_concurrency=OLLAMA_MAX_CONCURRENCY, max_queue=OLLAMA_MAX_QUEUE,
+                 queue_timeout=OLLAMA_QUEUE_TIMEOUT):
+        self.url = url # None means use OLLAMA_URL at call time
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self._in_flight_calls = {}
+        self._queued = 0
+        self._active = 0
+        self._stats = {"requests": 0, "completed": 0, "errors": 0, "coalesced": 0, "shed": 0, "max_queued": 0}
+
+    @contextlib.contextmanager
+    def slot(self):
+        """Holds one of the max_concurrency inference slots; raises OllamaBusyError instead of waiting too long."""
+        with self._lock:
+            if self._queued >= self.max_queue:
+                self._stats["shed"] += 1
+                raise OllamaBusyError()
+            self._queued += 1
+            self._stats["max_queued"] = max(self._stats["max_queued"], self._queued)
+        wait_started = time.perf_counter()
+        acquired = self._semaphore.acquire(timeout=self.queue_timeout)
+        metrics.observe('kairo_ollama_slot_wait_seconds', time.perf_counter() - wait_started)
+        with self._lock:
+            self._queued -= 1
+            if not acquired:
+                self._stats["shed"] += 1
+                raise OllamaBusyError()
+            self._active += 1
+            self._stats["requests"] += 1
+        failed = False
+        try:
+            yield
+        except BaseException as e:
+            failed = not isinstance(e, GeneratorExit)
+            raise
+        finally:
+            self._semaphore.release()
+            with self._lock:
+                self._active -= 1
+                self._stats["errors" if failed else "completed"] += 1
+
+    def chat(self, payload):
+        """Posts a non-streaming chat request and returns the decoded JSON response."""
+        key = hashlib.sha1(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()
+        with self._lock:
+            call = self._in_flight_calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = self._in_flight_calls[key] = _InFlightCall()
+            else:
+                self._stats["coalesced"] += 1
+
+        if not is_leader:
+            if not call.done.wait(timeout=self.queue_timeout + OLLAMA_TIMEOUT):
+                raise requests.exceptions.Timeout("Timed out waiting for a coalesced Ollama request.")
+            if call.error is not None:
+                raise call.error
+            return copy.deepcopy(call.result)
+
+        try:
+            with self.slot():
+                started = time.perf_counter()
+                try:
+                    response = self.session.post(self.url or OLLAMA_URL, json=payload,
+                                                 timeout=(OLLAMA_CONNECT_TIMEOUT, OLLAMA_TIMEOUT))
+                    response.raise_for_status() # Raise an HTTPError for bad responses (4xx or 5xx)
+                    call.result = response.json()
+                finally:
+                    metrics.observe('kairo_ollama_request_duration_seconds', time.perf_counter() - started, mode='chat')
+                record_ollama_usage('chat', call.result)
+            return copy.deepcopy(call.result)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight_calls[key]
+            call.done.set()
+
+    def stream_chat(self, payload):
+        """Posts a streaming chat request and yields each decoded NDJSON chunk while holding a slot."""
+        with self.slot():
+            started = time.perf_counter()
+            first_token_seen = False
+            try:
+                with self.session.post(self.url or OLLAMA_URL, json=payload, stream=True,
+                                       timeout=(OLLAMA_CONNECT_TIMEOUT, OLLAMA_TIMEOUT)) as response:
+                    response.raise_for_status()
+                    for line in response.iter_lines():
+                        if line:
+                            chunk = json.loads(line)
+                            if not first_token_seen and chunk.get("message", {}).get("content"):
+                                first_token_seen = True
+                                metrics.observe('kairo_ollama_time_to_first_token_seconds',
+                                                time.perf_counter() - started, mode='stream')
+                            if chunk.get("done"):
+                                record_ollama_usage('stream', chunk)
+                            yield chunk
+            finally:
+                # Streams closed early (once the action JSON is complete) count up to the close
+                metrics.observe('kairo_ollama_request_duration_seconds', time.perf_counter() - started, mode='stream')
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self._stats, active=self._active, queued=self._queued,
+                        in_flight_calls=len(self._in_flight_calls), max_concurrency=self.max_concurrency,
+                        max_queue=self.max_queue)
+
+ollama_client = OllamaClient()
+
+def get_ollama_response(messages_history, response_format=None):
     """
     Sends messages to Ollama's /api/chat endpoint and returns the AI's content.
     messages_history should be a list of dicts like [{"role": "user", "content": "..."}, ...]
+    response_format is passed as Ollama's "format" ("json" or a JSON schema) to constrain the output.
     """
-    headers = {'Content-Type': 'application/json'}
     payload = {
         "model": OLLAMA_MODEL,
         "messages": messages_history,
-        "stream": False # Get a single complete response
+        "stream": False, # Get a single complete response
+        "keep_alive": OLLAMA_KEEP_ALIVE
     }
+    if response_format is not None:
+        payload["format"] = response_format
 
     try:
-        response = requests.post(OLLAMA_URL, headers=headers, data=json.dumps(payload), timeout=120)
-        response.raise_for_status() # Raise an HTTPError for bad responses (4xx or 5xx)
-        response_json = response.json()
+        response_json = ollama_client.chat(payload)
 
         if "message" in response_json and "content" in response_json["message"]:
             return response_json["message"]["content"]
@@ -357,15 +2951,106 @@ def get_ollama_response(messages_history):
         print(f"Error calling Ollama API: {e}")
         return f"An error occurred while communicating with the AI: {e}"
 
-def parse_ai_action(user_message, conversation_history_list):
+def stream_ollama_response(messages_history, response_format=None):
     """
-    Uses Ollama to parse user intent and extract structured JSON actions.
-    The LLM is prompted to output JSON.
+    Streams the AI's content from Ollama's /api/chat endpoint, yielding text chunks as they arrive.
+    Ollama sends one JSON object per line (NDJSON) until a chunk with "done": true.
+    Closing the generator early closes the HTTP response, which stops generation on the Ollama side.
     """
-    current_date_str = datetime.date.today().isoformat()
-    
-    # Define the core system prompt template as a regular string
-    system_prompt_template = """
+    payload = {
+        "model": OLLAMA_MODEL,
+        "messages": messages_history,
+        "stream": True,
+        "keep_alive": OLLAMA_KEEP_ALIVE
+    }
+    if response_format is not None:
+        payload["format"] = response_format
+
+    chunks = ollama_client.stream_chat(payload)
+    try:
+        for chunk in chunks:
+            if chunk.get("error"):
+                print(f"Error: Ollama stream returned an error: {chunk['error']}")
+                raise APIError(f"The AI returned an error: {chunk['error']}", 502)
+            content = chunk.get("message", {}).get("content")
+            if content:
+                yield content
+            if chunk.get("done"):
+                break
+    except requests.exceptions.ConnectionError as e:
+        print(f"Error: Could not connect to Ollama server at {OLLAMA_URL}. Is Ollama running? {e}")
+        raise APIError("I'm sorry, I cannot connect to the AI at the moment. Please ensure Ollama is running.", 503)
+    except requests.exceptions.Timeout:
+        print("Error: Ollama stream timed out.")
+        raise APIError("The AI took too long to respond. Please try again.", 504)
+    except requests.exceptions.RequestException as e:
+        print(f"Error calling Ollama API: {e}")
+        raise APIError(f"An error occurred while communicating with the AI: {e}", 502)
+    finally:
+        chunks.close()
+
+class JSONObjectScanner:
+    """
+    Incrementally scans streamed text and reports the first top-level JSON object as soon as its
+    closing brace arrives. Tracks string literals and escapes so braces inside strings are ignored,
+    and the open objects/arrays so a truncated object can be closed off (see truncated_candidates).
+    """
+    def __init__(self):
+        self.text = ""
+        self._pos = 0
+        self._start = None
+        self._stack = [] # Open '{' / '[' characters, innermost last
+        self._member_starts = [] # Per open container: where its last (possibly incomplete) member begins
+        self._in_string = False
+        self._escaped = False
+
+    def feed(self, chunk):
+        """Adds a chunk; returns the complete JSON object text once it has closed, else None."""
+        self.text += chunk
+        while self._pos < len(self.text):
+            char = self.text[self._pos]
+            self._pos += 1
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"' and self._start is not None:
+                self._in_string = True
+            elif char in '{[':
+                if char == '{' and self._start is None:
+                    self._start = self._pos - 1
+                if self._start is not None:
+                    self._stack.append(char)
+                    self._member_starts.append(self._pos)
+            elif char in '}]' and self._stack:
+                self._stack.pop()
+                self._member_starts.pop()
+                if not self._stack:
+                    return self.text[self._start:self._pos]
+            elif char == ',' and self._stack:
+                self._member_starts[-1] = self._pos - 1
+        return None
+
+    def truncated_candidates(self):
+        """
+        For output that stopped inside the object: the text closed as-is (if it ended between values),
+        then with the innermost unfinished member dropped, so a half-written value is never kept.
+        """
+        if self._start is None or not self._stack:
+            return []
+        closers = "".join('}' if char == '{' else ']' for char in reversed(self._stack))
+        candidates = []
+        if not self._in_string and not self.text.rstrip().endswith((':', ',')):
+            candidates.append(self.text[self._start:].rstrip() + closers)
+        candidates.append(self.text[self._start:self._member_starts[-1]].rstrip() + closers)
+        return candidates
+
+# The action schema and guidelines only change with the date, so the rendered prompt is a stable
+# prefix that Ollama can reuse across turns. History and the user message follow as chat messages.
+SYSTEM_PROMPT_TEMPLATE = """
         You are an AI assistant named Kairo for a personal organizer app. Your primary goal is to understand user requests and convert them into structured JSON actions, or provide helpful conversational responses.
         
         **Always output ONLY a single JSON object. Do not include any other text or markdown outside the JSON.**
@@ -374,7 +3059,7 @@ def parse_ai_action(user_message, conversation_history_list):
 
         1.  **Create a Task:**
             ```json
-            {{"action": "create_task", "title": "string (required)", "description": "string (optional)", "due_datetime": "YYYY-MM-DDTHH:MM:SS (optional)", "priority": "low|medium|high (optional, default 'medium')", "status": "pending|in-progress|completed|cancelled (optional, default 'pending')", "tags": "comma-separated strings (optional)", "course_id": "string (optional, if related to a course)", "parent_id": "string (optional, for sub-tasks)"}}
+            {{"action": "create_task", "title": "string (required)", "description": "string (optional)", "due_datetime": "YYYY-MM-DDTHH:MM:SS (optional)", "priority": "low|medium|high (optional, default 'medium')", "status": "pending|in-progress|completed|cancelled (optional, default 'pending')", "tags": "comma-separated strings (optional)", "course_id": "string (optional, if related to a course)", "parent_id": "string (optional, for sub-tasks)", "recurrence": "RRULE such as FREQ=WEEKLY;BYDAY=MO (optional, for repeating tasks)"}}
             ```
             * **Examples:**
                 * "Create a task: buy groceries." -> `{{"action": "create_task", "title": "Buy groceries", "description": null, "due_datetime": null, "priority": "medium", "status": "pending", "tags": null, "course_id": null, "parent_id": null}}`
@@ -400,15 +3085,16 @@ def parse_ai_action(user_message, conversation_history_list):
 
         4.  **Create an Event:**
             ```json
-            {{"action": "create_event", "title": "string (required)", "start_datetime": "YYYY-MM-DDTHH:MM:SS (required)", "description": "string (optional)", "end_datetime": "YYYY-MM-DDTHH:MM:SS (optional)", "location": "string (optional)", "attendees": "comma-separated emails (optional)"}}
+            {{"action": "create_event", "title": "string (required)", "start_datetime": "YYYY-MM-DDTHH:MM:SS (required)", "description": "string (optional)", "end_datetime": "YYYY-MM-DDTHH:MM:SS (optional)", "location": "string (optional)", "attendees": "comma-separated emails (optional)", "recurrence": "RRULE: FREQ=DAILY|WEEKLY|MONTHLY|YEARLY with optional INTERVAL, BYDAY, COUNT, UNTIL=YYYYMMDD (optional, for repeating events)"}}
             ```
             * **Examples:**
                 * "Schedule a meeting for tomorrow at 10 AM for 1 hour about project review." (Assume current date is {current_date}) -> `{{"action": "create_event", "title": "Project Review Meeting", "start_datetime": "{tomorrow_date}T10:00:00", "end_datetime": "{tomorrow_date}T11:00:00", "location": null, "description": "project review", "attendees": null}}`
                 * "Add a dentist appointment on 2025-07-15 at 3 PM." -> `{{"action": "create_event", "title": "Dentist Appointment", "start_datetime": "2025-07-15T15:00:00", "description": null, "end_datetime": null, "location": null, "attendees": null}}`
+                * "Team standup every Monday and Wednesday at 9 AM starting tomorrow." -> `{{"action": "create_event", "title": "Team Standup", "start_datetime": "{tomorrow_date}T09:00:00", "end_datetime": null, "recurrence": "FREQ=WEEKLY;BYDAY=MO,WE", "description": null, "location": null, "attendees": null}}`
 
         5.  **Update an Event:**
             ```json
-            {{"action": "update_event", "event_id": "string (required, if identifiable)", "title_keywords": "string (optional, keywords to identify event by title if ID not given)", "title": "string (optional)", "description": "string (optional)", "start_datetime": "YYYY-MM-DDTHH:MM:SS (optional)", "end_datetime": "YYYY-MM-DDTHH:MM:SS (optional)", "location": "string (optional)", "attendees": "comma-separated emails (optional)"}}
+            {{"action": "update_event", "event_id": "string (required, if identifiable)", "title_keywords": "string (optional, keywords to identify event by title if ID not given)", "title": "string (optional)", "description": "string (optional)", "start_datetime": "YYYY-MM-DDTHH:MM:SS (optional)", "end_datetime": "YYYY-MM-DDTHH:MM:SS (optional)", "location": "string (optional)", "attendees": "comma-separated emails (optional)", "recurrence": "RRULE (optional)"}}
             ```
             * **Example:** "Reschedule dentist appointment to next Wednesday at 4 PM." (Assume next Wednesday is {next_wednesday_date}) -> `{{"action": "update_event", "title_keywords": "dentist appointment", "start_datetime": "{next_wednesday_date}T16:00:00"}}`
 
@@ -420,7 +3106,7 @@ def parse_ai_action(user_message, conversation_history_list):
 
         7.  **Create a Course:**
             ```json
-            {{"action": "create_course", "name": "string (required)", "description": "string (optional)", "instructor": "string (optional)", "schedule": "string (optional)", "start_date": "YYYY-MM-DD (optional)", "end_date": "YYYY-MM-DD (optional)"}}
+            {{"action": "create_course", "name": "string (required)", "description": "string (optional)", "instructor": "string (optional)", "schedule": "days and time, e.g. Mon,Wed,Fri 09:00-10:00 (optional)", "start_date": "YYYY-MM-DD (optional)", "end_date": "YYYY-MM-DD (optional)"}}
             ```
             * **Example:** "Add my new course: Data Structures, instructor John Doe, starts next month." (Assume next month starts {next_month_start_date}) -> `{{"action": "create_course", "name": "Data Structures", "description": null, "instructor": "John Doe", "schedule": null, "start_date": "{next_month_start_date}", "end_date": null}}`
 
@@ -438,7 +3124,7 @@ def parse_ai_action(user_message, conversation_history_list):
 
         10. **Retrieve All (Tasks/Events/Courses - or specific type):**
             ```json
-            {{"action": "retrieve_items", "item_type": "tasks|events|courses|all (optional, default 'all')", "status": "pending|in-progress|completed|cancelled|all (optional, for tasks)", "priority": "low|medium|high (optional, for tasks)", "date": "YYYY-MM-DD (optional, for events)", "date_range_start": "YYYY-MM-DD (optional, for events)", "date_range_end": "YYYY-MM-DD (optional, for events)", "keywords": "string (optional, for title/name search)"}}
+            {{"action": "retrieve_items", "item_type": "tasks|events|courses|all (optional, default 'all')", "status": "pending|in-progress|completed|cancelled|all (optional, for tasks)", "priority": "low|medium|high (optional, for tasks)", "date": "YYYY-MM-DD (optional, for events)", "date_range_start": "YYYY-MM-DD (optional, for events)", "date_range_end": "YYYY-MM-DD (optional, for events)", "keywords": "string (optional, for title/name search)", "instructor": "string (optional, for courses)", "limit": "integer (optional, max number of items per type)"}}
             ```
             * **Examples:**
                 * "List my pending tasks." -> `{{"action": "retrieve_items", "item_type": "tasks", "status": "pending"}}`
@@ -455,26 +3141,29 @@ def parse_ai_action(user_message, conversation_history_list):
                 * "What's the weather like?" -> `{{"action": "respond_conversation", "response_text": "I can only help you manage your tasks, events, and courses. I cannot provide weather updates."}}`
                 * "How are you?" -> `{{"action": "respond_conversation", "response_text": "I am an AI, so I don't have feelings, but I'm ready to help!"}}`
 
+        12. **Several Actions at Once:**
+            ```json
+            {{"action": "batch", "actions": [/* two or more of the actions above */]}}
+            ```
+            * **Example:** "Add tasks to buy milk and to call the bank." -> `{{"action": "batch", "actions": [{{"action": "create_task", "title": "Buy milk", "priority": "medium", "status": "pending"}}, {{"action": "create_task", "title": "Call the bank", "priority": "medium", "status": "pending"}}]}}`
+
         **Important Guidelines for Kairo:**
         * Calculate specific YYYY-MM-DD or YYYY-MM-DDTHH:MM:SS dates/datetimes for relative terms (e.g., "today", "tomorrow", "next Monday", "next week", "next month") based on the current date: **{current_date}**.
         * If the user asks to update or delete an item and doesn't provide an ID, assume `title_keywords` or `name_keywords` and fill that field with keywords from their message. If the item type is ambiguous (e.g., "delete the report"), ask for clarification.
         * If a request is ambiguous or requires more information for a structured action, default to `respond_conversation` and ask for clarification, or provide a helpful general response.
         * If the user asks for something completely outside the scope of available actions (e.g., "What's the capital of France?"), use `respond_conversation` and gently remind them of your capabilities regarding tasks, events, and courses.
-        * Use the provided `conversation_history_list` to maintain context for follow-up questions.
+        * Use the earlier messages in this conversation to maintain context for follow-up questions. Your earlier replies are shown as the JSON actions you produced.
         * When inferring `title_keywords` or `name_keywords`, be as precise as possible, taking into account the full user message.
+        * If one message asks for several things (e.g., "add these five tasks"), return a single `batch` action listing them all instead of only the first.
 
         Current Date: {current_date}
-
-        Conversation History:
-        {conversation_history_json}
-
-        User Message: "{user_message}"
-
-        Your JSON Action:
     """
-    
+
+@functools.lru_cache(maxsize=2)
+def render_system_prompt(current_date_str):
+    """Renders the action-parsing system prompt for a date (YYYY-MM-DD). Cached, so this runs once per day."""
     # Calculate dynamic dates for examples
-    today = datetime.date.today()
+    today = datetime.date.fromisoformat(current_date_str)
     tomorrow = today + datetime.timedelta(days=1)
     next_friday = today + datetime.timedelta(days=(4 - today.weekday() + 7) % 7) # Friday is weekday 4
     next_monday = today + datetime.timedelta(days=(0 - today.weekday() + 7) % 7) # Monday is weekday 0
@@ -491,8 +3180,8 @@ def parse_ai_action(user_message, conversation_history_list):
     next_week_start_date = start_of_current_week + datetime.timedelta(weeks=1)
     next_week_end_date = next_week_start_date + datetime.timedelta(days=6)
 
-    # Format the system prompt template with dynamic dates and history
-    formatted_system_prompt = system_prompt_template.format(
+    # Format the system prompt template with dynamic dates
+    return SYSTEM_PROMPT_TEMPLATE.format(
         current_date=current_date_str,
         tomorrow_date=tomorrow.isoformat(),
         next_friday_date=next_friday.isoformat(),
@@ -500,37 +3189,340 @@ def parse_ai_action(user_message, conversation_history_list):
         next_wednesday_date=next_wednesday.isoformat(),
         next_month_start_date=next_month_start.isoformat(),
         next_week_start_date=next_week_start_date.isoformat(),
-        next_week_end_date=next_week_end_date.isoformat(),
-        conversation_history_json=json.dumps(conversation_history_list), # Insert JSON string of history
-        user_message=user_message
+        next_week_end_date=next_week_end_date.isoformat()
     )
 
-    messages_for_ollama = [
-        {"role": "system", "content": formatted_system_prompt},
-        {"role": "user", "content": user_message} # The current user message, directly
-    ]
+def build_action_messages(user_message, conversation_history_list):
+    """
+    Builds the Ollama messages for action parsing: the cached system prompt, then the conversation
+    history (oldest first) as chat messages, then the current user message.
+    """
+    formatted_system_prompt = render_system_prompt(datetime.date.today().isoformat())
 
-    try:
-        raw_response = get_ollama_response(messages_for_ollama)
-        print(f"Ollama raw action response: {raw_response}")
+    messages_for_ollama = [{"role": "system", "content": formatted_system_prompt}]
+    messages_for_ollama.extend(conversation_history_list)
+    messages_for_ollama.append({"role": "user", "content": user_message}) # The current user message, directly
+    return messages_for_ollama
+
+# --- Action Schema and Repair ---
+# The per-action schemas below mirror SYSTEM_PROMPT_TEMPLATE. They are sent as Ollama's "format" (so
+# constrained decoding only yields well-formed actions) and used to validate what comes back. Output that
+# is still unusable is repaired locally where possible (trailing text, truncation, trailing commas); an
+# invalid action, or one invalid item of a batch, is then re-prompted on its own with a short prompt
+# instead of re-running the whole conversation.
+
+# action -> (required fields, fields of which at least one is required, all fields)
+ACTION_SCHEMAS = {
+    'create_task': (['title'], [], ['title', 'description', 'due_datetime', 'priority', 'status', 'tags', 'course_id', 'parent_id', 'recurrence']),
+    'update_task': ([], ['task_id', 'title_keywords'], ['task_id', 'title_keywords', 'title', 'description', 'due_datetime', 'priority', 'status', 'tags', 'course_id', 'parent_id', 'recurrence']),
+    'delete_task': ([], ['task_id', 'title_keywords'], ['task_id', 'title_keywords']),
+    'create_event': (['title', 'start_datetime'], [], ['title', 'start_datetime', 'description', 'end_datetime', 'location', 'attendees', 'recurrence']),
+    'update_event': ([], ['event_id', 'title_keywords'], ['event_id', 'title_keywords', 'title', 'description', 'start_datetime', 'end_datetime', 'location', 'attendees', 'recurrence']),
+    'delete_event': ([], ['event_id', 'title_keywords'], ['event_id', 'title_keywords']),
+    'create_course': (['name'], [], ['name', 'description', 'instructor', 'schedule', 'start_date', 'end_date']),
+    'update_course': ([], ['course_id', 'name_keywords'], ['course_id', 'name_keywords', 'name', 'description', 'instructor', 'schedule', 'start_date', 'end_date']),
+    'delete_course': ([], ['course_id', 'name_keywords'], ['course_id', 'name_keywords']),
+    'retrieve_items': ([], [], ['item_type', 'status', 'priority', 'date', 'date_range_start', 'date_range_end', 'keywords', 'instructor', 'limit']),
+    'respond_conversation': (['response_text'], [], ['response_text']),
+    'batch': (['actions'], [], ['actions']),
+}
+ACTION_ENUM_FIELDS = {
+    'priority': ['low', 'medium', 'high'],
+    'status': ['pending', 'in-progress', 'completed', 'cancelled'],
+    'item_type': ['tasks', 'events', 'courses', 'all'],
+}
+# action -> {field: allowed values} where an action accepts other values than ACTION_ENUM_FIELDS
+ACTION_ENUM_OVERRIDES = {
+    'retrieve_items': {'status': ACTION_ENUM_FIELDS['status'] + ['all']}, # Only a filter can ask for every status
+}
+ACTION_DATETIME_FIELDS = {'due_datetime', 'start_datetime', 'end_datetime'}
+ACTION_DATE_FIELDS = {'date', 'date_range_start', 'date_range_end', 'start_date', 'end_date'}
+
+def action_enum_values(action_name, field):
+    """The values an action accepts for an enum field."""
+    return ACTION_ENUM_OVERRIDES.get(action_name, {}).get(field, ACTION_ENUM_FIELDS[field])
 
-        # Attempt to clean the response if it contains markdown or extra text outside JSON
-        match = re.search(r'\{.*\}', raw_response, re.DOTALL)
-        if match:
-            json_string = match.group(0)
+def build_action_schema(action_names):
+    """JSON schema (for Ollama's format) of an object that is one of the given actions."""
+    if len(action_names) > 1:
+        # One branch per action, so each field only allows what that action accepts (e.g. status 'all')
+        return {"anyOf": [build_action_schema([name]) for name in action_names]}
+    name = action_names[0]
+    properties = {"action": {"type": "string", "enum": [name]}}
+    for field in ACTION_SCHEMAS[name][2]:
+        if field == 'actions':
+            properties[field] = {"type": "array", "items": build_action_schema([a for a in ACTION_SCHEMAS if a != 'batch'])}
+        elif field == 'limit':
+            properties[field] = {"type": ["integer", "null"]}
+        elif field in ACTION_ENUM_FIELDS:
+            properties[field] = {"type": ["string", "null"], "enum": action_enum_values(name, field) + [None]}
         else:
-            json_string = raw_response.strip() # Assume it's just JSON if no markdown
-        
-        parsed_action = json.loads(json_string)
-        return parsed_action
-    except json.JSONDecodeError as e:
-        print(f"Failed to parse AI action JSON: {raw_response} - Error: {e}")
+            properties[field] = {"type": ["string", "null"]}
+    return {"type": "object", "properties": properties, "required": ["action"] + ACTION_SCHEMAS[name][0]}
+
+ACTION_FORMAT_SCHEMA = build_action_schema(list(ACTION_SCHEMAS))
+
+def action_response_format():
+    return ACTION_FORMAT_SCHEMA if OLLAMA_STRUCTURED_OUTPUT else None
+
+_TRAILING_COMMA_PATTERN = re.compile(r',(\s*[}\]])')
+
+def parse_action_text(raw_text):
+    """
+    Tolerant parse of model output: returns (first JSON object as a dict, or None; whether it needed
+    repair). Ignores code fences and anything around the object, closes off truncated objects and
+    drops trailing commas.
+    """
+    scanner = JSONObjectScanner()
+    object_text = scanner.feed(raw_text)
+    candidates = [object_text] if object_text is not None else scanner.truncated_candidates()
+    for index, candidate in enumerate(candidates):
+        for text in dict.fromkeys((candidate, _TRAILING_COMMA_PATTERN.sub(r'\1', candidate))):
+            try:
+                value = json.loads(text)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(value, dict):
+                return value, object_text is None or text != candidate
+    return None, False
+
+def validate_action(action):
+    """
+    Checks one action object against its schema and returns a list of problems (empty if valid).
+    Normalizes in place what can be fixed without the model: enum case and synonyms ("done"),
+    numbers and booleans given for string fields.
+    """
+    name = action.get('action')
+    if name not in ACTION_SCHEMAS:
+        return [f"'action' must be one of: {', '.join(ACTION_SCHEMAS)}"]
+    required, one_of, fields = ACTION_SCHEMAS[name]
+    problems = [f"'{field}' is required" for field in required if action.get(field) in (None, '', [])]
+    if one_of and not any(action.get(field) for field in one_of):
+        problems.append(f"one of {' or '.join(repr(field) for field in one_of)} is required")
+    for field in fields:
+        value = action.get(field)
+        if value is None or field == 'actions':
+            continue
+        if field == 'limit':
+            if not isinstance(value, int) and not (isinstance(value, str) and value.strip().isdigit()):
+                problems.append("'limit' must be an integer")
+            continue
+        if not isinstance(value, str):
+            if isinstance(value, (dict, list)):
+                problems.append(f"'{field}' must be a string")
+                continue
+            value = action[field] = str(value)
+        if field in ACTION_ENUM_FIELDS:
+            words = _STATUS_WORDS if field == 'status' else _ITEM_TYPE_WORDS if field == 'item_type' else {}
+            value = action[field] = words.get(value.strip().lower(), value.strip().lower())
+            allowed = action_enum_values(name, field)
+            if value not in allowed:
+                problems.append(f"'{field}' must be one of: {', '.join(allowed)}")
+        elif field in ACTION_DATETIME_FIELDS and value and get_iso_datetime(value) is None:
+            problems.append(f"'{field}' must be a datetime as YYYY-MM-DDTHH:MM:SS")
+        elif field in ACTION_DATE_FIELDS and value and get_iso_date(value) is None:
+            problems.append(f"'{field}' must be a date as YYYY-MM-DD")
+    if name == 'batch' and not isinstance(action.get('actions'), list):
+        problems.append("'actions' must be a list of actions")
+    return problems
+
+REPAIR_SYSTEM_PROMPT = (
+    "You fix one JSON action for Kairo, a personal organizer. Reply with only the corrected JSON object, "
+    "keeping every field that is already valid. Use the user's request to fill in missing values. "
+    "Datetimes are YYYY-MM-DDTHH:MM:SS and dates YYYY-MM-DD; today is {current_date}."
+)
+
+def reprompt_action_fragment(user_message, fragment_text, problems, action_name=None):
+    """Asks the model to fix one action fragment (not the conversation); returns the new action dict or None."""
+    messages = [
+        {"role": "system", "content": REPAIR_SYSTEM_PROMPT.format(current_date=datetime.date.today().isoformat())},
+        {"role": "user", "content": f"Request: {user_message}\nAction: {fragment_text[:ACTION_REPAIR_MAX_CHARS]}\n"
+                                    f"Problems: {'; '.join(problems)}"},
+    ]
+    schema = build_action_schema([action_name]) if action_name in ACTION_SCHEMAS else ACTION_FORMAT_SCHEMA
+    raw_response = get_ollama_response(messages, schema if OLLAMA_STRUCTURED_OUTPUT else None)
+    print(f"Ollama repaired action fragment: {raw_response}")
+    repaired, _ = parse_action_text(raw_response)
+    return repaired
+
+def repair_action(user_message, action, problems):
+    """Re-prompts an invalid action until it validates or ACTION_REPAIR_ATTEMPTS runs out; returns the best version."""
+    for _ in range(ACTION_REPAIR_ATTEMPTS):
+        name = action.get('action') if action.get('action') in ACTION_SCHEMAS else None
+        candidate = reprompt_action_fragment(user_message, json.dumps(action), problems, name)
+        if candidate is None:
+            break
+        action, problems = candidate, validate_action(candidate)
+        if not problems:
+            metrics.inc('kairo_action_repairs_total', method='reprompt', outcome='fixed')
+            return action
+    metrics.inc('kairo_action_repairs_total', method='reprompt', outcome='failed')
+    print(f"Action still invalid after repair ({'; '.join(problems)}); running it as is.")
+    return action
+
+def extract_action_json(raw_response, user_message):
+    """
+    Extracts the JSON action object from the model's raw text output, validates it (and every item of a
+    batch) and repairs what is invalid. Raises APIError(500) only if there is no JSON object to work with.
+    """
+    parsed_action, repaired = parse_action_text(raw_response)
+    if parsed_action is None and '{' in raw_response:
+        metrics.inc('kairo_action_parse_failures_total')
+        parsed_action = reprompt_action_fragment(user_message, raw_response, ["not a complete, valid JSON object"])
+        metrics.inc('kairo_action_repairs_total', method='reprompt', outcome='fixed' if parsed_action else 'failed')
+    elif parsed_action is None:
+        metrics.inc('kairo_action_parse_failures_total')
+    if parsed_action is None:
+        print(f"Failed to parse AI action JSON: {raw_response}")
         raise APIError("Kairo understood your request but generated an invalid action format. Please try rephrasing.", 500)
+    if repaired:
+        metrics.inc('kairo_action_repairs_total', method='local', outcome='fixed')
+
+    problems = validate_action(parsed_action)
+    if problems:
+        return repair_action(user_message, parsed_action, problems)
+    if parsed_action['action'] == 'batch':
+        # Only the invalid items are re-prompted; the valid ones are kept as they are
+        items = parsed_action['actions']
+        items[:] = [item for item in items if item != {}] # Left over when a truncated object is closed off
+        for index, item in enumerate(items):
+            item_problems = validate_action(item) if isinstance(item, dict) else ["each item must be an action object"]
+            if item_problems:
+                items[index] = repair_action(user_message, item if isinstance(item, dict) else {"action": None}, item_problems)
+    return parsed_action
+
+def parse_ai_action(user_message, conversation_history_list):
+    """
+    Uses Ollama to parse user intent and extract structured JSON actions.
+    The LLM is prompted to output JSON, and constrained to the action schema when OLLAMA_STRUCTURED_OUTPUT is on.
+    """
+    messages_for_ollama = build_action_messages(user_message, conversation_history_list)
+
+    try:
+        raw_response = get_ollama_response(messages_for_ollama, action_response_format())
+        print(f"Ollama raw action response: {raw_response}")
+        return extract_action_json(raw_response, user_message)
+    except APIError:
+        raise
     except Exception as e:
         print(f"Error in parse_ai_action: {e}")
         raise APIError("Kairo encountered an issue parsing your request into an action. Please try again.", 500)
 
 
+# --- Parsed Action Cache ---
+# Caches the LLM's *parse* of a message, never the result of running it: a cached create_task is still
+# executed against the database every time. Keys include the date so relative dates ("tomorrow") stay
+# correct, the user, and a hash of the last exchange whenever there is history: a bare "yes" or "sure, go
+# ahead" means whatever the previous turn asked, so a parse is only reused for the same user in the same context.
+
+def normalize_message(user_message):
+    """Lowercases and collapses whitespace/trailing punctuation so trivially different phrasings share a key."""
+    return " ".join(user_message.lower().split()).rstrip(".!? ")
+
+def action_cache_key(user_id, user_message, conversation_history_list, today=None):
+    """Builds the cache key from the user, the normalized message, the current date and the last exchange."""
+    today = today or datetime.date.today()
+    normalized = normalize_message(user_message)
+    history_hash = ""
+    if conversation_history_list:
+        last_exchange = json.dumps(conversation_history_list[-2:], sort_keys=True)
+        history_hash = hashlib.sha1(last_exchange.encode('utf-8')).hexdigest()[:16]
+    raw_key = json.dumps([user_id, today.isoformat(), normalized, history_hash])
+    return hashlib.sha1(raw_key.encode('utf-8')).hexdigest()
+
+class ActionCache:
+    """
+    Bounded LRU of parsed actions with a TTL, written through to the action_cache table so it
+    survives restarts. The table is pruned to the same size and TTL as the in-memory LRU.
+    """
+    def __init__(self, max_entries=ACTION_CACHE_SIZE, ttl_seconds=ACTION_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = collections.OrderedDict() # key -> (parsed_action, created_at)
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "stores": 0}
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and now - entry[1] < self.ttl_seconds:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return copy.deepcopy(entry[0])
+            self._entries.pop(key, None)
+
+        # Fall back to the persisted table (e.g. right after a restart)
+        row = get_db().execute(
+            "SELECT parsed_action, created_at FROM action_cache WHERE cache_key = ? AND created_at > ?",
+            (key, now - self.ttl_seconds)
+        ).fetchone()
+        with self._lock:
+            if row is None:
+                self._stats["misses"] += 1
+                return None
+            self._stats["hits"] += 1
+            parsed_action = json.loads(row['parsed_action'])
+            self._remember(key, parsed_action, row['created_at'])
+            return copy.deepcopy(parsed_action)
+
+    def put(self, key, parsed_action):
+        now = time.time()
+        with self._lock:
+            self._remember(key, copy.deepcopy(parsed_action), now)
+            self._stats["stores"] += 1
+            prune = self._stats["stores"] % ACTION_CACHE_PRUNE_INTERVAL == 0
+        db = get_db()
+        db.execute(
+            "INSERT OR REPLACE INTO action_cache (cache_key, parsed_action, created_at) VALUES (?, ?, ?)",
+            (key, json.dumps(parsed_action), now)
+        )
+        if prune:
+            db.execute("DELETE FROM action_cache WHERE created_at <= ?", (now - self.ttl_seconds,))
+            db.execute(
+                "DELETE FROM action_cache WHERE cache_key NOT IN (SELECT cache_key FROM action_cache ORDER BY created_at DESC LIMIT ?)",
+                (self.max_entries,)
+            )
+        db.commit()
+
+    def _remember(self, key, parsed_action, created_at):
+        """Inserts into the in-memory LRU, evicting the least recently used entries. Caller holds the lock."""
+        self._entries[key] = (parsed_action, created_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def get_stats(self):
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return dict(self._stats, size=len(self._entries), max_entries=self.max_entries,
+                        hit_rate=self._stats["hits"] / lookups if lookups else 0.0)
+
+action_cache = ActionCache()
+
+def get_cached_action(user_id, user_message, conversation_history_list):
+    """Returns a previously parsed action for this user/message/date/context, or None."""
+    if not ACTION_CACHE_ENABLED:
+        return None
+    parsed_action = action_cache.get(action_cache_key(user_id, user_message, conversation_history_list))
+    if parsed_action:
+        print(f"Action cache hit: {parsed_action}")
+    return parsed_action
+
+def store_cached_action(user_id, user_message, conversation_history_list, parsed_action):
+    """Remembers a successful LLM parse; only well-formed actions are cached."""
+    if ACTION_CACHE_ENABLED and isinstance(parsed_action, dict) and parsed_action.get('action'):
+        action_cache.put(action_cache_key(user_id, user_message, conversation_history_list), parsed_action)
+
+def parse_ai_action_cached(user_id, user_message, conversation_history_list):
+    """parse_ai_action with the parsed action cache in front of it."""
+    parsed_action = get_cached_action(user_id, user_message, conversation_history_list)
+    if parsed_action is None:
+        parsed_action = parse_ai_action(user_message, conversation_history_list)
+        store_cached_action(user_id, user_message, conversation_history_list, parsed_action)
+    return parsed_action
+
 def process_ai_action(user_id, parsed_action):
     """
     Executes the identified AI action using the backend functions.
@@ -556,13 +3548,14 @@ def process_ai_action(user_id, parsed_action):
                 status=parsed_action.get('status'),
                 tags=parsed_action.get('tags'),
                 course_id=parsed_action.get('course_id'),
-                parent_id=parsed_action.get('parent_id')
+                parent_id=parsed_action.get('parent_id'),
+                recurrence=parsed_action.get('recurrence')
             )
             if task_obj:
                 response_message = f"Task '{task_obj['title']}' created successfully (ID: {task_obj['task_id']})."
             else:
                 response_message = "Failed to create task."
-            tasks_result = get_all_tasks_for_user(user_id) # Refresh list
+            tasks_result = [task_obj] if task_obj else [] # Only the changed item; clients sync the rest via /changes
 
         elif action_type == "update_task":
             task_id_or_keywords = parsed_action.get('task_id') or parsed_action.get('title_keywords')
@@ -573,8 +3566,7 @@ def process_ai_action(user_id, parsed_action):
                 if parsed_action.get('task_id'):
                     target_task = get_task_by_id(user_id, parsed_action['task_id'])
                 elif parsed_action.get('title_keywords'):
-                    all_tasks = get_all_tasks_for_user(user_id)
-                    matching_tasks = [t for t in all_tasks if parsed_action['title_keywords'].lower() in t['title'].lower()]
+                    matching_tasks = find_items_by_keywords('tasks', user_id, parsed_action['title_keywords'])
                     if len(matching_tasks) == 1:
                         target_task = matching_tasks[0]
                     elif len(matching_tasks) > 1:
@@ -585,11 +3577,11 @@ def process_ai_action(user_id, parsed_action):
                     updates = {k: v for k, v in parsed_action.items() if k not in ['action', 'task_id', 'title_keywords']}
                     if update_task_in_db(target_task['task_id'], user_id, updates):
                         response_message = f"Task '{target_task['title']}' updated successfully."
+                        tasks_result = [get_task_by_id(user_id, target_task['task_id'])]
                     else:
                         response_message = f"Failed to update task '{target_task['title']}'. No changes applied or task not found."
                 else:
                     response_message = "Task not found."
-            tasks_result = get_all_tasks_for_user(user_id) # Refresh list
 
         elif action_type == "delete_task":
             task_id_or_keywords = parsed_action.get('task_id') or parsed_action.get('title_keywords')
@@ -600,8 +3592,7 @@ def process_ai_action(user_id, parsed_action):
                 if parsed_action.get('task_id'):
                     target_task = get_task_by_id(user_id, parsed_action['task_id'])
                 elif parsed_action.get('title_keywords'):
-                    all_tasks = get_all_tasks_for_user(user_id)
-                    matching_tasks = [t for t in all_tasks if parsed_action['title_keywords'].lower() in t['title'].lower()]
+                    matching_tasks = find_items_by_keywords('tasks', user_id, parsed_action['title_keywords'])
                     if len(matching_tasks) == 1:
                         target_task = matching_tasks[0]
                     elif len(matching_tasks) > 1:
@@ -615,7 +3606,6 @@ def process_ai_action(user_id, parsed_action):
                         response_message = f"Failed to delete task '{target_task['title']}'. Task not found."
                 else:
                     response_message = "Task not found."
-            tasks_result = get_all_tasks_for_user(user_id) # Refresh list
 
         elif action_type == "create_event":
             event_obj = add_event_to_db(
@@ -625,13 +3615,15 @@ def process_ai_action(user_id, parsed_action):
                 description=parsed_action.get('description'),
                 end_datetime=parsed_action.get('end_datetime'),
                 location=parsed_action.get('location'),
-                attendees=parsed_action.get('attendees')
+                attendees=parsed_action.get('attendees'),
+                recurrence=parsed_action.get('recurrence')
             )
             if event_obj:
                 response_message = f"Event '{event_obj['title']}' created successfully (ID: {event_obj['event_id']})."
+                response_message += describe_conflicts(find_event_conflicts(user_id, event_obj))
             else:
                 response_message = "Failed to create event."
-            events_result = get_all_events_for_user(user_id) # Refresh list
+            events_result = [event_obj] if event_obj else [] # Only the changed item; clients sync the rest via /changes
 
         elif action_type == "update_event":
             event_id_or_keywords = parsed_action.get('event_id') or parsed_action.get('title_keywords')
@@ -642,8 +3634,7 @@ def process_ai_action(user_id, parsed_action):
                 if parsed_action.get('event_id'):
                     target_event = get_event_by_id(user_id, parsed_action['event_id'])
                 elif parsed_action.get('title_keywords'):
-                    all_events = get_all_events_for_user(user_id)
-                    matching_events = [e for e in all_events if parsed_action['title_keywords'].lower() in e['title'].lower()]
+                    matching_events = find_items_by_keywords('events', user_id, parsed_action['title_keywords'])
                     if len(matching_events) == 1:
                         target_event = matching_events[0]
                     elif len(matching_events) > 1:
@@ -654,11 +3645,12 @@ def process_ai_action(user_id, parsed_action):
                     updates = {k: v for k, v in parsed_action.items() if k not in ['action', 'event_id', 'title_keywords']}
                     if update_event_in_db(target_event['event_id'], user_id, updates):
                         response_message = f"Event '{target_event['title']}' updated successfully."
+                        events_result = [get_event_by_id(user_id, target_event['event_id'])]
+                        response_message += describe_conflicts(find_event_conflicts(user_id, events_result[0]))
                     else:
                         response_message = f"Failed to update event '{target_event['title']}'. No changes applied or event not found."
                 else:
                     response_message = "Event not found."
-            events_result = get_all_events_for_user(user_id) # Refresh list
 
         elif action_type == "delete_event":
             event_id_or_keywords = parsed_action.get('event_id') or parsed_action.get('title_keywords')
@@ -669,8 +3661,7 @@ def process_ai_action(user_id, parsed_action):
                 if parsed_action.get('event_id'):
                     target_event = get_event_by_id(user_id, parsed_action['event_id'])
                 elif parsed_action.get('title_keywords'):
-                    all_events = get_all_events_for_user(user_id)
-                    matching_events = [e for e in all_events if parsed_action['title_keywords'].lower() in e['title'].lower()]
+                    matching_events = find_items_by_keywords('events', user_id, parsed_action['title_keywords'])
                     if len(matching_events) == 1:
                         target_event = matching_events[0]
                     elif len(matching_events) > 1:
@@ -684,7 +3675,6 @@ def process_ai_action(user_id, parsed_action):
                         response_message = f"Failed to delete event '{target_event['title']}'. Event not found."
                 else:
                     response_message = "Event not found."
-            events_result = get_all_events_for_user(user_id) # Refresh list
 
         elif action_type == "create_course":
             course_obj = add_course_to_db(
@@ -700,7 +3690,7 @@ def process_ai_action(user_id, parsed_action):
                 response_message = f"Course '{course_obj['name']}' created successfully (ID: {course_obj['course_id']})."
             else:
                 response_message = "Failed to create course."
-            courses_result = get_all_courses_for_user(user_id) # Refresh list
+            courses_result = [course_obj] if course_obj else [] # Only the changed item; clients sync the rest via /changes
 
         elif action_type == "update_course":
             course_id_or_keywords = parsed_action.get('course_id') or parsed_action.get('name_keywords')
@@ -711,8 +3701,7 @@ def process_ai_action(user_id, parsed_action):
                 if parsed_action.get('course_id'):
                     target_course = get_course_by_id(user_id, parsed_action['course_id'])
                 elif parsed_action.get('name_keywords'):
-                    all_courses = get_all_courses_for_user(user_id)
-                    matching_courses = [c for c in all_courses if parsed_action['name_keywords'].lower() in c['name'].lower()]
+                    matching_courses = find_items_by_keywords('courses', user_id, parsed_action['name_keywords'])
                     if len(matching_courses) == 1:
                         target_course = matching_courses[0]
                     elif len(matching_courses) > 1:
@@ -723,11 +3712,11 @@ def process_ai_action(user_id, parsed_action):
                     updates = {k: v for k, v in parsed_action.items() if k not in ['action', 'course_id', 'name_keywords']}
                     if update_course_in_db(target_course['course_id'], user_id, updates):
                         response_message = f"Course '{target_course['name']}' updated successfully."
+                        courses_result = [get_course_by_id(user_id, target_course['course_id'])]
                     else:
                         response_message = f"Failed to update course '{target_course['name']}'. No changes applied or course not found."
                 else:
                     response_message = "Course not found."
-            courses_result = get_all_courses_for_user(user_id) # Refresh list
 
         elif action_type == "delete_course":
             course_id_or_keywords = parsed_action.get('course_id') or parsed_action.get('name_keywords')
@@ -738,8 +3727,7 @@ def process_ai_action(user_id, parsed_action):
                 if parsed_action.get('course_id'):
                     target_course = get_course_by_id(user_id, parsed_action['course_id'])
                 elif parsed_action.get('name_keywords'):
-                    all_courses = get_all_courses_for_user(user_id)
-                    matching_courses = [c for c in all_courses if parsed_action['name_keywords'].lower() in c['name'].lower()]
+                    matching_courses = find_items_by_keywords('courses', user_id, parsed_action['name_keywords'])
                     if len(matching_courses) == 1:
                         target_course = matching_courses[0]
                     elif len(matching_courses) > 1:
@@ -753,43 +3741,110 @@ def process_ai_action(user_id, parsed_action):
                         response_message = f"Failed to delete course '{target_course['name']}'. Course not found."
                 else:
                     response_message = "Course not found."
-            courses_result = get_all_courses_for_user(user_id) # Refresh list
+
+        elif action_type == "batch":
+            # Several actions from one message. Creates are grouped per item type into a single
+            # transaction; updates, deletes and retrievals still run one by one.
+            sub_actions = [a for a in parsed_action.get('actions') or [] if isinstance(a, dict) and a.get('action') != 'batch']
+            create_kinds = {'create_task': 'tasks', 'create_event': 'events', 'create_course': 'courses'}
+            creates = {kind: [] for kind in ITEM_TABLES}
+            other_actions = []
+            for sub_action in sub_actions:
+                kind = create_kinds.get(sub_action.get('action'))
+                if kind:
+                    fields = {k: v for k, v in sub_action.items() if k in ITEM_COLUMNS[kind] and v is not None}
+                    creates[kind].append({"op": "create", "item": fields})
+                else:
+                    other_actions.append(sub_action)
+
+            response_parts = []
+            results_by_kind = {'tasks': tasks_result, 'events': events_result, 'courses': courses_result}
+            for kind, operations in creates.items():
+                if not operations:
+                    continue
+                ok, results = apply_batch(kind, user_id, operations)
+                singular = kind[:-1]
+                if ok:
+                    items = [result['item'] for result in results]
+                    title_column = SEARCH_TABLES[kind][3]
+                    titles = ", ".join(f"'{item[title_column]}'" for item in items)
+                    response_parts.append(f"Created {len(items)} {singular if len(items) == 1 else kind}: {titles}.")
+                    response_parts.extend(describe_conflicts(result['conflicts'], f"'{result['item']['title']}'").strip()
+                                          for result in results if result.get('conflicts'))
+                    results_by_kind[kind].extend(items)
+                else:
+                    errors = " ".join(f"#{result['index'] + 1}: {result['error']}" for result in results if result['status'] == 'error')
+                    response_parts.append(f"I couldn't create those {kind}. {errors}")
+            for sub_action in other_actions:
+                sub_message, sub_tasks, sub_events, sub_courses = process_ai_action(user_id, sub_action)
+                response_parts.append(sub_message)
+                tasks_result.extend(sub_tasks)
+                events_result.extend(sub_events)
+                courses_result.extend(sub_courses)
+            response_message = " ".join(response_parts) or "I couldn't find any actions to perform in that request."
 
         elif action_type == "retrieve_items":
-            item_type = parsed_action.get('item_type', 'all')
+            item_type = parsed_action.get('item_type') or 'all'
+            limit = parse_limit(parsed_action.get('limit')) or RETRIEVE_ITEMS_LIMIT
             response_items_summary = [] # For the AI's conversational response
             
             if item_type == 'tasks' or item_type == 'all':
-                tasks_result = get_all_tasks_for_user(user_id)
-                # Apply filters here if needed based on parsed_action (status, priority, date_range, keywords)
-                # For simplicity, returning all tasks for now, filtering logic can be added here
+                tasks_result, tasks_cursor = query_tasks_for_user(
+                    user_id,
+                    status=parsed_action.get('status'),
+                    priority=parsed_action.get('priority'),
+                    date=parsed_action.get('date'),
+                    date_range_start=parsed_action.get('date_range_start'),
+                    date_range_end=parsed_action.get('date_range_end'),
+                    keywords=parsed_action.get('keywords'),
+                    limit=limit,
+                    cursor=parsed_action.get('cursor')
+                )
                 if tasks_result:
                     response_items_summary.append("Tasks:")
                     for t in tasks_result:
                         status_text = f" ({t['status']})" if t['status'] != 'pending' else ''
                         due_text = f" (Due: {t['due_datetime'].split('T')[0]})" if t['due_datetime'] else ''
                         response_items_summary.append(f"- {t['title']}{due_text}{status_text}")
+                    if tasks_cursor:
+                        response_items_summary.append(f"(Showing the first {limit} tasks. Ask me to narrow it down to see others.)")
                 else:
                     response_items_summary.append("No tasks found.")
 
             if item_type == 'events' or item_type == 'all':
-                events_result = get_all_events_for_user(user_id)
-                # Apply filters here if needed (date, date_range, keywords)
+                events_result, events_cursor = query_events_for_user(
+                    user_id,
+                    date=parsed_action.get('date'),
+                    date_range_start=parsed_action.get('date_range_start'),
+                    date_range_end=parsed_action.get('date_range_end'),
+                    keywords=parsed_action.get('keywords'),
+                    limit=limit,
+                    cursor=parsed_action.get('cursor')
+                )
                 if events_result:
                     response_items_summary.append("Events:")
                     for e in events_result:
                         start_date_text = e['start_datetime'].split('T')[0] if e['start_datetime'] else 'N/A'
                         response_items_summary.append(f"- {e['title']} (Starts: {start_date_text})")
+                    if events_cursor:
+                        response_items_summary.append(f"(Showing the first {limit} events. Ask me to narrow it down to see others.)")
                 else:
                     response_items_summary.append("No events found.")
 
             if item_type == 'courses' or item_type == 'all':
-                courses_result = get_all_courses_for_user(user_id)
-                # Apply filters here if needed (keywords, instructor)
+                courses_result, courses_cursor = query_courses_for_user(
+                    user_id,
+                    keywords=parsed_action.get('keywords'),
+                    instructor=parsed_action.get('instructor'),
+                    limit=limit,
+                    cursor=parsed_action.get('cursor')
+                )
                 if courses_result:
                     response_items_summary.append("Courses:")
                     for c in courses_result:
                         response_items_summary.append(f"- {c['name']} (Instructor: {c['instructor'] or 'N/A'})")
+                    if courses_cursor:
+                        response_items_summary.append(f"(Showing the first {limit} courses. Ask me to narrow it down to see others.)")
                 else:
                     response_items_summary.append("No courses found.")
 
@@ -811,14 +3866,367 @@ def process_ai_action(user_id, parsed_action):
 
     return response_message, tasks_result, events_result, courses_result
 
+# --- Response Serialization ---
+# Read routes return compact JSON tagged with an ETag derived from the user's change version, so a
+# client polling unchanged data gets a 304 before any query runs. JSON bodies are gzip/brotli
+# compressed when the client accepts it.
+
+_ETAG_SALT = f"{os.getpid():x}.{time.time_ns():x}" # Tags from a previous process (maybe another response shape) never match
+
+def dumps_compact(value):
+    """Serializes to compact UTF-8 JSON bytes, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+def iter_json_chunks(payload, chunk_bytes=64 * 1024):
+    """Yields a dict payload as JSON in chunks, encoding the items of long top-level lists one at a time."""
+    buffer = bytearray(b"{")
+    for position, (key, value) in enumerate(payload.items()):
+        if position:
+            buffer += b","
+        buffer += dumps_compact(key) + b":"
+        if isinstance(value, list) and len(value) > JSON_STREAM_MIN_ITEMS:
+            buffer += b"["
+            for index, item in enumerate(value):
+                if index:
+                    buffer += b","
+                buffer += dumps_compact(item)
+                if len(buffer) >= chunk_bytes:
+                    yield bytes(buffer)
+                    buffer.clear()
+            buffer += b"]"
+        else:
+            buffer += dumps_compact(value)
+    buffer += b"}"
+    yield bytes(buffer)
+
+def json_response(payload, status=200):
+    """A compact JSON response; payloads with long top-level lists are streamed."""
+    if isinstance(payload, dict) and any(isinstance(value, list) and len(value) > JSON_STREAM_MIN_ITEMS
+                                         for value in payload.values()):
+        return Response(iter_json_chunks(payload), status=status, mimetype='application/json')
+    return Response(dumps_compact(payload), status=status, mimetype='application/json')
+
+def versioned_json(user_id, build_payload, max_age_seconds=None):
+    """
+    Serves a per-user read whose result only changes when the user's data does. The weak ETag covers the
+    URL and the user's change version (plus a time bucket for payloads that move with the clock), so a
+    matching If-None-Match is answered with 304 without calling build_payload. Responses are marked
+    no-cache, which makes browsers revalidate with If-None-Match on every fetch by themselves.
+    """
+    time_bucket = int(time.time() // max_age_seconds) if max_age_seconds else None
+    raw_etag = f"{_ETAG_SALT}|{request.full_path}|{get_change_version(user_id)}|{time_bucket}"
+    etag = hashlib.sha1(raw_etag.encode('utf-8')).hexdigest()[:20]
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        response = json_response(build_payload())
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def _new_compressor(encoding):
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=5)
+        return compressor.process, compressor.finish
+    compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, 31) # wbits 31 = gzip container
+    return compressor.compress, compressor.flush
+
+def iter_compressed(chunks, encoding):
+    compress, finish = _new_compressor(encoding)
+    for chunk in chunks:
+        compressed = compress(chunk)
+        if compressed:
+            yield compressed
+    yield finish()
+
+@app.after_request
+def compress_json_response(response):
+    """Compresses JSON responses for clients that accept br or gzip. SSE streams and small bodies are left alone."""
+    if response.mimetype != 'application/json' or response.status_code != 200 or 'Content-Encoding' in response.headers:
+        return response
+    accept_encodings = request.accept_encodings
+    if brotli is not None and 'br' in accept_encodings:
+        encoding = 'br'
+    elif 'gzip' in accept_encodings:
+        encoding = 'gzip'
+    else:
+        return response
+
+    if response.is_streamed:
+        response.response = iter_compressed(response.response, encoding)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < COMPRESS_MIN_BYTES:
+            return response
+        compress, finish = _new_compressor(encoding)
+        response.set_data(compress(data) + finish())
+    response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    return response
+
+# --- Background Jobs ---
+# In-process job queue backed by the jobs table, so slow LLM work does not hold a request worker.
+# Workers claim the oldest queued job in a write transaction. Each process heartbeats the jobs it is
+# running; a 'running' job whose heartbeat stopped (its process died) is requeued by the next claim while
+# attempts remain, and failed as interrupted after that. A chat job's writes commit together with a
+# processed_jobs marker, so a requeued job whose action already ran only returns the recorded reply.
+
+class JobQueue:
+    def __init__(self, workers=JOB_WORKERS):
+        self.workers = workers
+        self.handlers = {} # job kind -> function(user_id, payload, job_id) returning a JSON-serializable result
+        self.token = f"{os.getpid()}-{id_generator.next_id()}" # Marks the jobs this process is running
+        self._threads = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+
+    def handler(self, kind):
+        """Decorator registering the function that runs jobs of one kind."""
+        def register(function):
+            self.handlers[kind] = function
+            return function
+        return register
+
+    def ensure_started(self):
+        """Prunes old finished jobs and starts the worker and heartbeat threads once per process."""
+        if self._threads:
+            return
+        with self._lock:
+            if self._threads:
+                return
+            with app.app_context():
+                prune_finished_jobs(get_db())
+            for index in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f"kairo-job-worker-{index}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            threading.Thread(target=self._heartbeat, name="kairo-job-heartbeat", daemon=True).start()
+
+    def stop(self):
+        self._stopping.set()
+        self._wakeup.set()
+
+    def enqueue(self, kind, user_id, payload):
+        """Stores a queued job and wakes a worker. Returns the job id."""
+        job_id = generate_unique_id("job")
+        db = get_db()
+        db.execute(
+            "INSERT INTO jobs (job_id, user_id, kind, payload, status, created_at) VALUES (?, ?, ?, ?, 'queued', ?)",
+            (job_id, user_id, kind, json.dumps(payload), time.time())
+        )
+        db.commit()
+        self.ensure_started()
+        self._wakeup.set()
+        return job_id
+
+    def _claim_next(self, db):
+        """Marks the oldest queued job as running and returns it, or None if the queue is empty."""
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            requeued, failed = recover_interrupted_jobs(db, now)
+            if requeued or failed:
+                print(f"Recovered jobs from a stopped worker: {requeued} requeued, {failed} failed as interrupted.")
+            job = db.execute("SELECT * FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1").fetchone()
+            if job:
+                db.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, started_at = ?, claimed_by = ?, heartbeat_at = ? "
+                    "WHERE job_id = ?",
+                    (now, self.token, now, job['job_id'])
+                )
+            db.commit()
+        except sqlite3.Error:
+            db.rollback()
+            raise
+        return job
+
+    def _work(self):
+        while not self._stopping.is_set():
+            try:
+                with app.app_context():
+                    job = self._claim_next(get_db())
+                    if job:
+                        self._run(get_db(), job)
+            except Exception as e:
+                print(f"Error: Job worker failed: {e}")
+                job = None
+            if not job:
+                self._wakeup.wait(timeout=JOB_POLL_INTERVAL_SECONDS)
+                self._wakeup.clear()
+
+    def _heartbeat(self):
+        while not self._stopping.wait(JOB_HEARTBEAT_SECONDS):
+            try:
+                with app.app_context():
+                    db = get_db()
+                    db.execute("UPDATE jobs SET heartbeat_at = ? WHERE status = 'running' AND claimed_by = ?", (time.time(), self.token))
+                    db.commit()
+            except sqlite3.Error as e:
+                print(f"Warning: Job heartbeat failed: {e}")
+
+    def _run(self, db, job):
+        job_handler = self.handlers.get(job['kind'])
+        try:
+            if job_handler is None:
+                raise APIError(f"No handler for job kind '{job['kind']}'.", 500)
+            result = job_handler(job['user_id'], json.loads(job['payload']), job['job_id'])
+        except OllamaBusyError as e:
+            if job['attempts'] < JOB_MAX_ATTEMPTS:
+                # Inference is saturated; put the job back instead of failing it
+                db.execute("UPDATE jobs SET status = 'queued', started_at = NULL, claimed_by = NULL WHERE job_id = ? AND claimed_by = ?",
+                           (job['job_id'], self.token))
+                db.commit()
+                time.sleep(JOB_POLL_INTERVAL_SECONDS)
+                return
+            self._finish(db, job['job_id'], 'failed', error=e.message)
+        except Exception as e:
+            print(f"Error: Job {job['job_id']} ({job['kind']}) failed: {e}")
+            self._finish(db, job['job_id'], 'failed', error=getattr(e, 'message', str(e)))
+        else:
+            self._finish(db, job['job_id'], 'succeeded', result=result)
+
+    def _finish(self, db, job_id, status, result=None, error=None):
+        finished = db.execute(
+            "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE job_id = ? AND claimed_by = ?",
+            (status, json.dumps(result) if result is not None else None, error, time.time(), job_id, self.token)
+        ).rowcount
+        db.commit()
+        if not finished:
+            print(f"Warning: Job {job_id} was recovered by another worker before it finished here.")
+
+    def get_stats(self):
+        counts = {row['status']: row['count'] for row in get_db().execute(
+            "SELECT status, COUNT(*) AS count FROM jobs GROUP BY status"
+        )}
+        return dict(counts, workers=len(self._threads))
+
+job_queue = JobQueue()
+atexit.register(job_queue.stop)
+
+def get_job(user_id, job_id):
+    """Returns a job as a dict with decoded result, or None if it does not exist for this user."""
+    row = get_db().execute("SELECT * FROM jobs WHERE user_id = ? AND job_id = ?", (user_id, job_id)).fetchone()
+    if row is None:
+        return None
+    job = {key: row[key] for key in ('job_id', 'kind', 'status', 'error', 'attempts', 'created_at', 'started_at', 'finished_at')}
+    job['result'] = json.loads(row['result']) if row['result'] else None
+    return job
+
 # --- Flask Routes ---
 
+@app.before_request
+def start_job_workers():
+    # Started on the first request rather than at import, so CLI commands don't spawn workers.
+    # Jobs a dead process left unfinished are picked up by the workers' claims.
+    job_queue.ensure_started()
+
 @app.route('/')
 def home():
     return jsonify({"message": "KairoSync AI Assistant Backend. Access API endpoints like /tasks, /events, /courses, /chat."})
 
-@app.route('/chat', methods=['POST'])
-def chat():
+@app.before_request
+def start_request_instrumentation():
+    g._request_started = time.perf_counter()
+    g._sql_statements = 0
+    g._sql_seconds = 0.0
+    if PROFILE_ENABLED and (request.args.get('profile') == '1' or request.headers.get('X-Kairo-Profile') == '1'):
+        g._profiler = cProfile.Profile()
+        g._profiler.enable()
+
+@app.after_request
+def record_request_metrics(response):
+    """Records route latency and SQL totals, adds a Server-Timing header and writes any requested profile."""
+    elapsed = time.perf_counter() - g.get('_request_started', time.perf_counter())
+    profiler = g.pop('_profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        profile_path = os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}_{request.endpoint}_{id_generator.next_id()}.prof")
+        profiler.dump_stats(profile_path)
+        response.headers['X-Profile-File'] = profile_path
+        print(f"Wrote request profile to {profile_path} (open with: python -m pstats {profile_path})")
+
+    route = request.url_rule.rule if request.url_rule else "unmatched" # Raw paths would explode the label set
+    sql_statements, sql_seconds = g.get('_sql_statements', 0), g.get('_sql_seconds', 0.0)
+    metrics.inc('kairo_http_requests_total', method=request.method, route=route, status=response.status_code)
+    metrics.observe('kairo_http_request_duration_seconds', elapsed, method=request.method, route=route)
+    metrics.observe('kairo_http_request_sql_statements', sql_statements, route=route)
+    metrics.observe('kairo_http_request_sql_seconds', sql_seconds, route=route)
+    response.headers['Server-Timing'] = (f'sql;desc="{sql_statements} statements";dur={sql_seconds * 1000:.2f}, '
+                                         f'app;dur={elapsed * 1000:.2f}')
+    return response
+
+@metrics.gauges
+def collect_component_gauges():
+    ollama = ollama_client.get_stats()
+    pool = db_pool.get_stats()
+    shards = shard_router.get_stats()
+    jobs = job_queue.get_stats()
+    history = history_writer.get_stats()
+    return [
+        ("kairo_ollama_active_requests", "Inference requests currently holding a slot.", ollama["active"]),
+        ("kairo_ollama_queued_requests", "Callers waiting for an inference slot.", ollama["queued"]),
+        ("kairo_db_connections_in_use", "Pooled SQLite connections checked out.", pool["in_use"]),
+        ("kairo_db_connections_idle", "Pooled SQLite connections idle.", pool["idle"]),
+        ("kairo_db_shards_open", "Shard files with an open connection pool.", shards["open"]),
+        ("kairo_db_shard_connections_in_use", "Shard connections checked out.", shards["in_use"]),
+        ("kairo_jobs_queued", "Background jobs waiting to run.", jobs.get("queued", 0)),
+        ("kairo_jobs_running", "Background jobs running.", jobs.get("running", 0)),
+        ("kairo_history_rows_queued", "Conversation rows waiting for the write-behind flush.", history["queued"]),
+    ]
+
+@app.route('/metrics', methods=['GET'])
+def metrics_route():
+    """Prometheus text exposition of the request, SQL, Ollama and parse-failure metrics."""
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/db/stats', methods=['GET'])
+def db_stats_route():
+    return jsonify({"pool": db_pool.get_stats(), "shards": shard_router.get_stats()})
+
+def load_conversation_history(user_id):
+    """Returns the conversation context for the prompt, oldest first, as Ollama chat messages (see Conversation Memory)."""
+    return build_conversation_context(user_id)
+
+def apply_kairo_style(ai_response_message, kairo_style):
+    """Applies Kairo style formatting to the final response message."""
+    if kairo_style == 'professional':
+        return f"Acknowledged. {ai_response_message}"
+    elif kairo_style == 'friendly':
+        return f"Hey there! {ai_response_message}"
+    elif kairo_style == 'concise':
+        return f"Kairo: {ai_response_message}"
+    elif kairo_style == 'casual':
+        return f"Sup! {ai_response_message}"
+    # Default is no prefix
+    return ai_response_message
+
+def log_conversation_turn(user_id, user_message, ai_response_message, parsed_action):
+    """Logs the user's message and Kairo's final response (with the parsed action) to conversation_history."""
+    if HISTORY_WRITE_BEHIND:
+        history_writer.enqueue(user_id, [
+            {"sender": 'user', "message": user_message, "parsed_action": None},
+            {"sender": 'kairo', "message": ai_response_message, "parsed_action": json.dumps(parsed_action) if parsed_action else None},
+        ])
+        return
+    db = get_user_db(user_id)
+    db.execute(
+        "INSERT INTO conversation_history (user_id, sender, message, parsed_action) VALUES (?, ?, ?, ?)",
+        (user_id, 'user', user_message, None)
+    )
+    db.execute(
+        "INSERT INTO conversation_history (user_id, sender, message, parsed_action) VALUES (?, ?, ?, ?)",
+        (user_id, 'kairo', ai_response_message, json.dumps(parsed_action) if parsed_action else None)
+    )
+    db.commit()
+    roll_up_conversation_history(user_id)
+
+def get_chat_request_fields():
+    """Reads and validates the fields shared by /chat and /chat/stream."""
     data = request.get_json()
     user_message = data.get('message')
     user_id = data.get('user_id')
@@ -826,88 +4234,289 @@ def chat():
 
     if not user_message or not user_id:
         raise APIError("User ID and message are required.", 400)
+    return user_id, user_message, kairo_style
 
-    db = get_db()
-    # Fetch recent conversation history from DB
-    cursor = db.execute(
-        "SELECT sender, message, parsed_action FROM conversation_history WHERE user_id = ? ORDER BY timestamp DESC LIMIT 10",
-        (user_id,) # Limit to last 10 entries for context
-    )
-    # Reconstruct messages list for Ollama, keeping roles
-    conversation_history_list = []
-    for row in cursor.fetchall():
-        conversation_history_list.append({"role": row['sender'], "content": row['message']})
-        # Optionally, you could also add the AI's parsed_action to the history if it helps context for the LLM
-        # if row['parsed_action']:
-        #     try:
-        #         parsed_action_from_history = json.loads(row['parsed_action'])
-        #         conversation_history_list.append({"role": "assistant", "content": f"Action taken: {parsed_action_from_history.get('action')}"})
-        #     except:
-        #         pass
+@app.route('/chat/stats', methods=['GET'])
+def chat_stats_route():
+    return jsonify({
+        "fast_path": get_fast_path_stats(),
+        "action_cache": action_cache.get_stats(),
+        "ollama": ollama_client.get_stats(),
+        "jobs": job_queue.get_stats(),
+        "history_writer": history_writer.get_stats()
+    })
 
+def get_processed_job(user_id, job_id):
+    """The processed_jobs marker of a job whose action already ran, or None."""
+    return get_user_db(user_id).execute("SELECT * FROM processed_jobs WHERE job_id = ?", (job_id,)).fetchone()
+
+def run_chat_turn(user_id, user_message, kairo_style, ready_action=None, conversation_history_list=None, raise_when_busy=False,
+                  job_id=None, try_fast_path=True):
+    """
+    Parses and runs one chat message, logs the turn and returns the /chat response payload.
+    ready_action skips parsing (fast path or cache hit); try_fast_path=False goes straight to the
+    LLM for messages the fast path already missed. raise_when_busy lets background jobs
+    requeue on OllamaBusyError instead of replying with the error. With a job_id, the action's writes
+    commit together with a processed_jobs marker, and a job that already ran returns its recorded reply.
+    """
+    if job_id is not None:
+        processed = get_processed_job(user_id, job_id)
+        if processed is not None:
+            print(f"Job {job_id} already ran its action; returning the recorded reply.")
+            return {
+                "response": apply_kairo_style(processed['response'], kairo_style),
+                "tasks": [], "events": [], "courses": [],
+                "changes": get_changes_since(user_id, processed['since_version']),
+                "parsed_action": json.loads(processed['parsed_action']) if processed['parsed_action'] else None,
+            }
 
     ai_response_message = ""
     tasks_data = []
     events_data = []
     courses_data = []
     parsed_action = None # Initialize parsed_action to None
+    since_version = get_change_version(user_id)
 
     try:
-        # Attempt to parse action directly from the prompt
-        # Send the full history including current message for action parsing
-        parsed_action = parse_ai_action(user_message, conversation_history_list)
-        
+        # Common commands are parsed by the fast path; everything else goes to the LLM
+        # with the full history for context
+        parsed_action = ready_action or (fast_parse_action(user_message) if try_fast_path else None)
+        if not parsed_action:
+            if conversation_history_list is None:
+                conversation_history_list = load_conversation_history(user_id)
+            parsed_action = parse_ai_action_cached(user_id, user_message, conversation_history_list)
+
         # If an action is parsed, get a confirmation message from process_ai_action
-        ai_response_message, tasks_data, events_data, courses_data = process_ai_action(user_id, parsed_action)
+        if job_id is None:
+            ai_response_message, tasks_data, events_data, courses_data = process_ai_action(user_id, parsed_action)
+        else:
+            with atomic(get_user_db(user_id)) as db:
+                ai_response_message, tasks_data, events_data, courses_data = process_ai_action(user_id, parsed_action)
+                db.execute(
+                    "INSERT INTO processed_jobs (job_id, user_id, response, parsed_action, since_version, processed_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (job_id, user_id, ai_response_message, json.dumps(parsed_action), since_version, time.time())
+                )
 
+    except OllamaBusyError as e:
+        if raise_when_busy:
+            raise
+        ai_response_message = f"Error processing request: {e.message}"
     except APIError as e:
         ai_response_message = f"Error processing request: {e.message}"
     except Exception as e:
         print(f"Error during AI interaction: {e}")
         ai_response_message = "I encountered an unexpected error while processing your request. Please try again."
 
-    # Apply Kairo style formatting to the final response message
-    if kairo_style == 'professional':
-        ai_response_message = f"Acknowledged. {ai_response_message}"
-    elif kairo_style == 'friendly':
-        ai_response_message = f"Hey there! {ai_response_message}"
-    elif kairo_style == 'concise':
-        ai_response_message = f"Kairo: {ai_response_message}"
-    elif kairo_style == 'casual':
-        ai_response_message = f"Sup! {ai_response_message}"
-    # Default is no prefix
+    ai_response_message = apply_kairo_style(ai_response_message, kairo_style)
 
     # Log user and Kairo responses (and parsed action)
-    # Only log user message once it's processed and before Kairo responds
-    # The actual message that was sent to Kairo for processing was part of `conversation_history_list`
-    # Here we log the user's initial message and Kairo's final response for the conversation history table.
-    db.execute(
-        "INSERT INTO conversation_history (user_id, sender, message, parsed_action) VALUES (?, ?, ?, ?)",
-        (user_id, 'user', user_message, None) 
-    )
-    db.execute(
-        "INSERT INTO conversation_history (user_id, sender, message, parsed_action) VALUES (?, ?, ?, ?)",
-        (user_id, 'kairo', ai_response_message, json.dumps(parsed_action) if parsed_action else None)
-    )
-    db.commit()
+    log_conversation_turn(user_id, user_message, ai_response_message, parsed_action)
 
-    return jsonify({
+    return {
         "response": ai_response_message,
         "tasks": tasks_data,
         "events": events_data,
         "courses": courses_data,
+        "changes": get_changes_since(user_id, since_version), # Delta the client applies instead of refetching lists
         "parsed_action": parsed_action # Send parsed_action back to frontend for potential debugging
-    })
+    }
+
+@job_queue.handler('chat')
+def run_chat_job(user_id, payload, job_id):
+    # /chat only queues messages the fast path missed (and counted), so the job doesn't try it again
+    return run_chat_turn(user_id, payload['message'], payload.get('kairo_style', 'friendly'), raise_when_busy=True,
+                         job_id=job_id, try_fast_path=False)
+
+@app.route('/chat', methods=['POST'])
+def chat():
+    """
+    Runs a chat message and returns the result. With "async": true, messages that need the LLM are
+    queued instead and the reply is 202 with a job_id to poll at GET /jobs/<job_id>.
+    """
+    user_id, user_message, kairo_style = get_chat_request_fields()
+    if not request.get_json().get('async'):
+        return jsonify(run_chat_turn(user_id, user_message, kairo_style))
+
+    # The fast path and the action cache don't need inference, so those still run inline
+    conversation_history_list = None
+    ready_action = fast_parse_action(user_message)
+    if not ready_action:
+        conversation_history_list = load_conversation_history(user_id)
+        ready_action = get_cached_action(user_id, user_message, conversation_history_list)
+    if ready_action:
+        result = run_chat_turn(user_id, user_message, kairo_style, ready_action, conversation_history_list)
+        return jsonify({"job_id": None, "status": "succeeded", "result": result})
+
+    job_id = job_queue.enqueue('chat', user_id, {"message": user_message, "kairo_style": kairo_style})
+    return jsonify({"job_id": job_id, "status": "queued", "status_url": f"/jobs/{job_id}"}), 202
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job_route(job_id):
+    user_id = request.args.get('user_id')
+    if not user_id:
+        raise APIError("User ID is required.", 400)
+    job = get_job(user_id, job_id)
+    if job is None:
+        raise APIError("Job not found.", 404)
+    return jsonify(job)
+
+def sse_event(event, data):
+    """Formats one Server-Sent Events message with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    """
+    Streaming variant of /chat. Emits Server-Sent Events:
+      token  - {"text": ...} for every chunk the model produces
+      action - {"parsed_action": ...} as soon as the action JSON object closes
+      result - the same payload /chat returns (including the "changes" delta), after the action has run
+    The Ollama stream is closed as soon as the action object is complete, so trailing
+    model output never delays the action.
+    """
+    user_id, user_message, kairo_style = get_chat_request_fields()
+    conversation_history_list = None
+    ready_action = fast_parse_action(user_message)
+    if not ready_action:
+        conversation_history_list = load_conversation_history(user_id)
+        ready_action = get_cached_action(user_id, user_message, conversation_history_list)
+    if not ready_action:
+        messages_for_ollama = build_action_messages(user_message, conversation_history_list)
+
+    def generate():
+        ai_response_message = ""
+        tasks_data = []
+        events_data = []
+        courses_data = []
+        parsed_action = None
+        scanner = JSONObjectScanner()
+        since_version = get_change_version(user_id)
+
+        try:
+            if ready_action:
+                parsed_action = ready_action
+            else:
+                action_text = None
+                tokens = stream_ollama_response(messages_for_ollama, action_response_format())
+                try:
+                    for token in tokens:
+                        yield sse_event("token", {"text": token})
+                        action_text = scanner.feed(token)
+                        if action_text is not None:
+                            break
+                finally:
+                    tokens.close()
+                print(f"Ollama streamed action response: {scanner.text}")
+                parsed_action = extract_action_json(action_text or scanner.text, user_message)
+                store_cached_action(user_id, user_message, conversation_history_list, parsed_action)
+            yield sse_event("action", {"parsed_action": parsed_action})
+
+            ai_response_message, tasks_data, events_data, courses_data = process_ai_action(user_id, parsed_action)
+
+        except APIError as e:
+            ai_response_message = f"Error processing request: {e.message}"
+        except Exception as e:
+            print(f"Error during streamed AI interaction: {e}")
+            ai_response_message = "I encountered an unexpected error while processing your request. Please try again."
+
+        ai_response_message = apply_kairo_style(ai_response_message, kairo_style)
+        log_conversation_turn(user_id, user_message, ai_response_message, parsed_action)
+
+        yield sse_event("result", {
+            "response": ai_response_message,
+            "tasks": tasks_data,
+            "events": events_data,
+            "courses": courses_data,
+            "changes": get_changes_since(user_id, since_version),
+            "parsed_action": parsed_action
+        })
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
 
 # --- API Endpoints for Frontend CRUD (Direct Operations) ---
 
+@app.route('/dashboard', methods=['GET'])
+def get_dashboard_route():
+    """Dashboard counts (pending/overdue/due-today tasks, upcoming events, active courses) and recent activity."""
+    user_id = request.args.get('user_id')
+    if not user_id:
+        raise APIError("User ID is required.", 400)
+    return versioned_json(user_id, lambda: get_dashboard(user_id), max_age_seconds=DASHBOARD_CACHE_TTL_SECONDS)
+
+@app.route('/agenda', methods=['GET'])
+def get_agenda_route():
+    """
+    Everything in a window: events and course meetings overlapping it and tasks due in it, with
+    occurrences of recurring events/tasks and scheduled courses expanded on the fly. ?types= narrows to a comma-separated subset.
+    """
+    user_id = request.args.get('user_id')
+    if not user_id:
+        raise APIError("User ID is required.", 400)
+    window_start, window_end = parse_agenda_window(request.args.get('start') or '', request.args.get('end') or '')
+    kinds = [kind.strip() for kind in request.args.get('types', 'events,tasks,courses').split(',') if kind.strip()]
+    unknown_kinds = [kind for kind in kinds if kind not in ITEM_TABLES]
+    if unknown_kinds:
+        raise APIError(f"Unknown agenda type(s): {', '.join(unknown_kinds)}. Use tasks, events or courses.", 400)
+    return versioned_json(user_id, lambda: {
+        "start": window_start.isoformat(),
+        "end": window_end.isoformat(),
+        "items": get_agenda(user_id, window_start, window_end, kinds)
+    })
+
+@app.route('/freebusy', methods=['GET'])
+def get_free_busy_route():
+    """Busy blocks (events and course meetings, merged) and the free gaps between them for a window."""
+    user_id = request.args.get('user_id')
+    if not user_id:
+        raise APIError("User ID is required.", 400)
+    window_start, window_end = parse_agenda_window(request.args.get('start') or '', request.args.get('end') or '')
+    return versioned_json(user_id, lambda: get_free_busy(user_id, window_start, window_end))
+
+@app.route('/changes', methods=['GET'])
+def get_changes_route():
+    """Incremental sync: items created/updated and ids deleted after ?since=<version> (default 0, i.e. everything)."""
+    user_id = request.args.get('user_id')
+    if not user_id:
+        raise APIError("User ID is required.", 400)
+    try:
+        since = int(request.args.get('since') or 0)
+    except ValueError:
+        raise APIError("Invalid 'since' version. It must be an integer.", 400)
+    if since < 0:
+        raise APIError("Invalid 'since' version. It must not be negative.", 400)
+    return versioned_json(user_id, lambda: get_changes_since(user_id, since))
+
+def run_batch_request(kind):
+    """Shared body of the /<items>/batch routes: {"user_id": ..., "operations": [...]} -> per-item results."""
+    data = request.get_json(silent=True) or {}
+    user_id = data.get('user_id')
+    operations = data.get('operations')
+    if not user_id or not isinstance(operations, list) or not operations:
+        raise APIError("User ID and a non-empty 'operations' list are required.", 400)
+    if len(operations) > BATCH_MAX_OPERATIONS:
+        raise APIError(f"A batch may contain at most {BATCH_MAX_OPERATIONS} operations.", 400)
+
+    ok, results = apply_batch(kind, user_id, operations)
+    if not ok:
+        return jsonify({"error": "Some operations are invalid; nothing was saved.", "results": results}), 400
+    return jsonify({"results": results, "version": get_change_version(user_id)})
+
 @app.route('/tasks', methods=['GET'])
 def get_tasks_route():
     user_id = request.args.get('user_id')
     if not user_id:
         raise APIError("User ID is required.", 400)
-    tasks = get_all_tasks_for_user(user_id)
-    return jsonify({"tasks": tasks})
+    filters = get_list_filters_from_request('status', 'priority', 'date', 'date_range_start', 'date_range_end', 'keywords')
+
+    def build_payload():
+        tasks, next_cursor = query_tasks_for_user(user_id, **filters)
+        return {"tasks": tasks, "next_cursor": next_cursor}
+    return versioned_json(user_id, build_payload)
 
 @app.route('/tasks', methods=['POST'])
 def add_task_route():
@@ -926,7 +4535,8 @@ def add_task_route():
         status=data.get('status'),
         tags=data.get('tags'),
         course_id=data.get('course_id'),
-        parent_id=data.get('parent_id')
+        parent_id=data.get('parent_id'),
+        recurrence=data.get('recurrence')
     )
     return jsonify({"message": "Task added successfully", "task": task}), 201
 
@@ -953,13 +4563,21 @@ def delete_task_route(task_id):
     else:
         return jsonify({"error": "Task not found."}), 404
 
+@app.route('/tasks/batch', methods=['POST'])
+def batch_tasks_route():
+    return run_batch_request('tasks')
+
 @app.route('/events', methods=['GET'])
 def get_events_route():
     user_id = request.args.get('user_id')
     if not user_id:
         raise APIError("User ID is required.", 400)
-    events = get_all_events_for_user(user_id)
-    return jsonify({"events": events})
+    filters = get_list_filters_from_request('date', 'date_range_start', 'date_range_end', 'keywords')
+
+    def build_payload():
+        events, next_cursor = query_events_for_user(user_id, **filters)
+        return {"events": events, "next_cursor": next_cursor}
+    return versioned_json(user_id, build_payload)
 
 @app.route('/events', methods=['POST'])
 def add_event_route():
@@ -977,9 +4595,11 @@ def add_event_route():
         start_datetime=start_datetime,
         end_datetime=data.get('end_datetime'),
         location=data.get('location'),
-        attendees=data.get('attendees')
+        attendees=data.get('attendees'),
+        recurrence=data.get('recurrence')
     )
-    return jsonify({"message": "Event added successfully", "event": event}), 201
+    conflicts = find_event_conflicts(user_id, event)
+    return jsonify({"message": "Event added successfully", "event": event, "conflicts": conflicts}), 201
 
 @app.route('/events/<event_id>', methods=['PUT'])
 def update_event_route(event_id):
@@ -989,7 +4609,8 @@ def update_event_route(event_id):
         raise APIError("User ID is required.", 400)
     
     if update_event_in_db(event_id, user_id, data):
-        return jsonify({"message": "Event updated successfully"})
+        conflicts = find_event_conflicts(user_id, get_event_by_id(user_id, event_id))
+        return jsonify({"message": "Event updated successfully", "conflicts": conflicts})
     else:
         return jsonify({"error": "Event not found or no changes made."}), 404
 
@@ -1004,13 +4625,41 @@ def delete_event_route(event_id):
     else:
         return jsonify({"error": "Event not found."}), 404
 
+@app.route('/events/batch', methods=['POST'])
+def batch_events_route():
+    return run_batch_request('events')
+
+@app.route('/events/conflicts', methods=['GET'])
+def event_conflicts_route():
+    """
+    Checks a proposed slot before creating or moving an event:
+    ?start_datetime=&end_datetime=&recurrence=&exclude_event_id= (the event being moved).
+    """
+    user_id = request.args.get('user_id')
+    if not user_id:
+        raise APIError("User ID is required.", 400)
+    start_datetime = get_iso_datetime(request.args.get('start_datetime'))
+    if not start_datetime:
+        raise APIError("Valid start_datetime is required.", 400)
+    proposed_event = {
+        "event_id": request.args.get('exclude_event_id'),
+        "start_datetime": start_datetime,
+        "end_datetime": request.args.get('end_datetime'),
+        "recurrence": normalize_recurrence(request.args.get('recurrence')),
+    }
+    return jsonify({"conflicts": find_event_conflicts(user_id, proposed_event)})
+
 @app.route('/courses', methods=['GET'])
 def get_courses_route():
     user_id = request.args.get('user_id')
     if not user_id:
         raise APIError("User ID is required.", 400)
-    courses = get_all_courses_for_user(user_id)
-    return jsonify({"courses": courses})
+    filters = get_list_filters_from_request('keywords', 'instructor')
+
+    def build_payload():
+        courses, next_cursor = query_courses_for_user(user_id, **filters)
+        return {"courses": courses, "next_cursor": next_cursor}
+    return versioned_json(user_id, build_payload)
 
 @app.route('/courses', methods=['POST'])
 def add_course_route():
@@ -1054,6 +4703,177 @@ def delete_course_route(course_id):
     else:
         return jsonify({"error": "Course not found."}), 404
 
+@app.route('/courses/batch', methods=['POST'])
+def batch_courses_route():
+    return run_batch_request('courses')
+
+@app.route('/search', methods=['GET'])
+def search_route():
+    """Ranked full-text search over the user's tasks, events and courses. ?types= narrows to a comma-separated subset."""
+    user_id = request.args.get('user_id')
+    query = request.args.get('q', '').strip()
+    if not user_id or not query:
+        raise APIError("User ID and search query (q) are required.", 400)
+    kinds = [kind.strip() for kind in request.args.get('types', ','.join(SEARCH_TABLES)).split(',') if kind.strip()]
+    unknown_kinds = [kind for kind in kinds if kind not in SEARCH_TABLES]
+    if unknown_kinds:
+        raise APIError(f"Unknown search type(s): {', '.join(unknown_kinds)}. Use tasks, events or courses.", 400)
+    limit = parse_limit(request.args.get('limit')) or 20
+    return versioned_json(user_id, lambda: {kind: search_items(kind, user_id, query, limit=limit) for kind in kinds})
+
+# --- Maintenance Commands ---
+
+def explain_hot_queries(user_id="query_plan_check"):
+    """
+    Runs every hot read path against the current database with a trace callback and returns
+    (sql, plan_details, uses_index) for each statement issued, using EXPLAIN QUERY PLAN.
+    """
+    db = get_user_db(user_id)
+    statements = []
+    db.set_trace_callback(statements.append)
+    try:
+        today = datetime.date.today().isoformat()
+        page_cursor = encode_cursor(datetime.datetime.now().isoformat(), "~")
+        get_all_tasks_for_user(user_id)
+        query_tasks_for_user(user_id, limit=RETRIEVE_ITEMS_LIMIT, cursor=page_cursor)
+        query_tasks_for_user(user_id, status='pending', limit=RETRIEVE_ITEMS_LIMIT)
+        query_tasks_for_user(user_id, date_range_start=today, date_range_end=today, limit=RETRIEVE_ITEMS_LIMIT)
+        get_task_by_id(user_id, "task_0")
+        get_all_events_for_user(user_id)
+        query_events_for_user(user_id, limit=RETRIEVE_ITEMS_LIMIT, cursor=page_cursor)
+        query_events_for_user(user_id, date=today, limit=RETRIEVE_ITEMS_LIMIT)
+        get_event_by_id(user_id, "event_0")
+        get_all_courses_for_user(user_id)
+        query_courses_for_user(user_id, limit=RETRIEVE_ITEMS_LIMIT, cursor=page_cursor)
+        get_course_by_id(user_id, "course_0")
+        build_conversation_context(user_id)
+        get_changes_since(user_id, 0)
+        compute_dashboard(user_id)
+        now = datetime.datetime.now()
+        get_agenda(user_id, now, now + datetime.timedelta(days=7))
+        build_event_index(user_id)
+        find_event_conflicts(user_id, {"start_datetime": now.isoformat(), "end_datetime": (now + datetime.timedelta(hours=1)).isoformat()})
+        if search_index_state["available"]:
+            for kind in SEARCH_TABLES:
+                find_items_by_keywords(kind, user_id, "weekly review")
+    finally:
+        db.set_trace_callback(None)
+
+    results = []
+    for sql in statements:
+        if not sql.lstrip().startswith("SELECT") or "'main'." in sql:
+            continue # FTS5's own bookkeeping statements on its shadow tables
+        plan_details = [row[3] for row in db.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()]
+        # A bare "SCAN <table>" (without USING INDEX, or an FTS5 index lookup) is a full table scan;
+        # scans of a constant row or of a subquery's (already limited) output are not
+        uses_index = not any(
+            detail.startswith("SCAN ") and not detail.startswith(("SCAN CONSTANT ROW", "SCAN ("))
+            and "USING" not in detail and "VIRTUAL TABLE INDEX" not in detail
+            for detail in plan_details
+        )
+        results.append((sql, plan_details, uses_index))
+    return results
+
+@app.cli.command("check-query-plans")
+def check_query_plans_command():
+    """Fails if any hot query in app.py falls back to a full table scan."""
+    setup_database()
+    failures = 0
+    for sql, plan_details, uses_index in explain_hot_queries():
+        print(f"[{'OK' if uses_index else 'FULL SCAN'}] {sql}")
+        for detail in plan_details:
+            print(f"    {detail}")
+        if not uses_index:
+            failures += 1
+    if failures:
+        raise SystemExit(f"{failures} hot queries do not use an index.")
+    print("All hot queries use an index.")
+
+def iter_user_databases():
+    """Yields every database holding user data: the main file, or each shard file on disk when sharding is on."""
+    if DB_SHARD_MODE == 'none':
+        yield get_db()
+        return
+    for shard_key in shard_router.existing_keys():
+        with shard_connection(shard_key) as db:
+            yield db
+
+@app.cli.command("archive-history")
+def archive_history_command():
+    """Moves old, already summarized conversation rows to conversation_history_archive (also runs at startup)."""
+    setup_database()
+    print(f"Archived {sum(archive_conversation_history(db) for db in iter_user_databases())} conversation rows.")
+
+@app.cli.command("rebuild-search-index")
+def rebuild_search_index_command():
+    """Rebuilds the FTS5 search tables from the base tables (needed after a VACUUM)."""
+    setup_database()
+    if not search_index_state["available"]:
+        raise SystemExit("This SQLite build has no FTS5 support; there is no search index to rebuild.")
+    for db in iter_user_databases():
+        for _, fts_table, _, _, _ in SEARCH_TABLES.values():
+            db.execute(f"INSERT INTO {fts_table} ({fts_table}) VALUES ('rebuild')")
+        db.commit()
+    print("Search index rebuilt.")
+
+def split_database_into_shards(source_path=None, users_per_statement=500):
+    """
+    Copies every user's rows in SHARDED_TABLES from the single database file into their shard. Ids and
+    change versions are kept, so clients keep syncing; rows already in a shard are skipped, so it can be
+    re-run. The source file is left as it is. Returns {table: rows copied}.
+    """
+    source_path = os.path.abspath(source_path or DATABASE)
+    source = sqlite3.connect(source_path)
+    try:
+        user_ids = set()
+        for table in SHARDED_TABLES:
+            user_ids.update(row[0] for row in source.execute(f"SELECT DISTINCT user_id FROM {table}"))
+    finally:
+        source.close()
+
+    users_by_shard = collections.defaultdict(list)
+    for user_id in user_ids:
+        users_by_shard[shard_key_for_user(user_id)].append(user_id)
+
+    copied = collections.Counter()
+    for shard_key, shard_users in sorted(users_by_shard.items()):
+        with shard_connection(shard_key) as db:
+            db.execute("ATTACH DATABASE ? AS source", (source_path,)) # Not allowed inside a transaction
+            try:
+                db.execute("BEGIN IMMEDIATE")
+                last_version = db.execute("SELECT COALESCE(MAX(version), 0) FROM main.change_log").fetchone()[0]
+                for table in SHARDED_TABLES:
+                    if table == 'change_log':
+                        # Copying the items fired the change_log triggers; keep the source's versions instead
+                        db.execute("DELETE FROM main.change_log WHERE version > ?", (last_version,))
+                    shard_columns = {row[1] for row in db.execute(f"PRAGMA main.table_info({table})")}
+                    columns = ", ".join(row[1] for row in db.execute(f"PRAGMA source.table_info({table})") if row[1] in shard_columns)
+                    for start in range(0, len(shard_users), users_per_statement):
+                        chunk = shard_users[start:start + users_per_statement]
+                        cursor = db.execute(
+                            f"INSERT OR IGNORE INTO main.{table} ({columns}) SELECT {columns} FROM source.{table} "
+                            f"WHERE user_id IN ({', '.join('?' * len(chunk))})", chunk
+                        )
+                        copied[table] += cursor.rowcount
+                db.commit()
+            except Exception:
+                db.rollback()
+                raise
+            finally:
+                db.execute("DETACH DATABASE source")
+        print(f"Shard {shard_key}: {len(shard_users)} user(s)")
+    return dict(copied)
+
+@app.cli.command("split-database")
+def split_database_command():
+    """Copies users' data from the single database file into shard files (set KAIRO_DB_SHARD_MODE first)."""
+    if DB_SHARD_MODE not in ('user', 'hash'):
+        raise SystemExit("Set KAIRO_DB_SHARD_MODE to 'user' or 'hash' (and optionally KAIRO_DB_SHARD_DIR) to choose the shard layout.")
+    setup_database()
+    copied = split_database_into_shards()
+    print("Copied " + ", ".join(f"{count} {table}" for table, count in copied.items()) + f" rows into {DB_SHARD_DIR}.")
+    print(f"{DATABASE} was not modified; its user tables are unused while sharding is on.")
+
 # --- General Error Handlers ---
 @app.errorhandler(APIError)
 def handle_api_error(error):
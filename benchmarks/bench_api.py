@@ -0,0 +1,323 @@
+"""
+End-to-end load benchmark: seeds a scratch database, starts the fake Ollama and the app, and drives the
+CRUD routes and /chat at a fixed concurrency, reporting p50/p95/p99 latency and throughput per route.
+
+Scenarios (run in order, or pick some with --scenarios):
+  reads  - task/event lists, date ranges, dashboard, agenda, free/busy, search, changes
+  writes - task/event creates, task updates and small task batches
+  chat   - /chat and /chat/stream with a mix of fast-path and LLM-bound messages
+  mixed  - all of the above, weighted like an interactive session
+
+Everything is seeded from --seed so runs are comparable. The app runs in this process on a threaded
+Werkzeug server by default; pass --url to drive a server started separately with
+KAIRO_DATABASE=<--database> and KAIRO_OLLAMA_URL pointing at benchmarks/fake_ollama.py. The in-process
+run disables the parsed-action cache (unless --action-cache) so LLM-bound messages always reach Ollama.
+Save a run with --json-out and pass it back as --baseline to exit 1 when a route's p95 regresses by more
+than --tolerance, or when any request fails.
+
+Usage: python benchmarks/bench_api.py [--users 20] [--tasks 200] [--events 100] [--history 200]
+       [--concurrency 8] [--requests 400] [--ollama-latency 0.3] [--ttft 0.1] [--scenarios reads,chat]
+       [--json-out run.json] [--baseline run.json] [--tolerance 0.25]
+"""
+import argparse
+import datetime
+import json
+import logging
+import math
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import fake_ollama # noqa: E402
+import seed_data # noqa: E402
+
+CHAT_MESSAGES = [
+    "Can you remind me to submit the budget sometime next week?", # LLM: create_task
+    "Schedule a project meeting with the lab on Friday morning", # LLM: create_event
+    "What's on my plate for the next few days?", # LLM: retrieve_items
+    "I finished the report, mark it done", # LLM: update_task
+    "Add my Distributed Systems course", # LLM: create_course
+    "How should I split my study time this week?", # LLM: respond_conversation
+    "Remind me to call mom tomorrow at 5 PM", # Fast path
+    "Show my tasks", # Fast path
+]
+SEARCH_TERMS = ["report", "budget", "sync", "study", "slides", "exam", "chapter"]
+
+# --- Operations ---
+# Each takes (client, user_id, rng) and returns the HTTP status.
+
+def op_list_tasks(client, user_id, rng):
+    return client.get("/tasks", user_id=user_id, limit=50, status=rng.choice([None, "pending"]))
+
+def op_list_events_range(client, user_id, rng):
+    start = datetime.date.today() + datetime.timedelta(days=rng.randint(-7, 14))
+    return client.get("/events", user_id=user_id, date_range_start=start.isoformat(),
+                      date_range_end=(start + datetime.timedelta(days=7)).isoformat())
+
+def op_dashboard(client, user_id, rng):
+    return client.get("/dashboard", user_id=user_id)
+
+def op_agenda(client, user_id, rng):
+    start = datetime.date.today() + datetime.timedelta(days=rng.randint(-3, 10))
+    return client.get("/agenda", user_id=user_id, start=start.isoformat(),
+                      end=(start + datetime.timedelta(days=6)).isoformat())
+
+def op_freebusy(client, user_id, rng):
+    day = datetime.date.today() + datetime.timedelta(days=rng.randint(0, 7))
+    return client.get("/freebusy", user_id=user_id, start=day.isoformat(), end=day.isoformat())
+
+def op_search(client, user_id, rng):
+    return client.get("/search", user_id=user_id, q=rng.choice(SEARCH_TERMS))
+
+def op_changes(client, user_id, rng):
+    return client.get("/changes", user_id=user_id, since=0)
+
+def random_due(rng):
+    moment = datetime.datetime.now() + datetime.timedelta(days=rng.randint(0, 30), hours=rng.randint(0, 12))
+    return moment.replace(minute=0, second=0, microsecond=0).isoformat()
+
+def op_create_task(client, user_id, rng):
+    return client.post("/tasks", {"user_id": user_id, "title": f"Bench task {rng.randrange(10**6)}",
+                                  "due_datetime": random_due(rng), "priority": rng.choice(seed_data.PRIORITIES)})
+
+def op_update_task(client, user_id, rng):
+    task_id = rng.choice(client.task_ids[user_id])
+    return client.put(f"/tasks/{task_id}", {"status": rng.choice(seed_data.STATUSES), "due_datetime": random_due(rng)},
+                      user_id=user_id) # PUT routes take user_id from the query string
+
+def op_create_event(client, user_id, rng):
+    start = datetime.datetime.fromisoformat(random_due(rng))
+    return client.post("/events", {"user_id": user_id, "title": rng.choice(seed_data.EVENT_TITLES),
+                                   "start_datetime": start.isoformat(),
+                                   "end_datetime": (start + datetime.timedelta(hours=1)).isoformat()})
+
+def op_batch_tasks(client, user_id, rng):
+    operations = [{"op": "create", "item": {"title": f"Imported {rng.randrange(10**6)}", "due_datetime": random_due(rng)}}
+                  for _ in range(20)]
+    return client.post("/tasks/batch", {"user_id": user_id, "operations": operations})
+
+def op_chat(client, user_id, rng):
+    return client.post("/chat", {"user_id": user_id, "message": rng.choice(CHAT_MESSAGES)})
+
+def op_chat_stream(client, user_id, rng):
+    return client.post("/chat/stream", {"user_id": user_id, "message": rng.choice(CHAT_MESSAGES)}, stream=True)
+
+READS = [(op_list_tasks, 4), (op_list_events_range, 3), (op_dashboard, 3), (op_agenda, 2), (op_freebusy, 1),
+         (op_search, 2), (op_changes, 1)]
+WRITES = [(op_create_task, 3), (op_update_task, 3), (op_create_event, 2), (op_batch_tasks, 1)]
+CHAT = [(op_chat, 3), (op_chat_stream, 1)]
+SCENARIOS = {
+    "reads": READS,
+    "writes": WRITES,
+    "chat": CHAT,
+    "mixed": READS + [(op, weight / 2) for op, weight in WRITES] + [(op, weight / 2) for op, weight in CHAT],
+}
+
+class Client:
+    """One keep-alive session per worker thread; every call returns the status and records its latency."""
+    def __init__(self, base_url, task_ids):
+        self.base_url = base_url
+        self.task_ids = task_ids
+        self.session = requests.Session()
+
+    def get(self, path, **params):
+        response = self.session.get(self.base_url + path, params={k: v for k, v in params.items() if v is not None})
+        return response.status_code
+
+    def post(self, path, payload, stream=False):
+        with self.session.post(self.base_url + path, json=payload, stream=stream) as response:
+            for _ in response.iter_content(chunk_size=None):
+                pass # Include the whole body (all SSE events for streams) in the latency
+            return response.status_code
+
+    def put(self, path, payload, **params):
+        return self.session.put(self.base_url + path, json=payload, params=params).status_code
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return float("nan")
+    return sorted_values[min(len(sorted_values) - 1, max(0, math.ceil(pct / 100 * len(sorted_values)) - 1))]
+
+def run_scenario(name, base_url, users, task_ids, args):
+    """Runs warmup + timed requests for one scenario; returns {op: stats} plus throughput."""
+    operations, weights = zip(*SCENARIOS[name])
+    samples = {op.__name__[3:]: [] for op in operations}
+    errors = {op.__name__[3:]: 0 for op in operations}
+    lock = threading.Lock()
+    remaining = {"warmup": args.warmup, "timed": args.requests}
+
+    def worker(worker_index):
+        rng = random.Random(f"{args.seed}-{name}-{worker_index}")
+        client = Client(base_url, task_ids)
+        while True:
+            with lock:
+                phase = "warmup" if remaining["warmup"] > 0 else "timed"
+                if remaining[phase] <= 0:
+                    return
+                remaining[phase] -= 1
+            op = rng.choices(operations, weights)[0]
+            started = time.perf_counter()
+            try:
+                status = op(client, rng.choice(users), rng)
+            except requests.RequestException:
+                status = None
+            elapsed = time.perf_counter() - started
+            if phase == "timed":
+                with lock:
+                    samples[op.__name__[3:]].append(elapsed)
+                    if status is None or status >= 400:
+                        errors[op.__name__[3:]] += 1
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(args.concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall_seconds = time.perf_counter() - started # Includes the warmup requests, which are few
+
+    results = {}
+    for op_name, values in samples.items():
+        values.sort()
+        results[op_name] = {"count": len(values), "errors": errors[op_name], "mean": sum(values) / len(values) if values else float("nan"),
+                            "p50": percentile(values, 50), "p95": percentile(values, 95), "p99": percentile(values, 99)}
+    all_values = sorted(value for values in samples.values() for value in values)
+    results["_all"] = {"count": len(all_values), "errors": sum(errors.values()),
+                       "mean": sum(all_values) / len(all_values) if all_values else float("nan"),
+                       "p50": percentile(all_values, 50), "p95": percentile(all_values, 95), "p99": percentile(all_values, 99),
+                       "throughput": (args.requests + args.warmup) / wall_seconds}
+    return results
+
+def print_report(name, results, args):
+    overall = results["_all"]
+    print(f"\n{name}: {overall['count']} requests at concurrency {args.concurrency}, "
+          f"{overall['throughput']:.1f} req/s, {overall['errors']} errors")
+    print(f"  {'route':<20} {'count':>6} {'errors':>6} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for op_name, stats in sorted(results.items()):
+        if stats["count"]:
+            print(f"  {op_name:<20} {stats['count']:>6} {stats['errors']:>6} {stats['mean'] * 1000:>9.1f} "
+                  f"{stats['p50'] * 1000:>9.1f} {stats['p95'] * 1000:>9.1f} {stats['p99'] * 1000:>9.1f}")
+
+def compare_to_baseline(report, baseline, tolerance, min_delta_ms=2.0):
+    """Returns descriptions of routes whose p95 grew by more than tolerance (and min_delta_ms) over the baseline."""
+    regressions = []
+    for scenario, results in report.items():
+        for op_name, stats in results.items():
+            before = baseline.get(scenario, {}).get(op_name)
+            if not before or not stats["count"]:
+                continue
+            if stats["p95"] > before["p95"] * (1 + tolerance) and (stats["p95"] - before["p95"]) * 1000 > min_delta_ms:
+                regressions.append(f"{scenario}/{op_name}: p95 {before['p95'] * 1000:.1f} ms -> {stats['p95'] * 1000:.1f} ms")
+    return regressions
+
+def start_app_server(app, ollama_url, action_cache):
+    """Serves the app on a threaded Werkzeug server in this process; returns (server, base url)."""
+    from werkzeug.serving import make_server
+    logging.getLogger("werkzeug").setLevel(logging.WARNING) # No per-request access log lines
+    app.OLLAMA_URL = ollama_url # Read at call time by the Ollama client
+    app.ACTION_CACHE_ENABLED = action_cache
+    server = make_server("127.0.0.1", 0, app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+def load_task_ids(app, users, per_user=50):
+    with app.app.app_context():
+        return {user_id: [row[0] for row in app.get_user_db(user_id).execute(
+                    "SELECT task_id FROM tasks WHERE user_id = ? LIMIT ?", (user_id, per_user))]
+                for user_id in users}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--database", help="scratch SQLite file (default: a new temp file)")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--tasks", type=int, default=200, help="per user")
+    parser.add_argument("--events", type=int, default=100, help="per user")
+    parser.add_argument("--courses", type=int, default=8, help="per user")
+    parser.add_argument("--history", type=int, default=200, help="conversation rows per user")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=400, help="timed requests per scenario")
+    parser.add_argument("--warmup", type=int, default=20, help="untimed requests per scenario")
+    parser.add_argument("--ollama-latency", type=float, default=0.3, help="seconds per fake Ollama response")
+    parser.add_argument("--ttft", type=float, default=0.1, help="seconds to the fake Ollama's first streamed chunk")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"comma-separated subset of {', '.join(SCENARIOS)}")
+    parser.add_argument("--url", help="drive an already running app at this base URL instead of starting one")
+    parser.add_argument("--action-cache", action="store_true", help="keep the parsed-action cache on (in-process only)")
+    parser.add_argument("--json-out", help="write the results here")
+    parser.add_argument("--baseline", help="results from an earlier --json-out run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed p95 growth over the baseline")
+    parser.add_argument("--verbose", action="store_true", help="keep the app's request logging on stdout")
+    args = parser.parse_args()
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(unknown)}")
+
+    database = args.database or os.path.join(tempfile.mkdtemp(prefix="kairo_bench_api_"), "kairo_bench.db")
+    if args.url and not args.database:
+        parser.error("--url needs --database: the file the running server was started with (KAIRO_DATABASE)")
+    os.environ["KAIRO_DATABASE"] = database
+    import app # noqa: E402 - DATABASE is read from the environment at import time
+
+    print(f"Seeding {database}: {args.users} users x {args.tasks} tasks, {args.events} events, "
+          f"{args.courses} courses, {args.history} history rows")
+    users = seed_data.seed(app, args.users, args.tasks, args.events, args.courses, args.history, args.seed)
+    task_ids = load_task_ids(app, users)
+
+    ollama_server, ollama_url = fake_ollama.start_fake_ollama(latency=args.ollama_latency, ttft=args.ttft)
+    app_server = None
+    if args.url:
+        base_url = args.url.rstrip("/")
+        print(f"Driving {base_url}; start it with KAIRO_DATABASE={database} KAIRO_OLLAMA_URL={ollama_url}")
+    else:
+        app_server, base_url = start_app_server(app, ollama_url, args.action_cache)
+    print(f"Fake Ollama at {ollama_url} (latency {args.ollama_latency}s, ttft {args.ttft}s)")
+
+    report = {}
+    real_stdout = sys.stdout
+    for name in scenarios:
+        if not args.verbose:
+            sys.stdout = open(os.devnull, "w") # The app prints every parsed action
+        try:
+            report[name] = run_scenario(name, base_url, users, task_ids, args)
+        finally:
+            if sys.stdout is not real_stdout:
+                sys.stdout.close()
+                sys.stdout = real_stdout
+        print_report(name, report[name], args)
+
+    if app_server:
+        app_server.shutdown()
+    ollama_server.shutdown()
+
+    if args.json_out:
+        with open(args.json_out, "w") as f:
+            json.dump({"settings": vars(args), **report}, f, indent=2)
+        print(f"\nWrote {args.json_out}")
+
+    failed = False
+    total_errors = sum(results["_all"]["errors"] for results in report.values())
+    if total_errors:
+        print(f"\nFAILED: {total_errors} requests returned errors")
+        failed = True
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(report, baseline, args.tolerance)
+        print(f"\nCompared with {args.baseline} (p95 tolerance {args.tolerance:.0%}): "
+              + ("no regressions" if not regressions else f"{len(regressions)} regression(s)"))
+        for regression in regressions:
+            print(f"  {regression}")
+        failed = failed or bool(regressions)
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
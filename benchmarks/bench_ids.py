@@ -0,0 +1,58 @@
+"""
+Benchmark for generate_unique_id: the Snowflake-style generator against the old timestamp ids.
+
+Reports ids per second from one thread, how many duplicates each scheme produces in a tight loop, the key
+length, and the size of a primary-key index over the same number of rows keyed each way.
+
+Usage: python benchmarks/bench_ids.py [--count 200000] [--rows 100000]
+"""
+import argparse
+import datetime
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.chdir(tempfile.mkdtemp(prefix="kairo_bench_ids_")) # app.DATABASE is relative; keep the real database untouched
+import app # noqa: E402
+
+def legacy_generate_unique_id(prefix):
+    """The generator this benchmark replaced, kept verbatim as the baseline."""
+    return f"{prefix}_{datetime.datetime.now().strftime('%Y%m%d%H%M%S%f')}"
+
+def time_generator(generate, count):
+    started = time.perf_counter()
+    ids = [generate("task") for _ in range(count)]
+    return time.perf_counter() - started, ids
+
+def index_size_bytes(ids):
+    """Bytes of a table keyed by a TEXT PRIMARY KEY (rowid table plus its key index) holding these ids."""
+    db = sqlite3.connect(":memory:")
+    db.execute("CREATE TABLE items (item_id TEXT PRIMARY KEY)")
+    db.executemany("INSERT OR IGNORE INTO items (item_id) VALUES (?)", ((item_id,) for item_id in ids))
+    db.commit()
+    page_size = db.execute("PRAGMA page_size").fetchone()[0]
+    page_count = db.execute("PRAGMA page_count").fetchone()[0]
+    db.close()
+    return page_size * page_count
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--count", type=int, default=200000)
+    parser.add_argument("--rows", type=int, default=100000)
+    args = parser.parse_args()
+
+    print(f"{'scheme':<10} {'ids/s':>12} {'duplicates':>11} {'key chars':>10} {'pk MB':>8}")
+    for label, generate in (("legacy", legacy_generate_unique_id), ("snowflake", app.generate_unique_id)):
+        seconds, ids = time_generator(generate, args.count)
+        duplicates = len(ids) - len(set(ids))
+        size = index_size_bytes(ids[:args.rows])
+        print(f"{label:<10} {args.count / seconds:>12,.0f} {duplicates:>11,} {len(ids[0]):>10} {size / 1e6:>8.2f}")
+
+    ids = [app.generate_unique_id("task") for _ in range(args.count)]
+    print(f"\nSnowflake ids strictly increasing: {all(a < b for a, b in zip(ids, ids[1:]))}")
+
+if __name__ == "__main__":
+    main()
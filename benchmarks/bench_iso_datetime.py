@@ -0,0 +1,122 @@
+"""
+Microbenchmark for get_iso_datetime, the datetime normalizer run on every task/event write.
+
+Compares the previous fromisoformat/strptime fallback chain with the current parser (fromisoformat, then
+one precompiled regex instead of strptime, behind a memo cache), cold (cache cleared before every pass)
+and warm, on a mix of the formats the LLM and the renderer send. It then times the bulk import path:
+validating a /tasks/batch payload, which normalizes every due_datetime. Before timing it checks that both
+parsers agree on the corpus.
+
+Usage: python benchmarks/bench_iso_datetime.py [--values 20000] [--batch 500] [--repeat 5]
+"""
+import argparse
+import datetime
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+BENCH_DIR = tempfile.mkdtemp(prefix="kairo_bench_iso_")
+os.environ["KAIRO_DATABASE"] = os.path.join(BENCH_DIR, "kairo_bench.db") # Importing app migrates it; keep the real database untouched
+os.environ["KAIRO_DB_SHARD_DIR"] = os.path.join(BENCH_DIR, "shards")
+import app # noqa: E402
+
+def legacy_get_iso_datetime(dt_str):
+    """The parser this benchmark replaced, kept verbatim as the baseline."""
+    if not dt_str:
+        return None
+    try:
+        dt_obj = datetime.datetime.fromisoformat(dt_str.replace('Z', '+00:00'))
+        return dt_obj.isoformat()
+    except ValueError:
+        try:
+            dt_obj = datetime.datetime.strptime(dt_str, '%Y-%m-%d %H:%M:%S')
+            return dt_obj.isoformat()
+        except ValueError:
+            try:
+                dt_obj = datetime.datetime.strptime(dt_str, '%Y-%m-%d')
+                return dt_obj.isoformat()
+            except ValueError:
+                return None
+
+FORMATS = [
+    "%Y-%m-%dT%H:%M:%S", # What the system prompt asks for
+    "%Y-%m-%dT%H:%M:%SZ",
+    "%Y-%m-%dT%H:%M:%S+02:00",
+    "%Y-%m-%dT%H:%M", # Renderer date + time inputs
+    "%Y-%m-%d %H:%M:%S",
+    "%Y-%m-%d",
+    "%Y-%m-%dT%H:%M:%S.%f",
+]
+
+def build_corpus(count, distinct_days=14):
+    """Datetimes spread over a couple of weeks at quarter hours, so values repeat like in a real calendar."""
+    rng = random.Random(42)
+    start = datetime.datetime(2026, 1, 5)
+    values = []
+    for _ in range(count):
+        moment = start + datetime.timedelta(days=rng.randrange(distinct_days), minutes=15 * rng.randrange(96))
+        values.append(moment.strftime(rng.choice(FORMATS)))
+    values.append("not a date")
+    return values
+
+def time_parser(parse, values, repeat, before_pass=None):
+    """Best-of-repeat seconds for parsing every value once."""
+    best = float("inf")
+    for _ in range(repeat):
+        if before_pass:
+            before_pass()
+        started = time.perf_counter()
+        for value in values:
+            parse(value)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+def time_batch_validation(operations, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        app._normalize_iso_datetime.cache_clear()
+        started = time.perf_counter()
+        for operation in operations:
+            app.validate_batch_operation('tasks', operation)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--values", type=int, default=20000)
+    parser.add_argument("--batch", type=int, default=app.BATCH_MAX_OPERATIONS)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    values = build_corpus(args.values)
+    mismatches = [value for value in values if app.get_iso_datetime(value) != legacy_get_iso_datetime(value)]
+    if mismatches:
+        print(f"Parsers disagree on {len(mismatches)} values, e.g. {mismatches[:5]}")
+        sys.exit(1)
+
+    legacy = time_parser(legacy_get_iso_datetime, values, args.repeat)
+    cold = time_parser(app.get_iso_datetime, values, args.repeat, before_pass=app._normalize_iso_datetime.cache_clear)
+    warm = time_parser(app.get_iso_datetime, values, args.repeat)
+
+    print(f"get_iso_datetime over {len(values)} values (best of {args.repeat}):")
+    for label, seconds in (("legacy", legacy), ("current, cold cache", cold), ("current, warm cache", warm)):
+        print(f"  {label:<20} {seconds * 1000:>8.1f} ms  {seconds / len(values) * 1e6:>6.2f} us/value  "
+              f"{legacy / seconds:>5.1f}x")
+
+    operations = [{"op": "create", "item": {"title": f"Imported task {index}", "due_datetime": value}}
+                  for index, value in enumerate(build_corpus(args.batch)[:-1])]
+    current = time_batch_validation(operations, args.repeat)
+    original_parser = app.get_iso_datetime
+    app.get_iso_datetime = legacy_get_iso_datetime # normalize_item_value looks the function up at call time
+    try:
+        baseline = time_batch_validation(operations, args.repeat)
+    finally:
+        app.get_iso_datetime = original_parser
+    print(f"\nValidating a {len(operations)}-task batch import (best of {args.repeat}):")
+    print(f"  legacy {baseline * 1000:.2f} ms, current {current * 1000:.2f} ms ({baseline / current:.1f}x)")
+
+if __name__ == "__main__":
+    main()
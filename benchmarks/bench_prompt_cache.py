@@ -0,0 +1,120 @@
+"""
+Time-to-first-token benchmark for the action-parsing prompt layout.
+
+Replays the same scripted conversation against a running Ollama twice:
+  legacy - history and user message embedded in the system prompt, so the prefix changes every turn
+  cached - static system prompt rendered once per day, history and user message as chat messages
+
+For every turn it reports time to first token and Ollama's prompt_eval_count/prompt_eval_duration.
+With a stable prefix Ollama only evaluates the new messages, so both should drop on repeated turns.
+
+Usage: python benchmarks/bench_prompt_cache.py [--turns 8] [--model llama3.1:8b] [--url http://localhost:11434/api/chat]
+"""
+import argparse
+import datetime
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+BENCH_DIR = tempfile.mkdtemp(prefix="kairo_bench_prompt_")
+os.environ["KAIRO_DATABASE"] = os.path.join(BENCH_DIR, "kairo_bench.db") # Importing app migrates it; keep the real database untouched
+os.environ["KAIRO_DB_SHARD_DIR"] = os.path.join(BENCH_DIR, "shards")
+import app # noqa: E402
+
+SCRIPTED_MESSAGES = [
+    "Remind me to call mom tomorrow at 5 PM.",
+    "Actually make that high priority.",
+    "Schedule a project review meeting on Friday at 10 AM for one hour.",
+    "What do I have coming up this week?",
+    "Add my new course: Data Structures, instructor John Doe.",
+    "Move the project review to next Monday at 2 PM.",
+    "Mark calling mom as completed.",
+    "Which courses am I taking?",
+    "Delete the project review meeting.",
+    "Thanks Kairo!",
+]
+
+def build_legacy_messages(user_message, history):
+    """The pre-cache layout: history JSON and the user message baked into the system prompt."""
+    system_prompt = app.render_system_prompt(datetime.date.today().isoformat())
+    system_prompt += (
+        f"\n        Conversation History:\n        {json.dumps(history)}\n\n"
+        f"        User Message: \"{user_message}\"\n\n        Your JSON Action:\n"
+    )
+    return [{"role": "system", "content": system_prompt}, {"role": "user", "content": user_message}]
+
+def run_turn(url, model, messages):
+    """Streams one chat turn; returns (ttft_seconds, total_seconds, reply_text, final_chunk)."""
+    payload = {"model": model, "messages": messages, "stream": True, "keep_alive": app.OLLAMA_KEEP_ALIVE}
+    started = time.perf_counter()
+    first_token_at = None
+    parts = []
+    final_chunk = {}
+    with requests.post(url, json=payload, stream=True, timeout=(app.OLLAMA_CONNECT_TIMEOUT, app.OLLAMA_TIMEOUT)) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if not line:
+                continue
+            chunk = json.loads(line)
+            content = chunk.get("message", {}).get("content")
+            if content:
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                parts.append(content)
+            if chunk.get("done"):
+                final_chunk = chunk
+                break
+    finished = time.perf_counter()
+    return (first_token_at or finished) - started, finished - started, "".join(parts), final_chunk
+
+def run_layout(layout, url, model, turns):
+    history = [] # Chronological chat messages, as load_conversation_history returns them
+    results = []
+    for user_message in SCRIPTED_MESSAGES[:turns]:
+        if layout == "legacy":
+            messages = build_legacy_messages(user_message, history)
+        else:
+            messages = app.build_action_messages(user_message, history)
+        ttft, total, reply, final_chunk = run_turn(url, model, messages)
+        results.append({
+            "ttft": ttft,
+            "total": total,
+            "prompt_eval_count": final_chunk.get("prompt_eval_count"),
+            "prompt_eval_ms": (final_chunk.get("prompt_eval_duration") or 0) / 1e6,
+        })
+        history.append({"role": "user", "content": user_message})
+        history.append({"role": "assistant", "content": reply.strip()})
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--turns", type=int, default=8)
+    parser.add_argument("--model", default=app.OLLAMA_MODEL)
+    parser.add_argument("--url", default=app.OLLAMA_URL)
+    args = parser.parse_args()
+
+    # Warm the model so the first measured turn does not include load time
+    run_turn(args.url, args.model, [{"role": "user", "content": "ping"}])
+
+    summary = {}
+    for layout in ("legacy", "cached"):
+        results = run_layout(layout, args.url, args.model, args.turns)
+        print(f"\n{layout}:")
+        print(f"  {'turn':>4} {'ttft_ms':>9} {'total_ms':>9} {'prompt_tokens':>13} {'prompt_eval_ms':>14}")
+        for turn, result in enumerate(results, start=1):
+            print(f"  {turn:>4} {result['ttft'] * 1000:>9.0f} {result['total'] * 1000:>9.0f} "
+                  f"{result['prompt_eval_count'] or 0:>13} {result['prompt_eval_ms']:>14.0f}")
+        # Turn 1 pays for the full prompt in both layouts; repeated turns are what the cache helps
+        summary[layout] = statistics.median(result['ttft'] for result in results[1:] or results)
+
+    print(f"\nMedian TTFT on repeated turns: legacy {summary['legacy'] * 1000:.0f} ms, "
+          f"cached {summary['cached'] * 1000:.0f} ms ({summary['legacy'] / summary['cached']:.1f}x)")
+
+if __name__ == "__main__":
+    main()
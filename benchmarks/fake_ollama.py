@@ -0,0 +1,134 @@
+"""
+Stand-in for Ollama's /api/chat with configurable latency and canned JSON actions, for benchmarks.
+
+The reply is picked from the last user message by keyword (remind/task -> create_task, meeting/schedule ->
+create_event, course -> create_course, mark/done -> update_task, what/show/list -> retrieve_items, anything
+else -> respond_conversation), so the app exercises the same action paths a real model would drive.
+Non-streamed calls sleep for the full latency; streamed calls send the first chunk after --ttft and spread
+the rest over the remaining time. Responses carry prompt_eval_count/eval_count estimates like Ollama's.
+
+Usage: python benchmarks/fake_ollama.py [--port 11434] [--latency 0.8] [--ttft 0.2]
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CANNED_ACTIONS = [
+    (("remind", "task", "todo", "to-do"),
+     {"action": "create_task", "title": "Review lecture notes", "priority": "medium",
+      "due_datetime": "2026-01-16T17:00:00", "tags": "study"}),
+    (("meeting", "schedule", "appointment"),
+     {"action": "create_event", "title": "Project sync", "start_datetime": "2026-01-16T10:00:00",
+      "end_datetime": "2026-01-16T11:00:00", "location": "Room 4"}),
+    (("course", "class"),
+     {"action": "create_course", "name": "Distributed Systems", "instructor": "Dr. Rao",
+      "schedule": "Tue,Thu 14:00-15:30"}),
+    (("mark", "done", "finished", "complete"),
+     {"action": "update_task", "title_keywords": "report", "status": "completed"}),
+    (("what", "show", "list", "upcoming"),
+     {"action": "retrieve_items", "item_type": "all", "limit": 20}),
+]
+DEFAULT_ACTION = {"action": "respond_conversation", "response_text": "Happy to help. What should I plan next?"}
+CHUNK_CHARS = 8 # Roughly two tokens per streamed chunk
+
+def pick_action(messages):
+    """The canned action for the last user message."""
+    text = next((message.get("content", "") for message in reversed(messages) if message.get("role") == "user"), "")
+    words = text.lower()
+    for keywords, action in CANNED_ACTIONS:
+        if any(keyword in words for keyword in keywords):
+            return action
+    return DEFAULT_ACTION
+
+def estimate_tokens(text):
+    return max(1, len(text) // 4)
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    latency = 0.8 # Seconds for a whole response
+    ttft = 0.2 # Seconds before the first streamed chunk
+    protocol_version = "HTTP/1.1" # Keep-alive, like Ollama, so the app's pooled session is exercised
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        messages = body.get("messages", [])
+        content = json.dumps(pick_action(messages))
+        usage = {
+            "prompt_eval_count": estimate_tokens("".join(message.get("content", "") for message in messages)),
+            "eval_count": estimate_tokens(content),
+            "total_duration": int(self.latency * 1e9),
+        }
+        if body.get("stream", True):
+            self._stream(body.get("model"), content, usage)
+        else:
+            time.sleep(self.latency)
+            self._send_json({"model": body.get("model"), "message": {"role": "assistant", "content": content},
+                             "done": True, **usage})
+
+    def _send_json(self, payload):
+        encoded = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(encoded)))
+        self.end_headers()
+        self.wfile.write(encoded)
+
+    def _stream(self, model, content, usage):
+        chunks = [content[index:index + CHUNK_CHARS] for index in range(0, len(content), CHUNK_CHARS)]
+        gap = max(0.0, self.latency - self.ttft) / max(1, len(chunks))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        time.sleep(self.ttft)
+        try:
+            for index, chunk in enumerate(chunks):
+                if index:
+                    time.sleep(gap)
+                self._write_chunk({"model": model, "message": {"role": "assistant", "content": chunk}, "done": False})
+            self._write_chunk({"model": model, "message": {"role": "assistant", "content": ""}, "done": True, **usage})
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass # The app closes the stream as soon as the action JSON is complete
+
+    def _write_chunk(self, payload):
+        line = json.dumps(payload).encode() + b"\n"
+        self.wfile.write(f"{len(line):x}\r\n".encode() + line + b"\r\n")
+        self.wfile.flush()
+
+class FakeOllamaServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address) # Resets from streams the app closed early are expected
+
+def start_fake_ollama(port=0, latency=0.8, ttft=0.2):
+    """Starts the server on a daemon thread; returns (server, /api/chat url)."""
+    handler = type("ConfiguredFakeOllamaHandler", (FakeOllamaHandler,), {"latency": latency, "ttft": min(ttft, latency)})
+    server = FakeOllamaServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/api/chat"
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--latency", type=float, default=0.8, help="seconds per response")
+    parser.add_argument("--ttft", type=float, default=0.2, help="seconds to the first streamed chunk")
+    args = parser.parse_args()
+    server, url = start_fake_ollama(args.port, args.latency, args.ttft)
+    print(f"Fake Ollama listening on {url} (latency {args.latency}s, ttft {args.ttft}s); Ctrl+C to stop")
+    print(f"Point the app at it with: KAIRO_OLLAMA_URL={url} python app.py")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Synthetic data generator: fills a Kairo database with users, tasks, events, courses and chat history.
+
+Rows are written in bulk through the app's own schema (migrations run on import), with the same derived
+columns the write helpers maintain (epoch shadow columns, Snowflake ids), spread over the weeks around
+today so dashboard, agenda and range queries see realistic hit rates. A fixed --seed makes runs
+reproducible. The database is KAIRO_DATABASE (or --database); it is never the default kairo_data.db
+unless that is asked for explicitly.
+
+Usage: python benchmarks/seed_data.py --database /tmp/kairo_bench.db [--users 50] [--tasks 200] [--events 100]
+       [--courses 8] [--history 400] [--seed 42]
+"""
+import argparse
+import datetime
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+TASK_VERBS = ["Finish", "Review", "Draft", "Submit", "Email", "Prepare", "Read", "Fix", "Plan", "Call"]
+TASK_OBJECTS = ["report", "lab notes", "essay outline", "budget", "slides", "chapter 4", "problem set",
+                "grant proposal", "bug backlog", "travel booking", "thesis intro", "team retro notes"]
+EVENT_TITLES = ["Team standup", "Office hours", "Study group", "Dentist", "Project sync", "Gym",
+                "Lunch with Sam", "Seminar", "1:1 with advisor", "Exam review"]
+COURSE_NAMES = ["Algorithms", "Linear Algebra", "Operating Systems", "Databases", "Machine Learning",
+                "Compilers", "Statistics", "Computer Networks", "Ethics in Computing", "Distributed Systems"]
+USER_MESSAGES = ["Remind me to finish the report", "What do I have this week?", "Schedule a meeting on Friday",
+                 "Mark the budget task as done", "Thanks!", "Add a course for Databases"]
+PRIORITIES = ["low", "medium", "medium", "high"]
+STATUSES = ["pending", "pending", "pending", "in-progress", "completed", "cancelled"]
+
+def user_ids(users):
+    return [f"bench_user_{index:05d}" for index in range(users)]
+
+def random_moment(rng, today, past_days=30, future_days=60):
+    """A quarter-hour timestamp between past_days ago and future_days ahead."""
+    day = today + datetime.timedelta(days=rng.randint(-past_days, future_days))
+    return datetime.datetime.combine(day, datetime.time(rng.randint(7, 20), 15 * rng.randrange(4)))
+
+def seed(app, users=50, tasks=200, events=100, courses=8, history=400, seed_value=42):
+    """Inserts the rows (counts are per user) and returns the user ids."""
+    rng = random.Random(seed_value)
+    today = datetime.date.today()
+    now = datetime.datetime.now().isoformat()
+    ids = user_ids(users)
+    with app.app.app_context():
+        for user_id in ids:
+            db = app.get_user_db(user_id) # The user's shard when KAIRO_DB_SHARD_MODE is set
+            course_rows = []
+            for index in range(courses):
+                start = today - datetime.timedelta(days=rng.randint(0, 60))
+                name = COURSE_NAMES[index % len(COURSE_NAMES)]
+                if index >= len(COURSE_NAMES):
+                    name += f" {index // len(COURSE_NAMES) + 1}"
+                course_rows.append((
+                    app.generate_unique_id("course"), user_id, name,
+                    "Weekly lectures and labs", f"Prof. {rng.choice('ABCDEFGH')}.", "Mon,Wed 09:00-10:30",
+                    start.isoformat(), (start + datetime.timedelta(days=120)).isoformat(), now, now
+                ))
+            db.executemany(
+                "INSERT INTO courses (course_id, user_id, name, description, instructor, schedule, start_date, end_date, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", course_rows
+            )
+
+            task_rows = []
+            for _ in range(tasks):
+                due = random_moment(rng, today).isoformat() if rng.random() < 0.85 else None
+                task_rows.append((
+                    app.generate_unique_id("task"), user_id, f"{rng.choice(TASK_VERBS)} {rng.choice(TASK_OBJECTS)}",
+                    "Generated by seed_data.py" if rng.random() < 0.5 else None, due, app.iso_to_epoch(due),
+                    rng.choice(PRIORITIES), rng.choice(STATUSES), rng.choice([None, "study", "work", "home,errand"]),
+                    rng.choice(course_rows)[0] if course_rows and rng.random() < 0.3 else None,
+                    "FREQ=WEEKLY" if rng.random() < 0.03 else None, now, now
+                ))
+            db.executemany(
+                "INSERT INTO tasks (task_id, user_id, title, description, due_datetime, due_epoch, priority, status, tags, course_id, recurrence, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", task_rows
+            )
+
+            event_rows = []
+            for _ in range(events):
+                start = random_moment(rng, today)
+                end = start + datetime.timedelta(minutes=rng.choice([30, 45, 60, 90, 120]))
+                event_rows.append((
+                    app.generate_unique_id("event"), user_id, rng.choice(EVENT_TITLES), None,
+                    start.isoformat(), end.isoformat(), app.iso_to_epoch(start.isoformat()), app.iso_to_epoch(end.isoformat()),
+                    rng.choice([None, "Library", "Room 101", "Online"]), None,
+                    rng.choice(["FREQ=WEEKLY", "FREQ=DAILY;COUNT=10"]) if rng.random() < 0.05 else None, now, now
+                ))
+            db.executemany(
+                "INSERT INTO events (event_id, user_id, title, description, start_datetime, end_datetime, start_epoch, end_epoch, location, attendees, recurrence, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", event_rows
+            )
+
+            history_rows = []
+            started = datetime.datetime.now() - datetime.timedelta(days=14)
+            for index in range(history):
+                timestamp = (started + datetime.timedelta(minutes=index * 7)).strftime('%Y-%m-%d %H:%M:%S')
+                if index % 2 == 0:
+                    history_rows.append((user_id, 'user', rng.choice(USER_MESSAGES), timestamp, None))
+                else:
+                    history_rows.append((user_id, 'kairo', "Done! Anything else?", timestamp,
+                                         json.dumps({"action": "respond_conversation"})))
+            db.executemany(
+                "INSERT INTO conversation_history (user_id, sender, message, timestamp, parsed_action) VALUES (?, ?, ?, ?, ?)",
+                history_rows
+            )
+            db.commit()
+    return ids
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--database", default=os.environ.get("KAIRO_DATABASE"),
+                        help="SQLite file to fill (defaults to KAIRO_DATABASE)")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--tasks", type=int, default=200, help="per user")
+    parser.add_argument("--events", type=int, default=100, help="per user")
+    parser.add_argument("--courses", type=int, default=8, help="per user")
+    parser.add_argument("--history", type=int, default=400, help="conversation rows per user")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    if not args.database:
+        parser.error("pass --database (or set KAIRO_DATABASE); the real kairo_data.db is not seeded implicitly")
+
+    os.environ["KAIRO_DATABASE"] = args.database
+    import app # noqa: E402 - DATABASE is read from the environment at import time
+
+    started = time.perf_counter()
+    seed(app, args.users, args.tasks, args.events, args.courses, args.history, args.seed)
+    rows = args.users * (args.tasks + args.events + args.courses + args.history)
+    print(f"Seeded {args.users} users ({rows:,} rows) into {args.database} in {time.perf_counter() - started:.1f} s")
+
+if __name__ == "__main__":
+    main()
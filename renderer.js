@@ -15,6 +15,8 @@ document.addEventListener('DOMContentLoaded', () => {
     // Dashboard elements
     const dashboardTotalTasks = document.getElementById('dashboard-total-tasks');
     const dashboardPendingTasks = document.getElementById('dashboard-pending-tasks');
+    const dashboardOverdueTasks = document.getElementById('dashboard-overdue-tasks');
+    const dashboardDueTodayTasks = document.getElementById('dashboard-due-today-tasks');
     const dashboardUpcomingEvents = document.getElementById('dashboard-upcoming-events');
     const dashboardActiveCourses = document.getElementById('dashboard-active-courses');
     const dashboardRecentActivity = document.getElementById('dashboard-recent-activity');
@@ -54,6 +56,11 @@ document.addEventListener('DOMContentLoaded', () => {
     let currentKairoStyle = localStorage.getItem('kairo_style') || 'friendly';
     kairoStyleSelect.value = currentKairoStyle;
 
+    // Local copy of the user's items, kept current with deltas from GET /changes instead of refetching whole lists
+    const itemStore = { version: 0, tasks: new Map(), events: new Map(), courses: new Map() };
+    const itemIdKeys = { tasks: 'task_id', events: 'event_id', courses: 'course_id' };
+    let syncInFlight = Promise.resolve();
+
     // --- Utility Functions ---
     function addMessageToChat(sender, message) {
         const msgDiv = document.createElement('div');
@@ -61,6 +68,7 @@ document.addEventListener('DOMContentLoaded', () => {
         msgDiv.textContent = message;
         chatMessages.appendChild(msgDiv);
         chatMessages.scrollTop = chatMessages.scrollHeight; // Scroll to bottom
+        return msgDiv;
     }
 
     function showLoadingSpinner() {
@@ -166,16 +174,51 @@ document.addEventListener('DOMContentLoaded', () => {
     // Initialize to dashboard view
     showView('dashboard');
 
+    // --- Incremental Sync ---
+
+    // Applies a /changes payload (also returned by /chat) to itemStore and returns the kinds it changed.
+    // Returns null if it starts after our version, i.e. there are changes in between that we have not seen.
+    function applyChanges(changes) {
+        if (changes.reset) {
+            Object.keys(itemIdKeys).forEach(kind => itemStore[kind].clear());
+        } else if (changes.since > itemStore.version) {
+            return null;
+        }
+        const changedKinds = [];
+        Object.entries(itemIdKeys).forEach(([kind, idKey]) => {
+            const updated = changes[kind] || [];
+            const deleted = changes.deleted[kind] || [];
+            updated.forEach(item => itemStore[kind].set(item[idKey], item));
+            deleted.forEach(id => itemStore[kind].delete(id));
+            if (changes.reset || updated.length || deleted.length) changedKinds.push(kind);
+        });
+        itemStore.version = Math.max(itemStore.version, changes.version);
+        return changedKinds;
+    }
+
+    // Fetches everything changed since our version and resolves to the kinds it changed.
+    // Calls are chained so deltas apply in order.
+    function syncChanges() {
+        syncInFlight = syncInFlight.catch(() => {}).then(async () => {
+            const response = await fetch(`${API_BASE_URL}/changes?user_id=${userId}&since=${itemStore.version}`);
+            if (!response.ok) throw new Error(`HTTP error! status: ${response.status}`);
+            return applyChanges(await response.json()) || [];
+        });
+        return syncInFlight;
+    }
+
+    // Items of one kind, newest first (the same order the list routes use)
+    function storedItems(kind) {
+        return [...itemStore[kind].values()].sort((a, b) => (b.created_at || '').localeCompare(a.created_at || ''));
+    }
+
     // --- Data Fetching and Rendering ---
 
     async function fetchAndRenderTasks() {
         tasksListContainer.innerHTML = '<p class="text-muted">Loading tasks...</p>';
         try {
-            // Use absolute URL
-            const response = await fetch(`${API_BASE_URL}/tasks?user_id=${userId}`);
-            if (!response.ok) throw new Error(`HTTP error! status: ${response.status}`);
-            const data = await response.json();
-            renderTasks(data.tasks);
+            await syncChanges();
+            renderTasks(storedItems('tasks'));
         } catch (error) {
             console.error('Error fetching tasks:', error);
             tasksListContainer.innerHTML = '<p class="text-error">Failed to load tasks. Please ensure your backend server is running and accessible at ' + API_BASE_URL + '.</p>';
@@ -194,7 +237,7 @@ document.addEventListener('DOMContentLoaded', () => {
             taskElement.classList.add('card', 'task-item');
             taskElement.dataset.taskId = task.task_id; // Store task_id for updates/deletes
 
-            const dueDate = task.due_datetime ? new Date(task.due_datetime).toLocaleString() : 'No due date';
+            const dueDate = task.due_epoch != null ? new Date(task.due_epoch * 1000).toLocaleString() : 'No due date';
             const descriptionSnippet = task.description ? ` - ${task.description.substring(0, 50)}${task.description.length > 50 ? '...' : ''}` : '';
             
             taskElement.innerHTML = `
@@ -219,11 +262,8 @@ document.addEventListener('DOMContentLoaded', () => {
     async function fetchAndRenderEvents() {
         eventsListContainer.innerHTML = '<p class="text-muted">Loading events...</p>';
         try {
-            // Use absolute URL
-            const response = await fetch(`${API_BASE_URL}/events?user_id=${userId}`);
-            if (!response.ok) throw new Error(`HTTP error! status: ${response.status}`);
-            const data = await response.json();
-            renderEvents(data.events);
+            await syncChanges();
+            renderEvents(storedItems('events'));
         } catch (error) {
             console.error('Error fetching events:', error);
             eventsListContainer.innerHTML = '<p class="text-error">Failed to load events. Please ensure your backend server is running and accessible at ' + API_BASE_URL + '.</p>';
@@ -242,8 +282,8 @@ document.addEventListener('DOMContentLoaded', () => {
             eventElement.classList.add('card', 'event-item');
             eventElement.dataset.eventId = event.event_id;
 
-            const startDt = new Date(event.start_datetime).toLocaleString();
-            const endDt = event.end_datetime ? new Date(event.end_datetime).toLocaleString() : 'N/A';
+            const startDt = new Date(event.start_epoch * 1000).toLocaleString();
+            const endDt = event.end_epoch != null ? new Date(event.end_epoch * 1000).toLocaleString() : 'N/A';
             
             eventElement.innerHTML = `
                 <div class="event-header">
@@ -267,11 +307,8 @@ document.addEventListener('DOMContentLoaded', () => {
     async function fetchAndRenderCourses() {
         coursesListContainer.innerHTML = '<p class="text-muted">Loading courses...</p>';
         try {
-            // Use absolute URL
-            const response = await fetch(`${API_BASE_URL}/courses?user_id=${userId}`);
-            if (!response.ok) throw new Error(`HTTP error! status: ${response.status}`);
-            const data = await response.json();
-            renderCourses(data.courses);
+            await syncChanges();
+            renderCourses(storedItems('courses'));
         } catch (error) {
             console.error('Error fetching courses:', error);
             coursesListContainer.innerHTML = '<p class="text-error">Failed to load courses. Please ensure your backend server is running and accessible at ' + API_BASE_URL + '.</p>';
@@ -314,51 +351,25 @@ document.addEventListener('DOMContentLoaded', () => {
     // --- Dashboard Updates ---
     async function updateDashboard() {
         try {
-            const [tasksRes, eventsRes, coursesRes] = await Promise.all([
-                fetch(`${API_BASE_URL}/tasks?user_id=${userId}`),
-                fetch(`${API_BASE_URL}/events?user_id=${userId}`),
-                fetch(`${API_BASE_URL}/courses?user_id=${userId}`)
-            ]);
-
-            const tasksData = await tasksRes.json();
-            const eventsData = await eventsRes.json();
-            const coursesData = await coursesRes.json();
-
-            const tasks = tasksData.tasks || [];
-            const events = eventsData.events || [];
-            const courses = coursesData.courses || [];
-
-            const pendingTasks = tasks.filter(t => t.status === 'pending').length;
-            const now = new Date();
-            const upcomingEvents = events.filter(e => new Date(e.start_datetime) > now).length;
-            const activeCourses = courses.filter(c => 
-                (!c.start_date || new Date(c.start_date) <= now) && 
-                (!c.end_date || new Date(c.end_date) >= now)
-            ).length;
-
-            dashboardTotalTasks.textContent = tasks.length;
-            dashboardPendingTasks.textContent = pendingTasks;
-            dashboardUpcomingEvents.textContent = upcomingEvents;
-            dashboardActiveCourses.textContent = activeCourses;
-
-            // Simple recent activity display (can be enhanced)
+            // Counts are aggregated (and cached) server-side, so this no longer transfers every item
+            const response = await fetch(`${API_BASE_URL}/dashboard?user_id=${userId}`);
+            if (!response.ok) throw new Error(`HTTP error! status: ${response.status}`);
+            const dashboard = await response.json();
+
+            dashboardTotalTasks.textContent = dashboard.tasks.total;
+            dashboardPendingTasks.textContent = dashboard.tasks.pending;
+            dashboardOverdueTasks.textContent = dashboard.tasks.overdue;
+            dashboardDueTodayTasks.textContent = dashboard.tasks.due_today;
+            dashboardUpcomingEvents.textContent = dashboard.events.upcoming;
+            dashboardActiveCourses.textContent = dashboard.courses.active;
+
             dashboardRecentActivity.innerHTML = '';
-            if (tasks.length > 0 || events.length > 0 || courses.length > 0) {
-                const recentItems = [
-                    ...tasks.map(t => ({ type: 'Task', title: t.title, date: t.updated_at || t.created_at })),
-                    ...events.map(e => ({ type: 'Event', title: e.title, date: e.updated_at || e.created_at })),
-                    ...courses.map(c => ({ type: 'Course', title: c.name, date: c.updated_at || c.created_at }))
-                ].sort((a, b) => new Date(b.date) - new Date(a.date)).slice(0, 5); // Get 5 most recent
-
-                if (recentItems.length > 0) {
-                    recentItems.forEach(item => {
-                        const li = document.createElement('li');
-                        li.textContent = `${new Date(item.date).toLocaleDateString()}: ${item.type} "${item.title}" updated.`;
-                        dashboardRecentActivity.appendChild(li);
-                    });
-                } else {
-                    dashboardRecentActivity.innerHTML = '<li>No recent activity.</li>';
-                }
+            if (dashboard.recent_activity.length > 0) {
+                dashboard.recent_activity.forEach(item => {
+                    const li = document.createElement('li');
+                    li.textContent = `${new Date(item.date).toLocaleDateString()}: ${item.type} "${item.title}" updated.`;
+                    dashboardRecentActivity.appendChild(li);
+                });
             } else {
                 dashboardRecentActivity.innerHTML = '<li>No recent activity.</li>';
             }
@@ -978,6 +989,41 @@ document.addEventListener('DOMContentLoaded', () => {
 
     // --- Kairo AI Chat Integration ---
 
+    // Reads a text/event-stream response body and calls onEvent(eventName, data) for each event
+    async function readServerSentEvents(response, onEvent) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const rawEvent = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+                let eventName = 'message';
+                let dataText = '';
+                rawEvent.split('\n').forEach(line => {
+                    if (line.startsWith('event:')) eventName = line.slice(6).trim();
+                    else if (line.startsWith('data:')) dataText += line.slice(5).trim();
+                });
+                if (dataText) onEvent(eventName, JSON.parse(dataText));
+            }
+        }
+    }
+
+    // Pulls the (possibly still incomplete) response_text out of a partially streamed action JSON
+    function extractPartialResponseText(rawActionText) {
+        const match = rawActionText.match(/"response_text"\s*:\s*"((?:[^"\\]|\\.)*)/);
+        if (!match) return null;
+        try {
+            return JSON.parse(`"${match[1].replace(/\\$/, '')}"`);
+        } catch (e) {
+            return match[1];
+        }
+    }
+
     async function sendMessageToKairo() {
         const message = chatInput.value.trim();
         if (!message) return;
@@ -986,8 +1032,9 @@ document.addEventListener('DOMContentLoaded', () => {
         chatInput.value = '';
         showLoadingSpinner();
 
+        let streamingMessage = null; // Kairo bubble that shows conversational replies as they stream in
         try {
-            const response = await fetch(`${API_BASE_URL}/chat`, { // Now consistently using API_BASE_URL
+            const response = await fetch(`${API_BASE_URL}/chat/stream`, { // Streams tokens as Server-Sent Events
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
@@ -1004,25 +1051,38 @@ document.addEventListener('DOMContentLoaded', () => {
                 throw new Error(errorData.error || `HTTP error! status: ${response.status}`);
             }
 
-            const data = await response.json();
-            addMessageToChat('kairo', data.response);
-
-            // Update relevant views based on parsed_action
-            if (data.parsed_action) {
-                const actionType = data.parsed_action.action;
-                if (actionType.includes('task')) {
-                    fetchAndRenderTasks();
-                    updateDashboard();
-                }
-                if (actionType.includes('event')) {
-                    fetchAndRenderEvents();
-                    updateDashboard();
-                }
-                if (actionType.includes('course')) {
-                    fetchAndRenderCourses();
-                    updateDashboard();
+            let rawActionText = '';
+            let data = null;
+            await readServerSentEvents(response, (eventName, eventData) => {
+                if (eventName === 'token') {
+                    rawActionText += eventData.text;
+                    const partialText = extractPartialResponseText(rawActionText);
+                    if (partialText) {
+                        if (!streamingMessage) streamingMessage = addMessageToChat('kairo', '');
+                        streamingMessage.textContent = partialText;
+                        chatMessages.scrollTop = chatMessages.scrollHeight;
+                    }
+                } else if (eventName === 'result') {
+                    data = eventData;
                 }
+            });
+            if (!data) throw new Error('The response stream ended before Kairo finished.');
+
+            if (streamingMessage) {
+                streamingMessage.textContent = data.response;
+            } else {
+                addMessageToChat('kairo', data.response);
             }
+
+            // Apply the returned delta locally; only sync with /changes if it doesn't line up with our version
+            let changedKinds = data.changes ? applyChanges(data.changes) : null;
+            if (!changedKinds) {
+                changedKinds = await syncChanges();
+            }
+
+            // Re-render every view whose items changed; a batch action can touch several kinds at once
+            const renderers = { tasks: renderTasks, events: renderEvents, courses: renderCourses };
+            changedKinds.forEach(kind => renderers[kind](storedItems(kind)));
             // Always update dashboard after any action that might change counts
             updateDashboard();
 
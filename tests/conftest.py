@@ -0,0 +1,29 @@
+"""
+Shared fixtures. The app is imported against a scratch database (KAIRO_DATABASE is read at import time)
+and an Ollama URL nothing listens on, so tests never touch kairo_data.db or a real model.
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+TEST_DATA_DIR = tempfile.mkdtemp(prefix="kairo_tests_")
+os.environ["KAIRO_DATABASE"] = os.path.join(TEST_DATA_DIR, "kairo_test.db")
+os.environ["KAIRO_DB_SHARD_DIR"] = os.path.join(TEST_DATA_DIR, "shards")
+os.environ["KAIRO_OLLAMA_URL"] = "http://127.0.0.1:9/api/chat"
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import app as kairo  # noqa: E402
+
+
+@pytest.fixture
+def app_context():
+    with kairo.app.app_context():
+        yield kairo
+
+
+@pytest.fixture
+def scratch_db_path(tmp_path):
+    """A path for a separate SQLite file (for migration tests)."""
+    return str(tmp_path / "scratch.db")
@@ -0,0 +1,41 @@
+import datetime
+
+import pytest
+
+import app as kairo  # conftest points it at a scratch database
+
+DAY = datetime.date(2026, 1, 15)
+
+def exchange(question):
+    return [
+        {"role": "user", "content": "clean up my list"},
+        {"role": "assistant", "content": '{"action": "respond_conversation", "response_text": "%s"}' % question},
+    ]
+
+HISTORY_A = exchange("Should I delete Submit thesis?")
+HISTORY_B = exchange("Should I delete Buy milk?")
+
+
+@pytest.mark.parametrize("message", ["yes", "yes please", "sure, go ahead", "what do I have this week?"])
+def test_key_differs_across_histories(message):
+    assert kairo.action_cache_key("u1", message, HISTORY_A, DAY) != kairo.action_cache_key("u1", message, HISTORY_B, DAY)
+
+
+@pytest.mark.parametrize("history", [[], HISTORY_A])
+def test_key_differs_across_users(history):
+    assert kairo.action_cache_key("u1", "yes", history, DAY) != kairo.action_cache_key("u2", "yes", history, DAY)
+
+
+def test_key_ignores_case_and_trailing_punctuation():
+    assert kairo.action_cache_key("u1", "What do I have this week?", [], DAY) == \
+        kairo.action_cache_key("u1", "what  do i have this week", [], DAY)
+
+
+def test_cached_parse_is_not_replayed_for_another_user_or_context(app_context):
+    delete_action = {"action": "delete_task", "title_keywords": "Submit thesis"}
+    kairo.store_cached_action("cache_user_a", "yes", HISTORY_A, delete_action)
+
+    assert kairo.get_cached_action("cache_user_a", "yes", HISTORY_A) == delete_action
+    assert kairo.get_cached_action("cache_user_b", "yes", HISTORY_A) is None
+    assert kairo.get_cached_action("cache_user_a", "yes", HISTORY_B) is None
+    assert kairo.get_cached_action("cache_user_b", "yes", HISTORY_B) is None
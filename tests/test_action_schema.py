@@ -0,0 +1,82 @@
+import json
+
+import pytest
+
+import app as kairo  # conftest points it at a scratch database
+
+
+def schema_branch(schema, action_name):
+    return next(branch for branch in schema["anyOf"] if branch["properties"]["action"]["enum"] == [action_name])
+
+
+@pytest.mark.parametrize("action", [
+    {"action": "create_task", "title": "Essay", "status": "all"},
+    {"action": "update_task", "task_id": "task_1", "status": "all"},
+])
+def test_writes_cannot_set_status_all(action):
+    assert kairo.validate_action(action) == ["'status' must be one of: pending, in-progress, completed, cancelled"]
+
+
+def test_retrieve_items_can_filter_on_status_all():
+    assert kairo.validate_action({"action": "retrieve_items", "item_type": "tasks", "status": "all"}) == []
+
+
+def test_validation_normalizes_synonyms():
+    action = {"action": "update_task", "title_keywords": "essay", "status": "Done", "priority": "HIGH"}
+    assert kairo.validate_action(action) == []
+    assert (action["status"], action["priority"]) == ("completed", "high")
+
+
+def test_format_schema_only_offers_status_all_to_retrieve_items():
+    for name in ("create_task", "update_task"):
+        assert "all" not in schema_branch(kairo.ACTION_FORMAT_SCHEMA, name)["properties"]["status"]["enum"]
+    assert "all" in schema_branch(kairo.ACTION_FORMAT_SCHEMA, "retrieve_items")["properties"]["status"]["enum"]
+    batch_items = schema_branch(kairo.ACTION_FORMAT_SCHEMA, "batch")["properties"]["actions"]["items"]
+    assert "all" not in schema_branch(batch_items, "create_task")["properties"]["status"]["enum"]
+
+
+@pytest.mark.parametrize("raw_text, expected, repaired", [
+    ('{"action": "delete_task", "task_id": "task_1"}', {"action": "delete_task", "task_id": "task_1"}, False),
+    ('Sure!\n```json\n{"action": "delete_task", "task_id": "task_1"}\n```', {"action": "delete_task", "task_id": "task_1"}, False),
+    ('{"action": "delete_task", "task_id": "task_1",}', {"action": "delete_task", "task_id": "task_1"}, True),
+    ('{"action": "create_task", "title": "Essay", "priority": "hi', {"action": "create_task", "title": "Essay"}, True),
+    ('no action here', None, False),
+])
+def test_parse_action_text(raw_text, expected, repaired):
+    assert kairo.parse_action_text(raw_text) == (expected, repaired)
+
+
+def test_invalid_status_is_reprompted_with_the_action_schema(monkeypatch):
+    prompts = []
+
+    def fake_ollama(messages, response_format=None):
+        prompts.append((messages, response_format))
+        return '{"action": "update_task", "task_id": "task_1", "status": "completed"}'
+    monkeypatch.setattr(kairo, "get_ollama_response", fake_ollama)
+
+    raw = '{"action": "update_task", "task_id": "task_1", "status": "all"}'
+    assert kairo.extract_action_json(raw, "finish task_1") == {"action": "update_task", "task_id": "task_1", "status": "completed"}
+    (messages, response_format), = prompts
+    assert "'status' must be one of" in messages[-1]["content"]
+    assert response_format == kairo.build_action_schema(["update_task"])
+    assert "all" not in response_format["properties"]["status"]["enum"]
+
+
+def test_only_the_invalid_batch_item_is_reprompted(monkeypatch):
+    prompts = []
+
+    def fake_ollama(messages, response_format=None):
+        prompts.append(messages[-1]["content"])
+        return '{"action": "create_task", "title": "Essay", "status": "pending"}'
+    monkeypatch.setattr(kairo, "get_ollama_response", fake_ollama)
+
+    raw = json.dumps({"action": "batch", "actions": [
+        {"action": "delete_task", "task_id": "task_1"},
+        {"action": "create_task", "title": "Essay", "status": "all"},
+    ]})
+    parsed_action = kairo.extract_action_json(raw, "drop task_1 and add essay")
+    assert parsed_action["actions"] == [
+        {"action": "delete_task", "task_id": "task_1"},
+        {"action": "create_task", "title": "Essay", "status": "pending"},
+    ]
+    assert len(prompts) == 1 and '"status": "all"' in prompts[0]
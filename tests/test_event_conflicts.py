@@ -0,0 +1,66 @@
+import pytest
+
+import app as kairo  # conftest points it at a scratch database
+
+
+@pytest.fixture
+def calendar(app_context, monkeypatch):
+    def no_index_rebuilds(user_id):
+        raise AssertionError("conflict checks must not rebuild the event interval index")
+    user_id = kairo.generate_unique_id("conflict_user") # Fresh calendar per test
+    kairo.add_event_to_db(user_id, "Conference", "2030-03-02T09:00:00", end_datetime="2030-03-06T17:00:00")
+    kairo.add_event_to_db(user_id, "Dentist", "2030-03-10T10:00:00", end_datetime="2030-03-10T11:00:00")
+    kairo.add_event_to_db(user_id, "Quick call", "2030-03-10T11:30:00") # No end: blocks the default duration
+    kairo.add_event_to_db(user_id, "Standup", "2030-03-11T09:00:00", end_datetime="2030-03-11T09:15:00",
+                          recurrence="FREQ=DAILY")
+    kairo.add_task_to_db(user_id, "Unrelated write") # Bumps the change version
+    monkeypatch.setattr(kairo, "build_event_index", no_index_rebuilds)
+    return user_id
+
+
+def conflict_titles(user_id, start, end=None):
+    event = {"start_datetime": start, "end_datetime": end}
+    return sorted(entry["title"] for entry in kairo.find_event_conflicts(user_id, event))
+
+
+@pytest.mark.parametrize("start, end, expected", [
+    ("2030-03-10T10:30:00", "2030-03-10T10:45:00", ["Dentist"]),
+    ("2030-03-10T11:00:00", "2030-03-10T11:30:00", []), # Touching intervals do not overlap
+    ("2030-03-10T11:40:00", "2030-03-10T12:30:00", ["Quick call"]),
+    ("2030-03-05T12:00:00", "2030-03-05T13:00:00", ["Conference"]), # Started days before the window
+    ("2030-03-12T09:10:00", "2030-03-12T10:00:00", ["Standup"]),
+    ("2030-03-08T12:00:00", "2030-03-08T13:00:00", []),
+])
+def test_conflicts_without_rebuilding_the_event_index(calendar, start, end, expected):
+    assert conflict_titles(calendar, start, end) == expected
+
+
+def test_conflicts_exclude_the_event_itself(calendar):
+    dentist = next(event for event in kairo.get_all_events_for_user(calendar) if event["title"] == "Dentist")
+    assert kairo.find_event_conflicts(calendar, dentist) == []
+
+
+def test_batch_writes_report_conflicts_per_event(calendar):
+    dentist = next(event for event in kairo.get_all_events_for_user(calendar) if event["title"] == "Dentist")
+    operations = [
+        {"op": "create", "item": {"title": "Lunch", "start_datetime": "2030-03-10T10:30:00", "end_datetime": "2030-03-10T12:00:00"}},
+        {"op": "create", "item": {"title": "Gym", "start_datetime": "2030-03-08T18:00:00", "end_datetime": "2030-03-08T19:00:00"}},
+        {"op": "update", "id": dentist["event_id"], "item": {"start_datetime": "2030-03-04T10:00:00", "end_datetime": "2030-03-04T11:00:00"}},
+    ]
+    response = kairo.app.test_client().post("/events/batch", json={"user_id": calendar, "operations": operations})
+
+    assert response.status_code == 200
+    lunch, gym, moved = response.get_json()["results"]
+    assert sorted(entry["title"] for entry in lunch["conflicts"]) == ["Quick call"] # Checked after the Dentist moved away
+    assert gym["conflicts"] == []
+    assert [entry["title"] for entry in moved["conflicts"]] == ["Conference"]
+
+
+def test_chat_batch_names_the_conflicting_events(calendar):
+    message, _, events, _ = kairo.process_ai_action(calendar, {"action": "batch", "actions": [
+        {"action": "create_event", "title": "Lunch", "start_datetime": "2030-03-10T10:30:00", "end_datetime": "2030-03-10T12:00:00"},
+        {"action": "create_event", "title": "Gym", "start_datetime": "2030-03-08T18:00:00", "end_datetime": "2030-03-08T19:00:00"},
+    ]})
+    assert [event["title"] for event in events] == ["Lunch", "Gym"]
+    assert "Heads up: 'Lunch' overlaps with 'Dentist'" in message
+    assert "'Gym' overlaps" not in message
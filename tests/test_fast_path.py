@@ -0,0 +1,62 @@
+import datetime
+
+import pytest
+
+import app as kairo  # conftest points it at a scratch database
+
+TODAY = datetime.date(2026, 1, 14) # A Wednesday
+
+
+@pytest.mark.parametrize("message, expected", [
+    ("delete the task submit thesis", {"action": "delete_task", "title_keywords": "submit thesis"}),
+    ("delete my task called the weekly report", {"action": "delete_task", "title_keywords": "weekly report"}),
+    ("cancel the meeting Project sync", {"action": "delete_event", "title_keywords": "Project sync"}),
+    ("remove course 'Pros and Cons of AI'", {"action": "delete_course", "name_keywords": "Pros and Cons of AI"}),
+    ("delete task_0A1B2C", {"action": "delete_task", "task_id": "task_0A1B2C"}),
+    ("mark the budget task as done", {"action": "update_task", "title_keywords": "budget task", "status": "completed"}),
+    ("set the priority of the task essay to high", {"action": "update_task", "title_keywords": "essay", "priority": "high"}),
+])
+def test_targeted_rules(message, expected):
+    assert kairo.fast_parse_action(message, TODAY) == expected
+
+
+@pytest.mark.parametrize("message", [
+    "cancel the meeting with Bob",
+    "delete the task about taxes",
+    "delete my task called buy milk and call mom",
+    "remove the event standup, lunch",
+    "delete the task it",
+    "cancel the appointment for tomorrow",
+    "mark groceries or laundry as done",
+    "complete the task all of them",
+])
+def test_ambiguous_targets_fall_through_to_the_llm(message):
+    assert kairo.fast_parse_action(message, TODAY) is None
+
+
+@pytest.mark.parametrize("message, field, title", [
+    ("schedule a meeting tomorrow at 3pm", "title", "Meeting"),
+    ("schedule the team meeting on friday at 10am", "title", "Team meeting"),
+    ("add a task: the lab report", "title", "Lab report"),
+    ("remind me to call mom tomorrow", "title", "Call mom"),
+    ("add a new course called the Compilers", "name", "Compilers"),
+])
+def test_created_titles_drop_leading_articles(message, field, title):
+    parsed_action = kairo.fast_parse_action(message, TODAY)
+    assert parsed_action is not None
+    assert parsed_action[field] == title
+
+
+def test_created_event_keeps_its_date_and_time():
+    parsed_action = kairo.fast_parse_action("schedule a meeting tomorrow at 3pm", TODAY)
+    assert parsed_action["action"] == "create_event"
+    assert parsed_action["start_datetime"] == "2026-01-15T15:00:00"
+
+
+def test_queued_chat_jobs_do_not_count_the_fast_path_again(app_context, monkeypatch):
+    monkeypatch.setattr(kairo, "parse_ai_action_cached", lambda *args: {"action": "respond_conversation", "response_text": "Hi!"})
+    before = kairo.get_fast_path_stats()
+    user_id = kairo.generate_unique_id("fast_path_user")
+    kairo.run_chat_job(user_id, {"message": "how was your day?"}, kairo.generate_unique_id("job"))
+    after = kairo.get_fast_path_stats()
+    assert (after["hits"], after["misses"]) == (before["hits"], before["misses"])
@@ -0,0 +1,62 @@
+import threading
+
+import pytest
+
+import app as kairo  # conftest points it at a scratch database
+
+
+@pytest.fixture
+def writer(monkeypatch):
+    monkeypatch.setattr(kairo, "HISTORY_FLUSH_INTERVAL_SECONDS", 60) # Only the test flushes
+    history_writer = kairo.HistoryWriter()
+    yield history_writer
+    history_writer.stop()
+
+
+def turn(message):
+    return [{"sender": "user", "message": message, "parsed_action": None},
+            {"sender": "kairo", "message": "Done!", "parsed_action": None}]
+
+
+def read_stored(user_id):
+    def read():
+        with kairo.app.app_context():
+            return [row['message'] for row in kairo.get_recent_history_rows(user_id, 50)]
+    return read
+
+
+def test_queued_rows_are_visible_before_they_are_written(writer):
+    writer.enqueue("hw_pending", turn("remind me to call mom"))
+    stored, pending = writer.read_with_pending("hw_pending", read_stored("hw_pending"))
+    assert stored == []
+    assert [row["message"] for row in pending] == ["remind me to call mom", "Done!"]
+
+
+def test_read_during_flush_commit_never_sees_a_row_twice(writer, monkeypatch):
+    user_id = "hw_race"
+    writer.enqueue(user_id, turn("first"))
+    results = []
+    original_write = writer._write
+
+    def write_then_read(rows_by_user):
+        written = original_write(rows_by_user) # Committed, but the rows are still in _pending
+        reader = threading.Thread(target=lambda: results.append(writer.read_with_pending(user_id, read_stored(user_id))))
+        reader.start()
+        reader.join(timeout=0.2) # The reader has to wait for the flush to finish
+        assert reader.is_alive()
+        results.append(reader)
+        return written
+
+    monkeypatch.setattr(writer, "_write", write_then_read)
+    assert writer.flush() == 2
+    results[0].join(timeout=5)
+    stored, pending = results[1]
+    assert sorted(stored) == ["Done!", "first"]
+    assert pending == []
+
+
+def test_stop_writes_what_is_still_queued(writer, app_context):
+    writer.enqueue("hw_shutdown", turn("last words"))
+    writer.stop()
+    assert writer.get_stats()["queued"] == 0
+    assert len(read_stored("hw_shutdown")()) == 2
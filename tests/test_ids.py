@@ -0,0 +1,81 @@
+import threading
+
+import pytest
+
+import app as kairo  # conftest points it at a scratch database
+
+THREADS = 8
+
+
+def run_threads(target):
+    start_barrier = threading.Barrier(THREADS)
+    results = {}
+
+    def run(index):
+        start_barrier.wait()
+        results[index] = target(index)
+    threads = [threading.Thread(target=run, args=(index,)) for index in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def strictly_increasing(values):
+    return all(earlier < later for earlier, later in zip(values, values[1:]))
+
+
+def test_ids_are_unique_and_increase_per_thread():
+    generator = kairo.IdGenerator(worker_id=7)
+    per_thread = run_threads(lambda index: [generator.next_id() for _ in range(5000)])
+
+    all_ids = [item_id for ids in per_thread.values() for item_id in ids]
+    assert len(set(all_ids)) == len(all_ids)
+    assert all(strictly_increasing(ids) for ids in per_thread.values())
+    assert all(len(item_id) == 13 for item_id in all_ids)
+
+
+def test_string_order_matches_numeric_order(monkeypatch):
+    clock_ms = [1, 31, 32, 1_023, 1_024, 2 ** 20, 2 ** 30, 2 ** 40]
+    ticks = iter(clock_ms)
+    monkeypatch.setattr(kairo.time, "time_ns", lambda: (kairo.ID_EPOCH_MS + next(ticks)) * 1_000_000)
+    generator = kairo.IdGenerator(worker_id=1023)
+    assert strictly_increasing([generator.next_id() for _ in clock_ms])
+
+
+@pytest.mark.parametrize("clock_ms", [
+    [1_000, 1_000, 990, 990, 995, 1_001, 1_001], # The clock steps back 10 ms and catches up
+    [5_000] * 5000, # More than 4096 ids in one millisecond borrow the next one
+])
+def test_ids_keep_increasing_when_the_clock_stalls_or_steps_back(monkeypatch, clock_ms):
+    ticks = iter(clock_ms)
+    monkeypatch.setattr(kairo.time, "time_ns", lambda: (kairo.ID_EPOCH_MS + next(ticks)) * 1_000_000)
+    generator = kairo.IdGenerator(worker_id=3)
+    ids = [generator.next_id() for _ in clock_ms]
+    assert strictly_increasing(ids)
+
+
+def test_concurrent_inserts_through_the_write_paths_never_collide():
+    user_id = kairo.generate_unique_id("stress_ids")
+
+    def insert(thread_index):
+        ids = []
+        with kairo.app.app_context():
+            for insert_index in range(10):
+                if insert_index % 2 == 0:
+                    ids.append(kairo.add_task_to_db(user_id, f"Task {thread_index}-{insert_index}")['task_id'])
+                else:
+                    operations = [{"op": "create", "item": {"title": f"Batch {thread_index}-{insert_index}-{n}"}}
+                                  for n in range(20)]
+                    _, results = kairo.apply_batch('tasks', user_id, operations)
+                    ids.extend(result["id"] for result in results)
+        return ids
+
+    per_thread = run_threads(insert)
+    all_ids = [item_id for ids in per_thread.values() for item_id in ids]
+    assert len(set(all_ids)) == len(all_ids) == THREADS * (5 + 5 * 20)
+    assert all(strictly_increasing(ids) for ids in per_thread.values())
+    with kairo.app.app_context():
+        stored = kairo.get_user_db(user_id).execute("SELECT COUNT(*) FROM tasks WHERE user_id = ?", (user_id,)).fetchone()[0]
+    assert stored == len(all_ids)
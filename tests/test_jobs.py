@@ -0,0 +1,89 @@
+import json
+import time
+
+import pytest
+
+import app as kairo  # conftest points it at a scratch database
+
+
+def insert_job(status, attempts, heartbeat_age, claimed_by="dead-process"):
+    job_id = kairo.generate_unique_id("job")
+    now = time.time()
+    kairo.get_db().execute(
+        "INSERT INTO jobs (job_id, user_id, kind, payload, status, attempts, created_at, started_at, claimed_by, heartbeat_at) "
+        "VALUES (?, 'jobs_user', 'chat', ?, ?, ?, ?, ?, ?, ?)",
+        (job_id, json.dumps({"message": "hello"}), status, attempts, now - heartbeat_age, now - heartbeat_age, claimed_by,
+         now - heartbeat_age)
+    )
+    kairo.get_db().commit()
+    return job_id
+
+
+def job_row(job_id):
+    return kairo.get_db().execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+
+
+def test_orphaned_jobs_are_requeued_until_attempts_run_out(app_context):
+    stale = kairo.JOB_ORPHANED_AFTER_SECONDS + 5
+    retryable = insert_job("running", 1, stale)
+    exhausted = insert_job("running", kairo.JOB_MAX_ATTEMPTS, stale)
+
+    kairo.recover_interrupted_jobs(kairo.get_db())
+    kairo.get_db().commit()
+
+    assert job_row(retryable)["status"] == "queued"
+    assert job_row(retryable)["claimed_by"] is None
+    assert job_row(exhausted)["status"] == "failed"
+    assert job_row(exhausted)["error"] == kairo.JOB_INTERRUPTED_ERROR
+
+
+def test_jobs_of_a_live_worker_are_not_taken_over(app_context):
+    live = insert_job("running", 1, 1, claimed_by="live-process")
+    kairo.recover_interrupted_jobs(kairo.get_db())
+    kairo.get_db().commit()
+    assert job_row(live)["status"] == "running"
+    assert job_row(live)["claimed_by"] == "live-process"
+
+
+def test_a_stale_worker_cannot_finish_a_recovered_job(app_context):
+    queue = kairo.JobQueue(workers=0)
+    job_id = insert_job("running", 1, 1, claimed_by="another-process")
+    queue._finish(kairo.get_db(), job_id, "succeeded", result={})
+    assert job_row(job_id)["status"] == "running"
+
+
+def count_tasks(user_id, title):
+    return kairo.get_user_db(user_id).execute(
+        "SELECT COUNT(*) FROM tasks WHERE user_id = ? AND title = ?", (user_id, title)
+    ).fetchone()[0]
+
+
+def test_a_replayed_chat_job_does_not_repeat_its_action(app_context, monkeypatch):
+    user_id = kairo.generate_unique_id("replay_user")
+    job_id = kairo.generate_unique_id("job")
+    payload = {"message": "I need to pick up milk on the way home"}
+    monkeypatch.setattr(kairo, "parse_ai_action_cached", lambda *args: {"action": "create_task", "title": "Buy milk"})
+
+    first = kairo.run_chat_job(user_id, payload, job_id)
+    replay = kairo.run_chat_job(user_id, payload, job_id) # The worker died after the commit and the job was requeued
+
+    assert count_tasks(user_id, "Buy milk") == 1
+    assert replay["parsed_action"] == first["parsed_action"]
+    assert [task["title"] for task in replay["changes"]["tasks"]] == ["Buy milk"] # The client still gets the delta
+
+
+def test_a_failed_action_rolls_back_its_writes_and_leaves_no_marker(app_context, monkeypatch):
+    user_id = kairo.generate_unique_id("replay_user")
+    job_id = kairo.generate_unique_id("job")
+
+    def add_then_fail(user_id, parsed_action):
+        kairo.add_task_to_db(user_id, "Half done") # Commits on its own outside an atomic block
+        raise kairo.APIError("boom", 500)
+    monkeypatch.setattr(kairo, "parse_ai_action_cached", lambda *args: {"action": "create_task", "title": "Half done"})
+    monkeypatch.setattr(kairo, "process_ai_action", add_then_fail)
+
+    result = kairo.run_chat_job(user_id, {"message": "note that this is half done"}, job_id)
+
+    assert "boom" in result["response"]
+    assert count_tasks(user_id, "Half done") == 0
+    assert kairo.get_processed_job(user_id, job_id) is None
@@ -0,0 +1,67 @@
+import datetime
+import os
+import time
+
+import pytest
+
+import app as kairo  # conftest points it at a scratch database
+
+
+@pytest.fixture
+def new_york_time(monkeypatch):
+    """Runs the test with local time at UTC-5 (in January), so UTC and local datetimes differ."""
+    monkeypatch.setenv("TZ", "America/New_York")
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def occurrences(recurrence, dtstart, window_start=None, window_end=None):
+    window_start = window_start or dtstart
+    window_end = window_end or dtstart + datetime.timedelta(days=60)
+    return list(kairo.iter_occurrences(recurrence, dtstart, window_start, window_end))
+
+
+def test_utc_until_is_compared_in_local_time(new_york_time):
+    # 15:00Z is 10:00 in New York, so the 11:00 occurrence on the 10th is already past UNTIL
+    rule = kairo.parse_rrule("FREQ=DAILY;UNTIL=20260110T150000Z")
+    assert rule["until"] == datetime.datetime(2026, 1, 10, 10, 0)
+    found = occurrences(rule, datetime.datetime(2026, 1, 5, 11, 0))
+    assert found[-1] == datetime.datetime(2026, 1, 9, 11, 0)
+    assert len(found) == 5
+
+
+def test_floating_until_is_taken_as_local_time(new_york_time):
+    assert kairo.parse_rrule("FREQ=DAILY;UNTIL=20260110T150000")["until"] == datetime.datetime(2026, 1, 10, 15, 0)
+    assert kairo.parse_rrule("FREQ=DAILY;UNTIL=20260110")["until"] == datetime.datetime(2026, 1, 10, 23, 59, 59)
+
+
+def test_dtstart_outside_byday_is_the_first_occurrence():
+    tuesday = datetime.datetime(2026, 1, 13, 9, 0)
+    assert occurrences("FREQ=WEEKLY;BYDAY=MO,WE;COUNT=3", tuesday) == [
+        tuesday, datetime.datetime(2026, 1, 14, 9, 0), datetime.datetime(2026, 1, 19, 9, 0),
+    ]
+
+
+def test_dtstart_outside_bymonthday_is_the_first_occurrence():
+    dtstart = datetime.datetime(2026, 1, 20, 8, 0)
+    assert occurrences("FREQ=MONTHLY;BYMONTHDAY=1;COUNT=2", dtstart) == [dtstart, datetime.datetime(2026, 2, 1, 8, 0)]
+
+
+def test_dtstart_matching_the_rule_is_not_repeated():
+    monday = datetime.datetime(2026, 1, 12, 9, 0)
+    assert occurrences("FREQ=WEEKLY;BYDAY=MO;COUNT=2", monday) == [monday, datetime.datetime(2026, 1, 19, 9, 0)]
+
+
+def test_dtstart_before_the_window_is_not_returned():
+    tuesday = datetime.datetime(2026, 1, 13, 9, 0)
+    found = occurrences("FREQ=WEEKLY;BYDAY=MO", tuesday, datetime.datetime(2026, 2, 1), datetime.datetime(2026, 2, 10))
+    assert found == [datetime.datetime(2026, 2, 2, 9, 0), datetime.datetime(2026, 2, 9, 9, 0)]
+
+
+def test_course_start_date_is_not_a_meeting(app_context):
+    user_id = kairo.generate_unique_id("recurrence_user")
+    kairo.add_course_to_db(user_id, "Compilers", schedule="Mon,Wed 09:00-10:30", start_date="2026-01-11") # A Sunday
+    agenda = kairo.get_agenda(user_id, datetime.datetime(2026, 1, 11), datetime.datetime(2026, 1, 15), kinds=('courses',))
+    assert [entry["start"] for entry in agenda] == ["2026-01-12T09:00:00", "2026-01-14T09:00:00"]
@@ -0,0 +1,88 @@
+import re
+
+import pytest
+
+import app as kairo  # conftest points it at a scratch database
+
+HOT_TABLES = ("tasks", "events", "courses", "conversation_history")
+
+# The four tables as the first release created them, before any migration existed
+BASELINE_SCHEMA = """
+CREATE TABLE tasks (
+    task_id TEXT PRIMARY KEY, user_id TEXT NOT NULL, title TEXT NOT NULL, description TEXT, due_datetime TEXT,
+    priority TEXT DEFAULT 'medium', status TEXT DEFAULT 'pending', tags TEXT, course_id TEXT, parent_id TEXT,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP, updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE events (
+    event_id TEXT PRIMARY KEY, user_id TEXT NOT NULL, title TEXT NOT NULL, description TEXT,
+    start_datetime TEXT NOT NULL, end_datetime TEXT, location TEXT, attendees TEXT,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP, updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE courses (
+    course_id TEXT PRIMARY KEY, user_id TEXT NOT NULL, name TEXT NOT NULL, description TEXT, instructor TEXT,
+    schedule TEXT, start_date TEXT, end_date TEXT,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP, updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE conversation_history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT NOT NULL, sender TEXT NOT NULL, message TEXT NOT NULL,
+    timestamp TEXT DEFAULT CURRENT_TIMESTAMP, parsed_action TEXT
+);
+INSERT INTO tasks (task_id, user_id, title, due_datetime) VALUES ('task_20240101120000000000', 'old_user', 'Legacy task', '2024-02-01T09:30:00');
+INSERT INTO events (event_id, user_id, title, start_datetime, end_datetime)
+    VALUES ('event_20240101120000000000', 'old_user', 'Legacy event', '2024-02-02T10:00:00', '2024-02-02T11:00:00');
+INSERT INTO courses (course_id, user_id, name) VALUES ('course_20240101120000000000', 'old_user', 'Legacy course');
+INSERT INTO conversation_history (user_id, sender, message) VALUES ('old_user', 'user', 'hello');
+"""
+
+
+@pytest.fixture
+def baseline_db(scratch_db_path):
+    pool = kairo.ConnectionPool(max_idle=1, path=scratch_db_path)
+    db = pool.acquire()
+    db.executescript(BASELINE_SCHEMA)
+    yield db
+    pool.release(db)
+    pool.close_all(final=True)
+
+
+def schema_snapshot(db):
+    return sorted(tuple(row) for row in db.execute("SELECT type, name, sql FROM sqlite_master WHERE name NOT LIKE 'sqlite_%'"))
+
+
+def test_hot_queries_never_scan_a_table(app_context):
+    results = kairo.explain_hot_queries()
+    assert results, "no statements were traced"
+    scans = [(sql, detail) for sql, plan_details, _ in results for detail in plan_details
+             if re.match(rf"SCAN ({'|'.join(HOT_TABLES)})\b", detail) and "USING" not in detail]
+    assert scans == []
+    assert [sql for sql, _, uses_index in results if not uses_index] == []
+
+
+def test_migrations_upgrade_a_baseline_database(baseline_db):
+    kairo.create_schema(baseline_db)
+
+    latest_version = max(version for version, _, _ in kairo.SCHEMA_MIGRATIONS)
+    assert kairo.get_schema_version(baseline_db) == latest_version
+    indexes = {row[0] for row in baseline_db.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert {"idx_tasks_user_due_epoch", "idx_events_user_start_epoch", "idx_history_user_id"} <= indexes
+    task = baseline_db.execute("SELECT title, due_epoch FROM tasks WHERE task_id = 'task_20240101120000000000'").fetchone()
+    assert task["title"] == "Legacy task"
+    assert task["due_epoch"] == kairo.iso_to_epoch("2024-02-01T09:30:00")
+    event = baseline_db.execute("SELECT start_epoch, end_epoch FROM events").fetchone()
+    assert event["end_epoch"] - event["start_epoch"] == 3600
+    assert baseline_db.execute("SELECT COUNT(*) FROM conversation_history").fetchone()[0] == 1
+    # One upsert per existing item from the change_log migration; later backfills add none
+    assert baseline_db.execute("SELECT COUNT(*) FROM change_log").fetchone()[0] == 3
+
+
+def test_migrations_are_idempotent(baseline_db):
+    kairo.create_schema(baseline_db)
+    schema = schema_snapshot(baseline_db)
+    applied = baseline_db.execute("SELECT version, applied_at FROM schema_version ORDER BY version").fetchall()
+
+    kairo.create_schema(baseline_db)
+    kairo.run_migrations(baseline_db)
+
+    assert schema_snapshot(baseline_db) == schema
+    assert baseline_db.execute("SELECT version, applied_at FROM schema_version ORDER BY version").fetchall() == applied
+    assert baseline_db.execute("SELECT COUNT(*) FROM tasks").fetchone()[0] == 1
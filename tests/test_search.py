@@ -0,0 +1,37 @@
+import pytest
+
+import app as kairo  # conftest points it at a scratch database
+
+TITLES = ["Homework 3", "Buy groceries", "e-mail Bob", "Read ch. 5 notes", "Café meetup", "Weekly review", "Weekly report"]
+
+
+@pytest.fixture
+def tasks(app_context):
+    user_id = kairo.generate_unique_id("search_user")
+    for title in TITLES:
+        kairo.add_task_to_db(user_id, title)
+    return user_id
+
+
+def resolved_titles(user_id, keywords):
+    return sorted(task["title"] for task in kairo.find_items_by_keywords("tasks", user_id, keywords))
+
+
+@pytest.mark.parametrize("keywords", [
+    "homework", "work", "grocer", "roceries", "e-mail", "ch. 5", "5 notes", "café", "weekly review", "weekly",
+])
+def test_keywords_resolve_what_the_substring_scan_matched(tasks, keywords):
+    substring_matches = sorted(title for title in TITLES if keywords.lower() in title.lower())
+    assert resolved_titles(tasks, keywords) == substring_matches
+
+
+def test_search_only_returns_the_users_own_items(tasks):
+    other_user = kairo.generate_unique_id("search_user")
+    kairo.add_task_to_db(other_user, "Buy groceries")
+    assert resolved_titles(other_user, "groceries") == ["Buy groceries"]
+    assert [task["user_id"] for task in kairo.search_items("tasks", tasks, "groceries")] == [tasks]
+
+
+def test_search_index_has_a_user_id_column(app_context):
+    columns = [row["name"] for row in kairo.get_db().execute("PRAGMA table_info(tasks_fts)")]
+    assert columns[0] == "user_id"